@@ -0,0 +1,75 @@
+# app/config.py
+# Tunables read from the environment (see .env.example)
+import os
+
+# Max concurrent Spotify calls issued for a single user's ingest
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+
+# Shared Spotify HTTP client (connection pool, keep-alive, timeouts)
+SPOTIFY_HTTP2 = os.getenv("SPOTIFY_HTTP2", "1") not in ("0", "false", "False")
+SPOTIFY_MAX_CONNECTIONS = int(os.getenv("SPOTIFY_MAX_CONNECTIONS", "100"))
+SPOTIFY_MAX_KEEPALIVE = int(os.getenv("SPOTIFY_MAX_KEEPALIVE", "20"))
+SPOTIFY_KEEPALIVE_EXPIRY = float(os.getenv("SPOTIFY_KEEPALIVE_EXPIRY", "30"))
+SPOTIFY_TIMEOUT = float(os.getenv("SPOTIFY_TIMEOUT", "30"))
+
+# Refresh cached Spotify access tokens in the background this long before expiry
+TOKEN_REFRESH_MARGIN = float(os.getenv("TOKEN_REFRESH_MARGIN", "300"))
+
+# Client-side Spotify rate limiting and retries
+SPOTIFY_RATE = float(os.getenv("SPOTIFY_RATE", "10"))  # sustained requests/sec
+SPOTIFY_BURST = float(os.getenv("SPOTIFY_BURST", "20"))
+SPOTIFY_MAX_RETRIES = int(os.getenv("SPOTIFY_MAX_RETRIES", "5"))
+SPOTIFY_BACKOFF_BASE = float(os.getenv("SPOTIFY_BACKOFF_BASE", "0.5"))
+SPOTIFY_BACKOFF_MAX = float(os.getenv("SPOTIFY_BACKOFF_MAX", "30"))
+
+# Background ingest queue
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+# Seconds to wait for queued/running jobs on shutdown before cancelling them
+INGEST_DRAIN_TIMEOUT = float(os.getenv("INGEST_DRAIN_TIMEOUT", "30"))
+# Users ingested concurrently by a batch run (calls are still bounded by SPOTIFY_RATE)
+BATCH_INGEST_WORKERS = int(os.getenv("BATCH_INGEST_WORKERS", "32"))
+
+# Recently-played history older than this is pruned on sync
+RECENT_RETENTION_DAYS = int(os.getenv("RECENT_RETENTION_DAYS", "90"))
+# Safety cap on `after`-cursor pages fetched per sync
+RECENT_MAX_PAGES = int(os.getenv("RECENT_MAX_PAGES", "20"))
+
+# In-memory LRU in front of the TrackAudioFeatures table (entries)
+AUDIO_FEATURES_LRU_SIZE = int(os.getenv("AUDIO_FEATURES_LRU_SIZE", "100000"))
+
+# Weight tracks by rank (rank 1 counts most) when building audio centroids
+AUDIO_RANK_WEIGHTED = os.getenv("AUDIO_RANK_WEIGHTED", "0") in ("1", "true", "True")
+
+# /matches keyset pagination: ranked entries kept per (user, filters) snapshot,
+# how long a snapshot serves follow-up pages, and how many snapshots to keep
+MATCH_SNAPSHOT_SIZE = int(os.getenv("MATCH_SNAPSHOT_SIZE", "200"))
+MATCH_SNAPSHOT_TTL = float(os.getenv("MATCH_SNAPSHOT_TTL", "60"))
+MATCH_SNAPSHOT_MAX = int(os.getenv("MATCH_SNAPSHOT_MAX", "10000"))
+
+# mode=approx: seconds between background rebuilds of the MinHash/LSH index
+# while ingests keep changing the taste index (the old one serves meanwhile)
+ANN_REBUILD_INTERVAL = float(os.getenv("ANN_REBUILD_INTERVAL", "300"))
+
+# Precomputed UserMatch rows kept per user: the best N, with headroom for the
+# /matches filters; pages that run past them are ranked live
+MATCH_TABLE_SIZE = int(os.getenv("MATCH_TABLE_SIZE", "1000"))
+
+# Cached /matches/explain responses (keyed by both users' data versions)
+EXPLAIN_CACHE_SIZE = int(os.getenv("EXPLAIN_CACHE_SIZE", "10000"))
+
+# Per-user taste snapshots (entries, seconds); data_version changes invalidate sooner
+TASTE_SNAPSHOT_CACHE_SIZE = int(os.getenv("TASTE_SNAPSHOT_CACHE_SIZE", "50000"))
+TASTE_SNAPSHOT_TTL = float(os.getenv("TASTE_SNAPSHOT_TTL", "3600"))
+
+# Multi-process /matches scoring: worker processes (0 = score in-process) and
+# the candidate count below which a request stays on one core
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", "0"))
+SCORING_PARALLEL_MIN = int(os.getenv("SCORING_PARALLEL_MIN", "50000"))
+# Seconds a shared-memory copy of the index keeps serving newer indexes with
+# the same users before a fresh copy is published
+SCORING_REPUBLISH_INTERVAL = float(os.getenv("SCORING_REPUBLISH_INTERVAL", "30"))
+
+# Offline-built, memory-mapped taste index (python -m app.services.index_file build).
+# Empty = build the index in memory from SQL. Users created after the build are
+# served from extra in-memory rows; the UserMatch table is always scored live.
+TASTE_INDEX_PATH = os.getenv("TASTE_INDEX_PATH", "")
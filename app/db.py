@@ -1,12 +1,46 @@
 # app/db.py
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 import os
 
-engine = create_engine(os.getenv("DATABASE_URL", "sqlite:///./dev.db"), echo=False)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./dev.db")
+
+engine = create_engine(DATABASE_URL, echo=False)
+
+# Async drivers for the same database, used by routes that must not block the
+# event loop while they wait on the DB
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+psycopg",
+    "postgresql+psycopg2": "postgresql+psycopg",
+}
+
+
+def async_url(url: str) -> str:
+    u = make_url(url)
+    return u.set(drivername=_ASYNC_DRIVERS.get(u.drivername, u.drivername)).render_as_string(hide_password=False)
+
+
+async_engine = create_async_engine(async_url(DATABASE_URL), echo=False)
 
 def init_db():
+    from app.migrations import run_migrations
     SQLModel.metadata.create_all(engine)
+    run_migrations(engine)
 
 def get_session():
     with Session(engine) as s:
         yield s
+
+
+def async_session() -> AsyncSession:
+    # Sync services run against it via `await session.run_sync(fn, ...)`;
+    # objects stay readable after commit since lazy loads can't happen here
+    return AsyncSession(async_engine, expire_on_commit=False)
+
+
+async def get_async_session():
+    async with async_session() as s:
+        yield s
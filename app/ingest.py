@@ -0,0 +1,59 @@
+# app/ingest.py
+# Batch re-ingest from the command line:
+#   python -m app.ingest --users 1,2,3
+#   python -m app.ingest --older-than-hours 24 --workers 64
+#   python -m app.ingest --resume 7
+import argparse
+import asyncio
+import sys
+from datetime import timedelta
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlmodel import Session  # noqa: E402
+
+from app import config  # noqa: E402
+from app.db import async_engine, engine, init_db  # noqa: E402
+from app.services import batch_ingest, spotify  # noqa: E402
+
+
+def _progress(done: int, total: int) -> None:
+    if done == total or done % 100 == 0:
+        print(f"  {done}/{total} users", file=sys.stderr)
+
+
+async def _run(args) -> dict:
+    init_db()
+    spotify.init_client()
+    try:
+        if args.resume is not None:
+            run_id = args.resume
+        else:
+            with Session(engine) as session:
+                if args.users:
+                    user_ids = [int(x) for x in args.users.split(",") if x.strip()]
+                else:
+                    user_ids = batch_ingest.select_stale_users(session, timedelta(hours=args.older_than_hours))
+                run_id = batch_ingest.create_run(session, user_ids).id
+        print(f"ingest run {run_id}", file=sys.stderr)
+        return await batch_ingest.execute_run(run_id, args.workers, on_progress=_progress)
+    finally:
+        await spotify.close_client()
+        await async_engine.dispose()
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Batch Spotify re-ingest")
+    g = p.add_mutually_exclusive_group(required=True)
+    g.add_argument("--users", help="comma separated user ids")
+    g.add_argument("--older-than-hours", type=float, help="every user whose data is older than this")
+    g.add_argument("--resume", type=int, help="resume a previous run by id")
+    p.add_argument("--workers", type=int, default=config.BATCH_INGEST_WORKERS)
+    args = p.parse_args(argv)
+    print(asyncio.run(_run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
-from app.db import init_db
+from app.db import init_db, async_engine
 from dotenv import load_dotenv
 import os
 
@@ -15,11 +15,20 @@ from app.routes import settings as settings_routes
 from app.routes import connections as connections_routes
 from app.routes import messages as messages_routes
 from app.routes import health
+from app.services import spotify, jobs, parallel_scoring
+from app import config
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
+    spotify.init_client()
+    jobs.queue.start()
     yield
+    await jobs.queue.drain(config.INGEST_DRAIN_TIMEOUT)
+    await spotify.close_client()
+    parallel_scoring.shutdown()
+    # Pooled async connections belong to this event loop
+    await async_engine.dispose()
 
 app = FastAPI(title="Spotify Match POC", lifespan=lifespan)
 
@@ -44,6 +53,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # /matches paging cursor; browsers hide non-safelisted headers otherwise
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Session middleware for OAuth state/PKCE
@@ -0,0 +1,83 @@
+# app/migrations.py
+# Lightweight, idempotent schema/data migrations run after create_all():
+# create_all() only creates missing tables, so columns and indexes added to
+# existing tables (and any data backfills) are handled here.
+from sqlalchemy import Engine, inspect, text
+from sqlmodel import Session, SQLModel
+
+
+def _add_missing_columns(engine: Engine) -> None:
+    insp = inspect(engine)
+    existing_tables = set(insp.get_table_names())
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        have = {c["name"] for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name in have:
+                continue
+            ddl = col.type.compile(dialect=engine.dialect)
+            default = ""
+            if col.default is not None and getattr(col.default, "is_scalar", False):
+                default = f" DEFAULT {col.default.arg!r}"
+            with engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{col.name}" {ddl}{default}'))
+
+
+def _dedupe_recent_tracks(engine: Engine) -> None:
+    # Required before the (user_id, track_id, played_at) unique index can exist
+    insp = inspect(engine)
+    if "recenttrack" not in insp.get_table_names():
+        return
+    if any(ix["name"] == "ux_recenttrack_user_track_played" for ix in insp.get_indexes("recenttrack")):
+        return
+    with engine.begin() as conn:
+        conn.execute(text(
+            "DELETE FROM recenttrack WHERE id NOT IN ("
+            "SELECT MIN(id) FROM recenttrack GROUP BY user_id, track_id, played_at)"
+        ))
+
+
+def _index_names(engine: Engine) -> set[str]:
+    # SQLite reflection skips expression indexes, so ask the catalog directly there
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            return set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+    insp = inspect(engine)
+    return {ix["name"] for t in insp.get_table_names() for ix in insp.get_indexes(t)}
+
+
+def _create_missing_indexes(engine: Engine) -> None:
+    # Compare by name: checkfirst does not see expression indexes on SQLite
+    existing_tables = set(inspect(engine).get_table_names())
+    have = _index_names(engine)
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        for ix in table.indexes:
+            if ix.name not in have:
+                ix.create(engine)
+
+
+def _backfill_genres(engine: Engine) -> None:
+    # Genre / ArtistGenre / UserGenre from the legacy UserArtist.genres CSV
+    from app.services.genres import backfill_user_genres
+
+    with Session(engine) as session:
+        backfill_user_genres(session)
+
+
+def _migrate_block_lists(engine: Engine) -> None:
+    # UserSettings.blocked_user_ids CSV -> UserBlock rows
+    from app.services.blocks import migrate_csv_blocks
+
+    with Session(engine) as session:
+        migrate_csv_blocks(session)
+
+
+def run_migrations(engine: Engine) -> None:
+    _add_missing_columns(engine)
+    _dedupe_recent_tracks(engine)
+    _create_missing_indexes(engine)
+    _backfill_genres(engine)
+    _migrate_block_lists(engine)
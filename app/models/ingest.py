@@ -0,0 +1,31 @@
+from datetime import datetime, UTC
+from typing import Optional
+from sqlmodel import SQLModel, Field
+
+
+class UserSyncState(SQLModel, table=True):
+    # Per-user ingest bookkeeping
+    user_id: int = Field(primary_key=True, foreign_key="user.id")
+    last_ingested_at: Optional[datetime] = Field(default=None, index=True)
+    # High-water mark for recently-played sync: unix ms of the newest stored play
+    recent_after_ms: Optional[int] = None
+    # Bumped whenever ingest changes this user's stored data; keys derived caches
+    data_version: int = 0
+
+
+class IngestRun(SQLModel, table=True):
+    # A batch re-ingest; items are persisted so an interrupted run can resume
+    id: Optional[int] = Field(default=None, primary_key=True)
+    status: str = Field(default="pending")  # pending|running|done|interrupted
+    total: int = 0
+    done: int = 0
+    failed: int = 0
+    created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    finished_at: Optional[datetime] = None
+
+
+class IngestRunItem(SQLModel, table=True):
+    run_id: int = Field(foreign_key="ingestrun.id", primary_key=True)
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    status: str = Field(default="pending", index=True)  # pending|done|failed
+    error: Optional[str] = None
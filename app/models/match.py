@@ -0,0 +1,22 @@
+from datetime import datetime, UTC
+from sqlalchemy import Index
+from sqlmodel import SQLModel, Field
+
+
+class UserMatch(SQLModel, table=True):
+    # Precomputed score of user_id against other_id, for user_id's best matches
+    __table_args__ = (Index("ix_usermatch_user_score", "user_id", "score"),)
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    other_id: int = Field(foreign_key="user.id", primary_key=True, index=True)
+    score: float
+    shared_artists_count: int
+    genre_overlap: float
+    audio_affinity: float
+
+
+class UserMatchState(SQLModel, table=True):
+    # Present once a user's rows in UserMatch have been computed
+    user_id: int = Field(primary_key=True, foreign_key="user.id")
+    refreshed_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    # Every match scoring above this is stored; -1 when all of them are
+    score_floor: float = -1.0
@@ -1,7 +1,14 @@
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 
 
 class UserArtist(SQLModel, table=True):
+    # (user_id, term, rank): ranked pack reads; (term, artist_id): "who else
+    # follows these artists" for the shared-artist filter
+    __table_args__ = (
+        Index("ix_userartist_user_term_rank", "user_id", "term", "rank"),
+        Index("ix_userartist_term_artist", "term", "artist_id", "user_id"),
+    )
     user_id: int = Field(foreign_key="user.id", primary_key=True)
     term: str = Field(primary_key=True)  # short|medium|long
     artist_id: str = Field(primary_key=True)
@@ -31,6 +38,40 @@ class UserAudioProfile(SQLModel, table=True):
     loudness: float
 
 
+class UserAudioTermProfile(SQLModel, table=True):
+    # Running (optionally rank-weighted) feature sums over a term's top tracks,
+    # plus the centroid already passed through normalize_audio for scoring
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    term: str = Field(primary_key=True)  # short|medium|long
+    track_count: int = 0
+    weight_sum: float = 0.0
+    sum_tempo: float = 0.0
+    sum_energy: float = 0.0
+    sum_valence: float = 0.0
+    sum_danceability: float = 0.0
+    sum_acousticness: float = 0.0
+    sum_loudness: float = 0.0
+    norm_tempo: float = 0.0
+    norm_energy: float = 0.0
+    norm_valence: float = 0.0
+    norm_danceability: float = 0.0
+    norm_acousticness: float = 0.0
+    norm_loudness: float = 0.0
+    # AUDIO_RANK_WEIGHTED when the sums were built; a mismatch forces a rebuild
+    rank_weighted: bool = False
+
+
+class TrackAudioFeatures(SQLModel, table=True):
+    # Shared across users: audio features are a property of the track
+    track_id: str = Field(primary_key=True)
+    tempo: float
+    energy: float
+    valence: float
+    danceability: float
+    acousticness: float
+    loudness: float
+
+
 class UserGenreSummary(SQLModel, table=True):
     user_id: int = Field(foreign_key="user.id", primary_key=True)
     genre: str = Field(primary_key=True, index=True)
@@ -38,7 +79,30 @@ class UserGenreSummary(SQLModel, table=True):
     term: str = Field(primary_key=True)  # short|medium|long
 
 
+class Genre(SQLModel, table=True):
+    # Dictionary of genre names; everything else refers to genres by this int id
+    id: int | None = Field(default=None, primary_key=True)
+    name: str = Field(unique=True)
+
+
+class ArtistGenre(SQLModel, table=True):
+    # Genres are a property of the artist, shared by every user who follows it
+    artist_id: str = Field(primary_key=True)
+    genre_id: int = Field(foreign_key="genre.id", primary_key=True)
+
+
+class UserGenre(SQLModel, table=True):
+    # Integer-keyed twin of UserGenreSummary used by matching and filters
+    __table_args__ = (Index("ix_usergenre_genre_term_user", "genre_id", "term", "user_id"),)
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    term: str = Field(primary_key=True)  # short|medium|long
+    genre_id: int = Field(foreign_key="genre.id", primary_key=True)
+    count: int
+
+
 class RecentTrack(SQLModel, table=True):
+    # One row per play; re-syncs append only the delta
+    __table_args__ = (Index("ux_recenttrack_user_track_played", "user_id", "track_id", "played_at", unique=True),)
     id: int | None = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     track_id: str
@@ -1,5 +1,6 @@
 # app/models/user.py
 from typing import Optional
+from sqlalchemy import Index, func
 from sqlmodel import SQLModel, Field
 from datetime import datetime, UTC
 
@@ -11,6 +12,10 @@ class User(SQLModel, table=True):
     country: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
 
+# Country filters compare upper(country); index that expression
+Index("ix_user_country_upper", func.upper(User.country))
+
+
 class SpotifyToken(SQLModel, table=True):
     user_id: int = Field(primary_key=True, foreign_key="user.id")
     access_token: str
@@ -23,10 +28,19 @@ class UserSettings(SQLModel, table=True):
     is_public: bool = True
     allow_messages: bool = True
     show_country: bool = True
-    # CSV of blocked user IDs for simplicity in POC
+    # Legacy CSV of blocked user IDs; migrated into UserBlock and left empty
     blocked_user_ids: str | None = None
 
 
+class UserBlock(SQLModel, table=True):
+    # blocker_id hid blocked_id. PK serves "who did I block"; the second index
+    # serves "who blocked me"
+    __table_args__ = (Index("ix_userblock_blocked_blocker", "blocked_id", "blocker_id"),)
+    blocker_id: int = Field(foreign_key="user.id", primary_key=True)
+    blocked_id: int = Field(foreign_key="user.id", primary_key=True)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+
+
 class ConnectionRequest(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     from_user_id: int = Field(foreign_key="user.id")
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlmodel import Session, select
 from app.db import get_session
-from app.models.user import User, ConnectionRequest, UserSettings
+from app.models.user import User, ConnectionRequest
+from app.services.blocks import is_blocked
 
 router = APIRouter()
 
@@ -18,11 +19,8 @@ def send_request(
     if not session.get(User, from_user_id) or not session.get(User, to_user_id):
         raise HTTPException(404, "User not found")
     # respect block list
-    s_other = session.get(UserSettings, to_user_id)
-    if s_other and s_other.blocked_user_ids:
-        bl = {int(x) for x in s_other.blocked_user_ids.split(',') if x.strip().isdigit()}
-        if from_user_id in bl:
-            raise HTTPException(403, "You are blocked by this user")
+    if is_blocked(session, to_user_id, from_user_id):
+        raise HTTPException(403, "You are blocked by this user")
     # upsert pending if exists
     existing = session.exec(
         select(ConnectionRequest).where(
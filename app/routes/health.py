@@ -1,4 +1,5 @@
 from fastapi import APIRouter
+from app.services import spotify, jobs, audio_features, taste_snapshot, explain
 
 router = APIRouter()
 
@@ -16,6 +17,7 @@ def root():
             "/me?user_id=...",
             "/matches?user_id=...",
             "/healthz",
+            "/metrics",
         ],
     }
 
@@ -24,3 +26,14 @@ def root():
 def healthz():
     return {"status": "ok"}
 
+
+
+@router.get("/metrics")
+def metrics():
+    return {
+        "spotify": spotify.limiter.snapshot(),
+        "ingest_queue": {"workers": jobs.queue.workers, "pending": jobs.queue.pending()},
+        "audio_features_cache": audio_features.snapshot(),
+        "taste_snapshots": taste_snapshot.snapshot(),
+        "explain_cache": explain.cache.stats(),
+    }
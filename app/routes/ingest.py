@@ -1,94 +1,86 @@
 # app/routes/ingest.py
+from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlmodel import Session, select, delete
-from app.db import get_session
-from app.services.spotify import ensure_token, get_top, get_audio_features, get_recently_played
+from pydantic import BaseModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.config import BATCH_INGEST_WORKERS
+from app.db import async_session, get_async_session
 from app.models.user import User
-from app.models.music import UserArtist, UserTrack, UserAudioProfile, UserGenreSummary, RecentTrack
-from statistics import mean
+from app.services import ingest as ingest_service
+from app.services import batch_ingest
+from app.services.jobs import queue
 
 router = APIRouter()
 
+
+def _job(fn, user_id: int):
+    # Workers outlive the request, so each job opens its own session
+    async def run():
+        async with async_session() as session:
+            return await fn(session, user_id)
+    return run
+
+
+def _job_view(job) -> dict:
+    return {"ok": True, "job_id": job.id, "status": job.status, "user_id": job.user_id}
+
+
 @router.get("/spotify")
-async def ingest_spotify(user_id: int = Query(...), session: Session = Depends(get_session)):
-    user = session.get(User, user_id)
+async def ingest_spotify(user_id: int = Query(...), session: AsyncSession = Depends(get_async_session)):
+    user = await session.get(User, user_id)
     if not user: raise HTTPException(404, "User not found")
-    token = await ensure_token(user_id, session)
-
-    for term in ["short", "medium", "long"]:
-        artists = await get_top(token, "artists", term)
-        tracks  = await get_top(token, "tracks", term)
-        # wipe & insert (POC simplicity) via ORM deletes
-        session.exec(delete(UserArtist).where(UserArtist.user_id == user_id, UserArtist.term == term))
-        session.exec(delete(UserTrack).where(UserTrack.user_id == user_id, UserTrack.term == term))
-        session.exec(delete(UserGenreSummary).where(UserGenreSummary.user_id == user_id, UserGenreSummary.term == term))
-        for rank, a in enumerate(artists, start=1):
-            session.add(UserArtist(
-                user_id=user_id, term=term,
-                artist_id=a["id"], artist_name=a["name"],
-                genres=",".join(a.get("genres", [])),
-                popularity=a.get("popularity", 0), rank=rank
-            ))
-        for rank, t in enumerate(tracks, start=1):
-            session.add(UserTrack(
-                user_id=user_id, term=term,
-                track_id=t["id"], track_name=t["name"],
-                artist_ids=",".join([ar["id"] for ar in t["artists"]]),
-                popularity=t.get("popularity", 0), rank=rank
-            ))
-        session.commit()
-        # Build genre summary per term
-        # recompute from inserted artists for this term
-        counts: dict[str, int] = {}
-        for a in session.exec(select(UserArtist).where(UserArtist.user_id == user_id, UserArtist.term == term)):
-            if a.genres:
-                for g in [g for g in a.genres.split(",") if g]:
-                    counts[g] = counts.get(g, 0) + 1
-        for genre, cnt in counts.items():
-            session.add(UserGenreSummary(user_id=user_id, term=term, genre=genre, count=cnt))
-        session.commit()
-
-    # audio centroid from top tracks (medium term as baseline)
-    rows = session.exec(
-        select(UserTrack.track_id).where(UserTrack.user_id == user_id, UserTrack.term == "medium").order_by(UserTrack.rank).limit(50)
-    ).all()
-    ids = [tid for (tid,) in rows]
-    feats = await get_audio_features(token, ids)
-    if feats:
-        def col(k): return [f[k] for f in feats if f]
-        profile = UserAudioProfile(
-            user_id=user_id,
-            tempo=mean(col("tempo")),
-            energy=mean(col("energy")),
-            valence=mean(col("valence")),
-            danceability=mean(col("danceability")),
-            acousticness=mean(col("acousticness")),
-            loudness=mean(col("loudness"))
-        )
-        session.merge(profile); session.commit()
-    return {"ok": True}
+    return _job_view(queue.enqueue("spotify", user_id, _job(ingest_service.ingest_top, user_id)))
 
 
 @router.get("/spotify/recent")
-async def ingest_recent(user_id: int = Query(...), session: Session = Depends(get_session)):
-    user = session.get(User, user_id)
+async def ingest_recent(user_id: int = Query(...), session: AsyncSession = Depends(get_async_session)):
+    user = await session.get(User, user_id)
     if not user:
         raise HTTPException(404, "User not found")
-    token = await ensure_token(user_id, session)
-    items = await get_recently_played(token, limit=50)
-    # replace recent rows and insert latest
-    session.exec(delete(RecentTrack).where(RecentTrack.user_id == user_id))
-    for it in items:
-        t = it.get("track") or {}
-        if not t:
-            continue
-        artists = ",".join([a.get("id") for a in (t.get("artists") or []) if a.get("id")])
-        session.add(RecentTrack(
-            user_id=user_id,
-            track_id=t.get("id"),
-            track_name=t.get("name"),
-            artist_ids=artists,
-            played_at=(it.get("played_at") or ""),
-        ))
-    session.commit()
-    return {"ok": True, "count": len(items)}
+    return _job_view(queue.enqueue("recent", user_id, _job(ingest_service.ingest_recent, user_id)))
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = queue.get(job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+    return job.as_dict()
+
+
+class BatchIngestRequest(BaseModel):
+    user_ids: list[int] | None = None
+    # Alternatively: every user whose data is older than this many hours
+    older_than_hours: float | None = None
+    workers: int | None = None
+
+
+def _batch_job(run_id: int, workers: int | None):
+    async def run():
+        return await batch_ingest.execute_run(run_id, workers or BATCH_INGEST_WORKERS)
+    return run
+
+
+@router.post("/batch")
+async def start_batch(payload: BatchIngestRequest, session: AsyncSession = Depends(get_async_session)):
+    if payload.user_ids is not None:
+        user_ids = payload.user_ids
+    elif payload.older_than_hours is not None:
+        user_ids = await session.run_sync(batch_ingest.select_stale_users, timedelta(hours=payload.older_than_hours))
+    else:
+        raise HTTPException(400, "Provide user_ids or older_than_hours")
+    run = await session.run_sync(batch_ingest.create_run, user_ids)
+    job = queue.enqueue("batch", run.id, _batch_job(run.id, payload.workers))
+    return {**await session.run_sync(batch_ingest.run_progress, run.id), "job_id": job.id}
+
+
+@router.get("/batch/{run_id}")
+async def batch_status(run_id: int, session: AsyncSession = Depends(get_async_session)):
+    return await session.run_sync(batch_ingest.run_progress, run_id)
+
+
+@router.post("/batch/{run_id}/resume")
+async def resume_batch(run_id: int, workers: int | None = None, session: AsyncSession = Depends(get_async_session)):
+    progress = await session.run_sync(batch_ingest.run_progress, run_id)
+    job = queue.enqueue("batch", run_id, _batch_job(run_id, workers))
+    return {**progress, "job_id": job.id}
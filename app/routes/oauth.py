@@ -3,10 +3,11 @@ from fastapi import APIRouter, Depends, Request, Response, HTTPException
 from authlib.integrations.starlette_client import OAuth
 from starlette.responses import RedirectResponse
 import os, time
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, UTC
 from sqlmodel import Session, select
 from app.db import get_session
 from app.models.user import User, SpotifyToken
+from app.services.spotify import cache_token
 import logging
 
 logger = logging.getLogger(__name__)
@@ -69,7 +70,7 @@ async def auth_callback(request: Request, session: Session = Depends(get_session
         session.commit()
         session.refresh(user)
     # store tokens
-    expires_at = datetime.utcnow() + timedelta(seconds=token.get("expires_in", 3600) - 60)
+    expires_at = datetime.now(UTC) + timedelta(seconds=token.get("expires_in", 3600) - 60)
     # Some providers don't resend refresh_token on subsequent logins
     refresh_token = token.get("refresh_token")
     if not refresh_token:
@@ -85,6 +86,7 @@ async def auth_callback(request: Request, session: Session = Depends(get_session
         expires_at=expires_at
     ))
     session.commit()
+    cache_token(user.id, token["access_token"], expires_at)
     # Kick off initial ingest after auth
     return RedirectResponse(url=f"/ingest/spotify?user_id={user.id}")
 
@@ -3,6 +3,8 @@ from pydantic import BaseModel
 from sqlmodel import Session
 from app.db import get_session
 from app.models.user import User, UserSettings
+from app.services import blocks
+from app.services.match_pages import snapshots
 
 router = APIRouter()
 
@@ -20,6 +22,12 @@ def _get_or_create_settings(user_id: int, session: Session) -> UserSettings:
     return s
 
 
+def _blocked_csv(session: Session, user_id: int) -> str | None:
+    # Same shape the CSV column used to expose
+    ids = blocks.blocked_by(session, user_id)
+    return ",".join(str(i) for i in ids) if ids else None
+
+
 class SettingsUpdate(BaseModel):
     is_public: bool | None = None
     allow_messages: bool | None = None
@@ -34,7 +42,7 @@ def get_settings(user_id: int = Query(...), session: Session = Depends(get_sessi
         "is_public": s.is_public,
         "allow_messages": s.allow_messages,
         "show_country": s.show_country,
-        "blocked_user_ids": s.blocked_user_ids
+        "blocked_user_ids": _blocked_csv(session, s.user_id)
     }
 
 
@@ -45,6 +53,7 @@ def update_settings(
     session: Session = Depends(get_session),
 ):
     s = _get_or_create_settings(user_id, session)
+    visibility_changed = payload.is_public is not None and payload.is_public != s.is_public
     if payload.is_public is not None:
         s.is_public = payload.is_public
     if payload.allow_messages is not None:
@@ -54,59 +63,36 @@ def update_settings(
     session.add(s)
     session.commit()
     session.refresh(s)
+    if visibility_changed:
+        # This user may sit in anyone's ranked /matches snapshot
+        snapshots.clear()
     return {
         "user_id": s.user_id,
         "is_public": s.is_public,
         "allow_messages": s.allow_messages,
         "show_country": s.show_country,
-        "blocked_user_ids": s.blocked_user_ids
+        "blocked_user_ids": _blocked_csv(session, s.user_id)
     }
 
 
-def _parse_blocked(csv_ids: str | None) -> set[int]:
-    if not csv_ids:
-        return set()
-    out: set[int] = set()
-    for p in csv_ids.split(","):
-        p = p.strip()
-        if not p:
-            continue
-        try:
-            out.add(int(p))
-        except ValueError:
-            continue
-    return out
-
-
 @router.get("/users/blocked")
 def list_blocked(user_id: int = Query(...), session: Session = Depends(get_session)):
-    s = _get_or_create_settings(user_id, session)
-    return sorted(list(_parse_blocked(s.blocked_user_ids)))
+    _get_or_create_settings(user_id, session)
+    return blocks.blocked_by(session, user_id)
 
 
 @router.post("/users/{target_id}/block")
 def block_user(target_id: int, user_id: int = Query(...), session: Session = Depends(get_session)):
     if not session.get(User, user_id) or not session.get(User, target_id):
         raise HTTPException(404, "User not found")
-    s = _get_or_create_settings(user_id, session)
-    blocked = _parse_blocked(s.blocked_user_ids)
-    blocked.add(target_id)
-    s.blocked_user_ids = ",".join(str(i) for i in sorted(blocked)) if blocked else None
-    session.add(s)
-    session.commit()
-    return {"ok": True, "blocked": sorted(list(blocked))}
+    blocks.block(session, user_id, target_id)
+    return {"ok": True, "blocked": blocks.blocked_by(session, user_id)}
 
 
 @router.delete("/users/{target_id}/block")
 def unblock_user(target_id: int, user_id: int = Query(...), session: Session = Depends(get_session)):
     if not session.get(User, user_id) or not session.get(User, target_id):
         raise HTTPException(404, "User not found")
-    s = _get_or_create_settings(user_id, session)
-    blocked = _parse_blocked(s.blocked_user_ids)
-    if target_id in blocked:
-        blocked.remove(target_id)
-    s.blocked_user_ids = ",".join(str(i) for i in sorted(blocked)) if blocked else None
-    session.add(s)
-    session.commit()
-    return {"ok": True, "blocked": sorted(list(blocked))}
+    blocks.unblock(session, user_id, target_id)
+    return {"ok": True, "blocked": blocks.blocked_by(session, user_id)}
 
@@ -0,0 +1,251 @@
+# app/services/ann.py
+# Approximate candidate generation for /matches?mode=approx: MinHash/LSH buckets
+# over each user's artist and genre sets plus a coarse grid over normalized audio
+# vectors. Candidates are then rescored exactly via the taste index.
+#
+# Offline recall report (tune NUM_PERM / BANDS):
+#   python -m app.services.ann --k 20 --sample 200 --perms 32,64,128
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from app import config
+from app.services.scoring import ARTIST_WEIGHT, GENRE_WEIGHT, AUDIO_WEIGHT
+from app.services.taste_index import CSRSets, TasteIndex
+
+NUM_PERM = 64
+BANDS = 32
+GRID_CELLS = 4
+AUDIO_NEIGHBORS = 200
+N_CANDIDATES = 300
+# Skip degenerate buckets (e.g. thousands of users sharing one mainstream artist)
+MAX_BUCKET = 5000
+
+_PRIME = (1 << 31) - 1
+# Band slices are hashed to 64-bit bucket keys, so a signature computed later
+# (from a newer taste index) can still be looked up
+_BAND_MULT = np.uint64(1000003)
+
+
+def _permutations(num_perm: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _PRIME, size=num_perm, dtype=np.int64)
+    b = rng.integers(0, _PRIME, size=num_perm, dtype=np.int64)
+    return a, b
+
+
+def minhash_signatures(sets: CSRSets, num_perm: int, seed: int = 1) -> np.ndarray:
+    # (N, num_perm) signature matrix; empty rows keep the _PRIME sentinel
+    a, b = _permutations(num_perm, seed)
+    sig = np.full((len(sets.sizes), num_perm), _PRIME, dtype=np.int64)
+    nonempty = np.flatnonzero(sets.sizes > 0)
+    if not len(nonempty):
+        return sig
+    x = sets.indices.astype(np.int64)
+    starts = sets.indptr[nonempty]
+    for j in range(num_perm):
+        h = (a[j] * x + b[j]) % _PRIME
+        sig[nonempty, j] = np.minimum.reduceat(h, starts)
+    return sig
+
+
+class _Buckets:
+    # Rows grouped by (arbitrary int) key: sorted keys plus the matching rows
+    def __init__(self, keys: np.ndarray):
+        self.order = np.argsort(keys, kind="stable")
+        self.sorted = keys[self.order]
+
+    def members(self, key) -> np.ndarray:
+        lo = np.searchsorted(self.sorted, key, side="left")
+        hi = np.searchsorted(self.sorted, key, side="right")
+        return self.order[lo:hi]
+
+
+class LSHTable:
+    def __init__(self, sets: CSRSets, num_perm: int, bands: int, seed: int):
+        self.a, self.b = _permutations(num_perm, seed)
+        self.sig = minhash_signatures(sets, num_perm, seed)
+        self.empty = self.sig[:, 0] == _PRIME
+        bands = max(1, min(bands, num_perm))
+        self.r = num_perm // bands
+        keys = self._band_keys(self.sig, bands)
+        self.bands = [_Buckets(keys[:, band]) for band in range(bands)]
+
+    def _band_keys(self, sig: np.ndarray, bands: int) -> np.ndarray:
+        # (N, bands) hash of each band's slice of the signature
+        keys = np.zeros((len(sig), bands), dtype=np.uint64)
+        for c in range(self.r):
+            keys = keys * _BAND_MULT + sig[:, c:bands * self.r:self.r].astype(np.uint64)
+        return keys
+
+    def signature(self, ids: np.ndarray) -> np.ndarray:
+        # One row's signature, as minhash_signatures would compute it
+        if not len(ids):
+            return np.full(len(self.a), _PRIME, dtype=np.int64)
+        return ((self.a[:, None] * ids.astype(np.int64)[None, :] + self.b[:, None]) % _PRIME).min(axis=1)
+
+    def candidates(self, sig: np.ndarray) -> np.ndarray:
+        if sig[0] == _PRIME:
+            return np.empty(0, dtype=np.int64)
+        out = []
+        for b, key in zip(self.bands, self._band_keys(sig[None, :], len(self.bands))[0].tolist()):
+            m = b.members(np.uint64(key))
+            if len(m) <= MAX_BUCKET:
+                out.append(m)
+        return np.unique(np.concatenate(out)) if out else np.empty(0, dtype=np.int64)
+
+    def estimate(self, sig: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        # MinHash Jaccard estimate: share of equal signature slots
+        est = (self.sig[rows] == sig).mean(axis=1)
+        est[self.empty[rows] | (sig[0] == _PRIME)] = 0.0
+        return est
+
+
+class AudioGrid:
+    def __init__(self, audio: np.ndarray, cells: int = GRID_CELLS):
+        self.audio = audio
+        self.cells = cells
+        self.weights = cells ** np.arange(audio.shape[1], dtype=np.int64)
+        self.buckets = _Buckets(self._coords(audio) @ self.weights)
+
+    def _coords(self, audio: np.ndarray) -> np.ndarray:
+        return np.minimum((audio * self.cells).astype(np.int64), self.cells - 1)
+
+    def neighbors(self, vec: np.ndarray, n: int) -> np.ndarray:
+        # Own cell plus the cells one step away along each axis, nearest first
+        c = self._coords(vec)
+        keys = [int(c @ self.weights)]
+        for d in range(len(c)):
+            for step in (-1, 1):
+                if 0 <= c[d] + step < self.cells:
+                    keys.append(keys[0] + step * int(self.weights[d]))
+        rows = np.concatenate([self.buckets.members(k) for k in keys])
+        dist = np.linalg.norm(self.audio[rows] - vec, axis=1)
+        return rows[np.argsort(dist, kind="stable")[:n]]
+
+
+class AnnIndex:
+    def __init__(self, index: TasteIndex, num_perm: int = NUM_PERM, bands: int = BANDS):
+        self.index = index
+        self.built_at = time.monotonic()
+        self.artists = LSHTable(index.artists, num_perm, bands, seed=1)
+        self.genres = LSHTable(index.genres, num_perm, bands, seed=2)
+        self.grid = AudioGrid(index.audio)
+
+    def candidates(self, index: TasteIndex, me_row: int, n: int = N_CANDIDATES) -> np.ndarray:
+        # A few hundred rows of `index` ranked by estimated score; exact scoring
+        # happens later. `index` may be newer than the one this was built from:
+        # the query's own sets and audio come from it, and users added since
+        # the build only become candidates after the next one.
+        a_sig = self.artists.signature(index.artists.row(me_row))
+        g_sig = self.genres.signature(index.genres.row(me_row))
+        vec = index.audio[me_row]
+        pool = np.unique(np.concatenate([
+            self.artists.candidates(a_sig),
+            self.genres.candidates(g_sig),
+            self.grid.neighbors(vec, AUDIO_NEIGHBORS),
+        ]))
+        rows = index.rows_for(self.index.user_ids[pool]) if index is not self.index else pool
+        keep = (rows >= 0) & (rows != me_row)
+        pool, rows = pool[keep], rows[keep]
+        if len(rows) <= n:
+            return np.sort(rows)
+        diff = index.audio[rows].astype(np.float64) - vec
+        s_f = np.clip(1.0 - np.linalg.norm(diff, axis=1) / np.sqrt(diff.shape[1]), 0.0, 1.0)
+        est = (
+            ARTIST_WEIGHT * self.artists.estimate(a_sig, pool)
+            + GENRE_WEIGHT * self.genres.estimate(g_sig, pool)
+            + AUDIO_WEIGHT * s_f
+        )
+        return np.sort(rows[np.argsort(-est, kind="stable")[:n]])
+
+
+_lock = threading.Lock()
+_ann: AnnIndex | None = None
+_rebuilding = False
+
+
+def get_ann_index(index: TasteIndex) -> AnnIndex:
+    # Ingests replace the taste index object all the time, and a build costs
+    # seconds at scale: a newer index is picked up by a background rebuild (at
+    # most every ANN_REBUILD_INTERVAL seconds) while the current generation
+    # keeps serving. Only the first build, or a new id space (another mapped
+    # file generation), is waited for.
+    global _ann, _rebuilding
+    with _lock:
+        ann = _ann
+        if ann is None or ann.index.artist_vocab is not index.artist_vocab:
+            ann = _ann = AnnIndex(index)
+        elif (
+            ann.index is not index and not _rebuilding
+            and time.monotonic() - ann.built_at >= config.ANN_REBUILD_INTERVAL
+        ):
+            _rebuilding = True
+            threading.Thread(target=_rebuild, args=(index,), daemon=True).start()
+    return ann
+
+
+def _rebuild(index: TasteIndex) -> None:
+    global _ann, _rebuilding
+    try:
+        ann = AnnIndex(index)
+        with _lock:
+            _ann = ann
+    finally:
+        with _lock:
+            _rebuilding = False
+
+
+def invalidate_ann_index() -> None:
+    global _ann
+    _ann = None
+
+
+def recall_at_k(index: TasteIndex, ann: AnnIndex, k: int, sample: np.ndarray, n: int = N_CANDIDATES) -> float:
+    # Mean |approx top-k & exact top-k| / k over the sampled query rows
+    hits = total = 0
+    for me_row in sample.tolist():
+        exact = index.score_rows(me_row).score
+        exact[me_row] = -np.inf
+        want = set(np.argsort(-exact, kind="stable")[:k].tolist())
+        cand = ann.candidates(index, me_row, n)
+        approx = index.score_rows(me_row, cand).score
+        got = set(cand[np.argsort(-approx, kind="stable")[:k]].tolist())
+        hits += len(want & got)
+        total += min(k, len(index) - 1)
+    return hits / total if total else 1.0
+
+
+def main(argv: list[str] | None = None) -> None:
+    from sqlmodel import Session
+    from app.db import engine
+    from app.services.taste_index import build_taste_index
+
+    p = argparse.ArgumentParser(description="Recall@k of approximate vs exact matching")
+    p.add_argument("--k", type=int, default=20)
+    p.add_argument("--sample", type=int, default=200)
+    p.add_argument("--perms", default=f"{NUM_PERM}", help="comma separated signature counts")
+    p.add_argument("--bands", type=int, default=BANDS)
+    p.add_argument("--candidates", type=int, default=N_CANDIDATES)
+    args = p.parse_args(argv)
+
+    with Session(engine) as session:
+        index = build_taste_index(session)
+    if len(index) < 2:
+        print("not enough users")
+        return
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(index), size=min(args.sample, len(index)), replace=False)
+    print(f"users={len(index)} k={args.k} sample={len(sample)} candidates={args.candidates}")
+    for num_perm in (int(x) for x in args.perms.split(",")):
+        t0 = time.perf_counter()
+        ann = AnnIndex(index, num_perm=num_perm, bands=args.bands)
+        build = time.perf_counter() - t0
+        r = recall_at_k(index, ann, args.k, sample, args.candidates)
+        print(f"perms={num_perm:4d} bands={args.bands:3d} build={build:.2f}s recall@{args.k}={r:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# app/services/audio_features.py
+# Track audio-features cache shared by all users: an in-process LRU in front of
+# the TrackAudioFeatures table, so Spotify is only asked for ids never seen.
+from sqlmodel import select
+
+from app.config import AUDIO_FEATURES_LRU_SIZE
+from app.db import async_session
+from app.models.music import TrackAudioFeatures
+from app.services.spotify import get_audio_features
+from app.services.taste import AUDIO_DIMS
+from app.services.upsert import bulk_upsert
+from app.services.lru import LRU
+
+_IN_CHUNK = 500
+
+
+lru = LRU(AUDIO_FEATURES_LRU_SIZE)
+stats = {"api_ids": 0, "db_hits": 0}
+
+
+async def cached_audio_features(token: str, track_ids: list[str]) -> dict[str, dict]:
+    # track_id -> {tempo, energy, ...}; ids Spotify has no features for are absent
+    out: dict[str, dict] = {}
+    missing = []
+    for tid in dict.fromkeys(track_ids):
+        f = lru.get(tid)
+        if f is None:
+            missing.append(tid)
+        else:
+            out[tid] = f
+
+    if missing:
+        # Own sessions: cache rows are worth keeping even if the caller's ingest
+        # fails, and no connection is held while Spotify is being asked
+        async with async_session() as session:
+            for i in range(0, len(missing), _IN_CHUNK):
+                q = select(TrackAudioFeatures).where(TrackAudioFeatures.track_id.in_(missing[i:i + _IN_CHUNK]))
+                for row in await session.exec(q):
+                    f = {d: getattr(row, d) for d in AUDIO_DIMS}
+                    out[row.track_id] = f
+                    lru.put(row.track_id, f)
+                    stats["db_hits"] += 1
+        to_fetch = [tid for tid in missing if tid not in out]
+        if to_fetch:
+            stats["api_ids"] += len(to_fetch)
+            new_rows = []
+            for feat in await get_audio_features(token, to_fetch):
+                if not feat or not feat.get("id"):
+                    continue
+                f = {d: feat[d] for d in AUDIO_DIMS}
+                out[feat["id"]] = f
+                lru.put(feat["id"], f)
+                new_rows.append({"track_id": feat["id"], **f})
+            async with async_session() as session:
+                await session.run_sync(bulk_upsert, TrackAudioFeatures, new_rows, ["track_id"])
+                await session.commit()
+    return out
+
+
+def snapshot() -> dict:
+    return {"lru_hits": lru.hits, "lru_misses": lru.misses, "lru_evictions": lru.evictions, **stats}
@@ -0,0 +1,95 @@
+# app/services/audio_profile.py
+# Per-term audio centroids kept as running sums, so an ingest only pays for the
+# tracks that entered, left or moved in the top list.
+import numpy as np
+
+from app import config
+from app.models.music import UserAudioTermProfile
+from app.services.scoring import normalize_audio
+from app.services.taste import AUDIO_DIMS
+
+# Top lists hold at most this many tracks; used by rank weighting
+MAX_RANK = 50
+
+
+def rank_weight(rank: int, weighted: bool) -> float:
+    if not weighted:
+        return 1.0
+    return max(MAX_RANK + 1 - rank, 1) / MAX_RANK
+
+
+def centroid_sums(features: list[dict], weights: list[float]) -> tuple[np.ndarray, float]:
+    # Vectorized weighted sum over an (n, 6) feature matrix
+    if not features:
+        return np.zeros(len(AUDIO_DIMS)), 0.0
+    m = np.array([[f[d] for d in AUDIO_DIMS] for f in features], dtype=np.float64)
+    w = np.asarray(weights, dtype=np.float64)
+    return w @ m, float(w.sum())
+
+
+def _sums(prof: UserAudioTermProfile) -> np.ndarray:
+    return np.array([getattr(prof, f"sum_{d}") for d in AUDIO_DIMS], dtype=np.float64)
+
+
+def raw_centroid(prof: UserAudioTermProfile) -> list[float] | None:
+    if prof.weight_sum <= 0:
+        return None
+    return (_sums(prof) / prof.weight_sum).tolist()
+
+
+def update_term_profile(
+    prof: UserAudioTermProfile | None,
+    user_id: int,
+    term: str,
+    old: dict[str, int],
+    new: dict[str, int],
+    feats: dict[str, dict],
+) -> UserAudioTermProfile:
+    # old/new map track_id -> rank before/after this ingest. Only tracks with
+    # known features contribute, on both the add and the remove side.
+    weighted = config.AUDIO_RANK_WEIGHTED
+
+    def w(rank: int) -> float:
+        return rank_weight(rank, weighted)
+
+    delta_add, w_add, delta_sub, w_sub = [], [], [], []
+    for tid, rank in new.items():
+        if tid not in feats:
+            continue
+        if tid not in old:
+            delta_add.append(feats[tid]); w_add.append(w(rank))
+        elif w(old[tid]) != w(rank):
+            delta_add.append(feats[tid]); w_add.append(w(rank))
+            delta_sub.append(feats[tid]); w_sub.append(w(old[tid]))
+    for tid, rank in old.items():
+        if tid not in new and tid in feats:
+            delta_sub.append(feats[tid]); w_sub.append(w(rank))
+
+    if prof is None or prof.rank_weighted != weighted or len(delta_add) + len(delta_sub) >= len(new):
+        # Cheaper (and drift-free) to rebuild from scratch; sums built under the
+        # other weighting mode cannot be patched by deltas at all
+        have = [tid for tid in new if tid in feats]
+        sums, wsum = centroid_sums([feats[t] for t in have], [w(new[t]) for t in have])
+        count = len(have)
+    else:
+        add, wa = centroid_sums(delta_add, w_add)
+        sub, ws = centroid_sums(delta_sub, w_sub)
+        sums = _sums(prof) + add - sub
+        wsum = prof.weight_sum + wa - ws
+        count = prof.track_count + sum(1 for t in new if t in feats and t not in old) - sum(1 for t in old if t in feats and t not in new)
+
+    prof = prof or UserAudioTermProfile(user_id=user_id, term=term)
+    prof.rank_weighted = weighted
+    prof.track_count = count
+    prof.weight_sum = wsum if count else 0.0
+    for d, v in zip(AUDIO_DIMS, sums.tolist() if count else [0.0] * len(AUDIO_DIMS)):
+        setattr(prof, f"sum_{d}", v)
+    centroid = raw_centroid(prof)
+    norm = normalize_audio(centroid) if centroid else [0.0] * len(AUDIO_DIMS)
+    for d, v in zip(AUDIO_DIMS, norm):
+        setattr(prof, f"norm_{d}", v)
+    return prof
+
+
+def normalized_vector(prof: UserAudioTermProfile) -> list[float]:
+    return [getattr(prof, f"norm_{d}") for d in AUDIO_DIMS]
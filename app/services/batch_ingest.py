@@ -0,0 +1,145 @@
+# app/services/batch_ingest.py
+# Batch re-ingest across many users: a bounded pool of async workers on top of
+# ingest_top, with per-user progress persisted in IngestRunItem so runs resume.
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, UTC
+
+from fastapi import HTTPException
+from sqlalchemy import or_, update
+from sqlmodel import Session, select
+
+from app.db import async_session
+from app.models.ingest import IngestRun, IngestRunItem, UserSyncState
+from app.models.user import User
+from app.services import spotify
+from app.services.ingest import ingest_top
+from app.services.taste import _id_chunks
+
+logger = logging.getLogger(__name__)
+
+
+def select_stale_users(session: Session, older_than: timedelta) -> list[int]:
+    # Users never ingested, or last ingested before now - older_than
+    cutoff = datetime.now(UTC) - older_than
+    q = (
+        select(User.id)
+        .outerjoin(UserSyncState, UserSyncState.user_id == User.id)
+        .where(or_(UserSyncState.last_ingested_at == None, UserSyncState.last_ingested_at < cutoff))  # noqa: E711
+        .order_by(User.id)
+    )
+    return list(session.exec(q).all())
+
+
+def create_run(session: Session, user_ids: list[int]) -> IngestRun:
+    ids = list(dict.fromkeys(user_ids))
+    # Checked here rather than left to the foreign key, which SQLite doesn't enforce
+    known = {uid for chunk in _id_chunks(ids) for uid in session.exec(select(User.id).where(User.id.in_(chunk)))}
+    unknown = [uid for uid in ids if uid not in known]
+    if unknown:
+        raise HTTPException(404, f"Unknown user ids: {', '.join(map(str, unknown))}")
+    run = IngestRun(total=len(ids))
+    session.add(run)
+    session.flush()
+    session.add_all(IngestRunItem(run_id=run.id, user_id=uid) for uid in ids)
+    session.commit()
+    session.refresh(run)
+    return run
+
+
+def run_progress(session: Session, run_id: int) -> dict:
+    run = session.get(IngestRun, run_id)
+    if not run:
+        raise HTTPException(404, "Ingest run not found")
+    return {
+        "run_id": run.id,
+        "status": run.status,
+        "total": run.total,
+        "done": run.done,
+        "failed": run.failed,
+        "created_at": run.created_at,
+        "finished_at": run.finished_at,
+    }
+
+
+async def _ingest_one(run_id: int, user_id: int) -> bool:
+    async with async_session() as session:
+        try:
+            await ingest_top(session, user_id)
+            status, error = "done", None
+        except Exception as e:
+            await session.rollback()
+            status = "failed"
+            error = str(e.detail) if isinstance(e, HTTPException) else f"{type(e).__name__}: {e}"
+        # Persist per-user progress so an interrupted run picks up where it stopped
+        await session.execute(
+            update(IngestRunItem)
+            .where(IngestRunItem.run_id == run_id, IngestRunItem.user_id == user_id)
+            .values(status=status, error=error)
+        )
+        counter = IngestRun.done if status == "done" else IngestRun.failed
+        await session.execute(update(IngestRun).where(IngestRun.id == run_id).values({counter: counter + 1}))
+        await session.commit()
+        return status == "done"
+
+
+async def execute_run(run_id: int, workers: int, on_progress=None) -> dict:
+    # Process every still-pending item of the run; safe to call again to resume
+    async with async_session() as session:
+        run = await session.get(IngestRun, run_id)
+        if not run:
+            raise HTTPException(404, "Ingest run not found")
+        pending = list((await session.exec(
+            select(IngestRunItem.user_id)
+            .where(IngestRunItem.run_id == run_id, IngestRunItem.status == "pending")
+            .order_by(IngestRunItem.user_id)
+        )).all())
+        run.status = "running"
+        session.add(run)
+        await session.commit()
+
+    todo: asyncio.Queue[int] = asyncio.Queue()
+    for uid in pending:
+        todo.put_nowait(uid)
+    calls_before = spotify.limiter.metrics["requests"]
+    started = time.perf_counter()
+    stats = {"users": 0, "failed": 0}
+
+    async def worker():
+        while True:
+            try:
+                uid = todo.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            ok = await _ingest_one(run_id, uid)
+            stats["users"] += 1
+            stats["failed"] += 0 if ok else 1
+            if on_progress:
+                on_progress(stats["users"], len(pending))
+
+    status = "interrupted"
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, min(workers, len(pending) or 1)))))
+        status = "done"
+    finally:
+        async with async_session() as session:
+            run = await session.get(IngestRun, run_id)
+            run.status = status
+            run.finished_at = datetime.now(UTC) if status == "done" else None
+            session.add(run)
+            await session.commit()
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    calls = spotify.limiter.metrics["requests"] - calls_before
+    report = {
+        "run_id": run_id,
+        "status": status,
+        "processed": stats["users"],
+        "failed": stats["failed"],
+        "seconds": round(elapsed, 3),
+        "users_per_sec": round(stats["users"] / elapsed, 2),
+        "calls_per_sec": round(calls / elapsed, 2),
+    }
+    logger.info("Batch ingest %s", report)
+    return report
@@ -0,0 +1,78 @@
+# app/services/blocks.py
+# Block list backed by the UserBlock table. Blocks hide users in both
+# directions: from matches and from connection requests.
+from sqlalchemy import and_, exists, or_
+from sqlmodel import Session, select, delete
+
+from app.models.user import User, UserBlock, UserSettings
+from app.services.match_pages import snapshots
+from app.services.taste import _id_chunks
+from app.services.upsert import bulk_upsert
+
+_KEY = ["blocker_id", "blocked_id"]
+
+
+def parse_blocked_csv(csv_ids: str | None) -> set[int]:
+    # Legacy UserSettings.blocked_user_ids format
+    if not csv_ids:
+        return set()
+    out: set[int] = set()
+    for p in csv_ids.split(","):
+        p = p.strip()
+        if not p:
+            continue
+        try:
+            out.add(int(p))
+        except ValueError:
+            continue
+    return out
+
+
+def block(session: Session, blocker_id: int, blocked_id: int) -> None:
+    bulk_upsert(session, UserBlock, [{"blocker_id": blocker_id, "blocked_id": blocked_id}], _KEY, update=False)
+    session.commit()
+    # Blocks apply both ways, so neither side may keep a ranked page with the other
+    snapshots.drop_users(blocker_id, blocked_id)
+
+
+def unblock(session: Session, blocker_id: int, blocked_id: int) -> None:
+    session.exec(delete(UserBlock).where(UserBlock.blocker_id == blocker_id, UserBlock.blocked_id == blocked_id))
+    session.commit()
+    snapshots.drop_users(blocker_id, blocked_id)
+
+
+def blocked_by(session: Session, user_id: int) -> list[int]:
+    # Users `user_id` has blocked, ascending
+    return list(session.exec(
+        select(UserBlock.blocked_id).where(UserBlock.blocker_id == user_id).order_by(UserBlock.blocked_id)
+    ))
+
+
+def is_blocked(session: Session, blocker_id: int, blocked_id: int) -> bool:
+    return session.get(UserBlock, (blocker_id, blocked_id)) is not None
+
+
+def not_blocked_between(user_id: int, other_col):
+    # SQL predicate: no block in either direction between user_id and other_col
+    return ~exists().where(or_(
+        and_(UserBlock.blocker_id == user_id, UserBlock.blocked_id == other_col),
+        and_(UserBlock.blocker_id == other_col, UserBlock.blocked_id == user_id),
+    ))
+
+
+def migrate_csv_blocks(session: Session) -> int:
+    # Move legacy CSV block lists into UserBlock, then clear the CSV
+    rows, migrated = [], 0
+    for s in session.exec(select(UserSettings).where(UserSettings.blocked_user_ids != None)):  # noqa: E711
+        rows += [{"blocker_id": s.user_id, "blocked_id": b} for b in parse_blocked_csv(s.blocked_user_ids)]
+        s.blocked_user_ids = None
+        session.add(s)
+        migrated += 1
+    # The CSV was never checked against deleted users; on Postgres one stale
+    # id would fail the foreign key and with it the whole migration
+    ids = sorted({r["blocked_id"] for r in rows})
+    known = {uid for chunk in _id_chunks(ids) for uid in session.exec(select(User.id).where(User.id.in_(chunk)))}
+    rows = [r for r in rows if r["blocked_id"] in known]
+    bulk_upsert(session, UserBlock, rows, _KEY, update=False)
+    session.commit()
+    return migrated
@@ -0,0 +1,171 @@
+# app/services/explain.py
+# /matches/explain in one pass over both users' data: a fixed number of batched
+# queries, whose rows also build the taste snapshots the summary is scored from
+# when they aren't cached yet.
+# Results are cached per (user_id, other_id, both data versions), so a new
+# ingest of either user makes old entries unreachable.
+from sqlmodel import Session, select
+
+from app.config import EXPLAIN_CACHE_SIZE
+from app.models.music import UserArtist, UserAudioProfile, UserAudioTermProfile, UserTrack, RecentTrack, UserGenre
+from app.services.genres import genre_names, artist_genre_ids
+from app.services.lru import LRU
+from app.services.scoring import jaccard, normalize_audio, normalized_affinity, score
+from app.services.taste import AUDIO_DIMS
+from app.services.taste_snapshot import get_snapshots
+from app.services.versions import data_versions
+
+cache = LRU(EXPLAIN_CACHE_SIZE)
+
+
+def explain(session: Session, user_id: int, other_id: int) -> dict:
+    versions = data_versions(session, [user_id, other_id])
+    key = (user_id, other_id, versions[user_id], versions[other_id])
+    out = cache.get(key)
+    if out is None:
+        out = _explain(session, user_id, other_id, versions)
+        cache.put(key, out)
+    return out
+
+
+def _split(csv: str | None) -> list[str]:
+    return [x for x in (csv or "").split(",") if x]
+
+
+def _explain(session: Session, user_id: int, other_id: int, versions: dict[int, int]) -> dict:
+    pair = [user_id, other_id]
+
+    # Medium-term artists of both users, in rank order
+    artists = {user_id: [], other_id: []}
+    for a in session.exec(
+        select(UserArtist)
+        .where(UserArtist.user_id.in_(pair), UserArtist.term == "medium")
+        .order_by(UserArtist.user_id, UserArtist.rank)
+    ):
+        artists[a.user_id].append(a)
+    me_map = {a.artist_id: a for a in artists[user_id]}
+    other_map = {a.artist_id: a for a in artists[other_id]}
+    shared_ids = set(me_map) & set(other_map)
+    shared = sorted(
+        (
+            {
+                "id": aid,
+                "name": me_map[aid].artist_name or other_map[aid].artist_name,
+                "rank_me": me_map[aid].rank,
+                "rank_other": other_map[aid].rank,
+            }
+            for aid in shared_ids
+        ),
+        key=lambda x: x["rank_me"] + x["rank_other"],
+    )
+
+    # Genre counts of both users, on integer genre ids
+    counts = {user_id: {}, other_id: {}}
+    for uid, gid, c in session.exec(
+        select(UserGenre.user_id, UserGenre.genre_id, UserGenre.count)
+        .where(UserGenre.user_id.in_(pair), UserGenre.term == "medium")
+    ):
+        counts[uid][gid] = c
+    me_counts, other_counts = counts[user_id], counts[other_id]
+    me_genres = set(me_counts)
+    overlap_genres = me_genres & set(other_counts)
+    names = genre_names(session, me_genres | set(other_counts))
+    shared_genres = sorted(
+        (
+            {"genre": names[g], "me_count": me_counts.get(g, 0), "other_count": other_counts.get(g, 0)}
+            for g in overlap_genres
+        ),
+        key=lambda x: x["me_count"] + x["other_count"],
+        reverse=True,
+    )
+
+    # Audio breakdown
+    audio = {user_id: [0.0] * 6, other_id: [0.0] * 6}
+    for prof in session.exec(select(UserAudioProfile).where(UserAudioProfile.user_id.in_(pair))):
+        audio[prof.user_id] = [getattr(prof, d) for d in AUDIO_DIMS]
+    me_norm, other_norm = normalize_audio(audio[user_id]), normalize_audio(audio[other_id])
+    term_norm = {}
+    for prof in session.exec(
+        select(UserAudioTermProfile)
+        .where(UserAudioTermProfile.user_id.in_(pair), UserAudioTermProfile.term == "medium", UserAudioTermProfile.track_count > 0)
+    ):
+        term_norm[prof.user_id] = [getattr(prof, f"norm_{d}") for d in AUDIO_DIMS]
+    audio_breakdown = [
+        {
+            "dimension": d,
+            "me": audio[user_id][i],
+            "other": audio[other_id][i],
+            "me_norm": me_norm[i],
+            "other_norm": other_norm[i],
+            "delta_norm": round(abs(me_norm[i] - other_norm[i]), 4),
+        }
+        for i, d in enumerate(AUDIO_DIMS)
+    ]
+
+    # Suggestions: artists the other has that I don't, ranked by genre overlap with my genres
+    new_artists = [a for a in artists[other_id] if a.artist_id not in me_map]
+    new_genres = artist_genre_ids(session, [a.artist_id for a in new_artists])
+    suggestions = sorted(
+        (
+            {"id": a.artist_id, "name": a.artist_name, "overlap_genres": len(me_genres & new_genres.get(a.artist_id, set()))}
+            for a in new_artists
+        ),
+        key=lambda x: x["overlap_genres"],
+        reverse=True,
+    )[:10]
+
+    # Icebreaker tracks: other user's tracks by shared artists
+    icebreaker = []
+    for t in session.exec(
+        select(UserTrack).where(UserTrack.user_id == other_id, UserTrack.term == "medium").order_by(UserTrack.rank)
+    ):
+        art_ids = _split(t.artist_ids)
+        if shared_ids.intersection(art_ids):
+            icebreaker.append({"id": t.track_id, "name": t.track_name, "rank": t.rank, "artist_ids": art_ids})
+            if len(icebreaker) == 10:
+                break
+
+    # Recent activity for the other user filtered to shared artists
+    recent_activity = []
+    if shared_ids:
+        for rt in session.exec(select(RecentTrack).where(RecentTrack.user_id == other_id).order_by(RecentTrack.id)):
+            arts = _split(rt.artist_ids)
+            if shared_ids.intersection(arts):
+                recent_activity.append({
+                    "track_id": rt.track_id,
+                    "track_name": rt.track_name,
+                    "played_at": rt.played_at,
+                    "artist_ids": arts,
+                })
+                if len(recent_activity) == 10:
+                    break
+
+    # Top-level metrics from the same taste snapshots /matches scoring uses;
+    # on a miss they are built from the rows above (what load_packs would read)
+    packs = {}
+    for uid in pair:
+        packs[uid] = {
+            "artists": [a.artist_id for a in artists[uid]],
+            "genres": [names[g] for g in counts[uid]],
+            "audio": audio[uid],
+        }
+        if uid in term_norm:
+            packs[uid]["audio_norm"] = term_norm[uid]
+    snaps = get_snapshots(session, pair, versions, packs)
+    me, other = snaps[user_id], snaps[other_id]
+    summary = {
+        "score": round(score(me.pack(), other.pack()), 4),
+        "shared_artists_count": len(me.artist_fp & other.artist_fp),
+        "genre_overlap": round(jaccard(me.genre_fp, other.genre_fp), 4),
+        "audio_affinity": round(normalized_affinity(me.audio_norm, other.audio_norm), 4),
+    }
+
+    return {
+        "summary": summary,
+        "shared_artists": shared,
+        "shared_genres": shared_genres,
+        "audio_breakdown": audio_breakdown,
+        "suggestions_new_artists": suggestions,
+        "icebreaker_tracks": icebreaker,
+        "recent_activity": recent_activity,
+    }
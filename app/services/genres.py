@@ -0,0 +1,101 @@
+# app/services/genres.py
+# Genre dictionary (name <-> small int id) and the ArtistGenre / UserGenre
+# mappings. Ingest keeps them current; rows written some other way (older
+# databases, direct inserts) are backfilled from the UserArtist CSV by
+# run_migrations at startup.
+from typing import Iterable
+
+from sqlalchemy import exists
+from sqlmodel import Session, select
+
+from app.models.music import Genre, ArtistGenre, UserGenre, UserArtist
+from app.services.taste import _select_for
+from app.services.upsert import bulk_upsert, bulk_delete
+
+_ARTIST_GENRE_KEY = ["artist_id", "genre_id"]
+USER_GENRE_KEY = ["user_id", "term", "genre_id"]
+
+
+def split_genres(csv: str | None) -> list[str]:
+    return [g for g in csv.split(",") if g] if csv else []
+
+
+def genre_ids(session: Session, names: Iterable[str]) -> dict[str, int]:
+    # Get-or-create ids for genre names
+    wanted = sorted(set(names))
+    if not wanted:
+        return {}
+    bulk_upsert(session, Genre, [{"name": n} for n in wanted], ["name"], update=False)
+    out: dict[str, int] = {}
+    for chunk in (wanted[i:i + 500] for i in range(0, len(wanted), 500)):
+        out.update(session.exec(select(Genre.name, Genre.id).where(Genre.name.in_(chunk))).all())
+    return out
+
+
+def genre_names(session: Session, ids: Iterable[int]) -> dict[int, str]:
+    ids = sorted(set(ids))
+    out: dict[int, str] = {}
+    for q in _select_for(select(Genre.id, Genre.name), Genre.id, ids):
+        out.update(session.exec(q).all())
+    return out
+
+
+def sync_artist_genres(session: Session, artists: dict[str, list[str]], ids: dict[str, int]) -> None:
+    # Replace the genre set of each given artist with what the latest payload says
+    if not artists:
+        return
+    current: set[tuple] = set()
+    for q in _select_for(select(ArtistGenre.artist_id, ArtistGenre.genre_id), ArtistGenre.artist_id, sorted(artists)):
+        current.update(session.exec(q).all())
+    wanted = {(aid, ids[g]) for aid, gs in artists.items() for g in gs}
+    bulk_delete(session, ArtistGenre, _ARTIST_GENRE_KEY, sorted(current - wanted))
+    bulk_upsert(session, ArtistGenre, [{"artist_id": a, "genre_id": g} for a, g in sorted(wanted - current)],
+                _ARTIST_GENRE_KEY, update=False)
+
+
+def user_genre_rows(user_id: int, counts: dict[str, dict[str, int]], ids: dict[str, int]) -> list[dict]:
+    # counts: term -> {genre name: number of the user's artists tagged with it}
+    return [
+        {"user_id": user_id, "term": term, "genre_id": ids[g], "count": c}
+        for term, by_name in counts.items() for g, c in by_name.items()
+    ]
+
+
+def backfill_user_genres(session: Session, user_ids: Iterable[int] | None = None) -> int:
+    # Derive Genre/ArtistGenre/UserGenre for users that have genre-tagged
+    # artists but no UserGenre rows yet. Users whose artists carry no genres
+    # have nothing to derive, so they never match again.
+    ids = sorted(set(user_ids)) if user_ids is not None else None
+    stmt = (
+        select(UserArtist.user_id, UserArtist.term, UserArtist.artist_id, UserArtist.genres)
+        .where(UserArtist.genres != None, UserArtist.genres != "")  # noqa: E711
+        .where(~exists().where(UserGenre.user_id == UserArtist.user_id))
+    )
+    rows = [r for q in _select_for(stmt, UserArtist.user_id, ids) for r in session.exec(q)]
+    if not rows:
+        return 0
+    artists: dict[str, list[str]] = {}
+    counts: dict[int, dict[str, dict[str, int]]] = {}
+    for uid, term, artist_id, csv in rows:
+        gs = split_genres(csv)
+        artists.setdefault(artist_id, gs)
+        by_name = counts.setdefault(uid, {}).setdefault(term, {})
+        for g in gs:
+            by_name[g] = by_name.get(g, 0) + 1
+    ids_by_name = genre_ids(session, {g for gs in artists.values() for g in gs} | {
+        g for terms in counts.values() for by_name in terms.values() for g in by_name
+    })
+    sync_artist_genres(session, artists, ids_by_name)
+    out = [r for uid, terms in counts.items() for r in user_genre_rows(uid, terms, ids_by_name)]
+    bulk_upsert(session, UserGenre, out, USER_GENRE_KEY)
+    session.commit()
+    return len(counts)
+
+
+def artist_genre_ids(session: Session, artist_ids: Iterable[str]) -> dict[str, set[int]]:
+    out: dict[str, set[int]] = {}
+    stmt = select(ArtistGenre.artist_id, ArtistGenre.genre_id)
+    for q in _select_for(stmt, ArtistGenre.artist_id, sorted(set(artist_ids))):
+        for aid, gid in session.exec(q):
+            out.setdefault(aid, set()).add(gid)
+    return out
@@ -0,0 +1,209 @@
+# app/services/index_file.py
+# On-disk taste index: a fixed header followed by the user-id map, artist CSR,
+# genre CSR, float32 audio matrix and the artist/genre names behind the column
+# ids, each 64-byte aligned. Workers mmap the file read-only and wrap the arrays
+# without copying, so every worker shares one copy in the page cache. Builds
+# write a temp file and os.replace() it over the old one; readers notice the new
+# inode and map the new generation.
+#
+#   python -m app.services.index_file build [--out PATH]
+#   python -m app.services.index_file info [PATH]
+import argparse
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from app import config
+from app.services.intern import Interner
+from app.services.taste_index import CSRSets, TasteIndex, VocabSize
+
+MAGIC = b"TASTEIDX"
+VERSION = 2
+# magic, version, n_users, artist nnz, genre nnz, artist vocab, genre vocab,
+# artist names bytes, genre names bytes
+_HEADER = struct.Struct("<8sIqqqqqqq")
+_ALIGN = 64
+
+
+class IndexFormatError(Exception):
+    pass
+
+
+class StaleIndexFile(Exception):
+    # A worker found a newer file generation than the one its caller scored with
+    pass
+
+
+class FileVocab(VocabSize):
+    # Column names stored in the file, newline separated. Scoring only needs
+    # len(); the names become an Interner the first time rows for users the
+    # file doesn't know have to be interned into the file's id space.
+    def __init__(self, blob: np.ndarray, n: int):
+        super().__init__(n)
+        self._blob = blob
+        self._interner: Interner | None = None
+        self._lock = threading.Lock()
+
+    def _names(self) -> Interner:
+        with self._lock:
+            if self._interner is None:
+                interner = Interner()
+                interner.intern_many(self._blob.tobytes().decode().split("\n") if self.n else [])
+                self._interner = interner
+        return self._interner
+
+    def __len__(self) -> int:
+        return len(self._interner) if self._interner is not None else self.n
+
+    def names(self) -> list[str]:
+        return self._names().names()
+
+    def intern_many(self, names) -> list[int]:
+        return self._names().intern_many(names)
+
+
+def _identity(st: os.stat_result) -> tuple[int, int, int]:
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _layout(n_users: int, a_nnz: int, g_nnz: int, a_bytes: int, g_bytes: int) -> list[tuple[str, np.dtype, tuple]]:
+    return [
+        ("user_ids", np.dtype("<i8"), (n_users,)),
+        ("artist_indptr", np.dtype("<i8"), (n_users + 1,)),
+        ("artist_indices", np.dtype("<i4"), (a_nnz,)),
+        ("genre_indptr", np.dtype("<i8"), (n_users + 1,)),
+        ("genre_indices", np.dtype("<i4"), (g_nnz,)),
+        ("audio", np.dtype("<f4"), (n_users, 6)),
+        ("artist_names", np.dtype("u1"), (a_bytes,)),
+        ("genre_names", np.dtype("u1"), (g_bytes,)),
+    ]
+
+
+def _offsets(layout) -> tuple[list[int], int]:
+    pos, out = _HEADER.size, []
+    for _, dtype, shape in layout:
+        pos += -pos % _ALIGN
+        out.append(pos)
+        pos += dtype.itemsize * int(np.prod(shape))
+    return out, pos
+
+
+def write_index(index: TasteIndex, path: str) -> None:
+    # Atomic: readers see either the old file or the complete new one
+    n, a_nnz, g_nnz = len(index), len(index.artists.indices), len(index.genres.indices)
+    a_names, g_names = index.artist_vocab.names(), index.genre_vocab.names()
+    a_blob, g_blob = "\n".join(a_names).encode(), "\n".join(g_names).encode()
+    layout = _layout(n, a_nnz, g_nnz, len(a_blob), len(g_blob))
+    offsets, _ = _offsets(layout)
+    arrays = [
+        index.user_ids, index.artists.indptr, index.artists.indices,
+        index.genres.indptr, index.genres.indices, index.audio,
+        np.frombuffer(a_blob, dtype=np.uint8), np.frombuffer(g_blob, dtype=np.uint8),
+    ]
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(
+            MAGIC, VERSION, n, a_nnz, g_nnz, len(a_names), len(g_names), len(a_blob), len(g_blob),
+        ))
+        for (_, dtype, shape), off, arr in zip(layout, offsets, arrays):
+            f.write(b"\0" * (off - f.tell()))
+            f.write(np.ascontiguousarray(arr, dtype=dtype).reshape(shape).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_index(path: str) -> TasteIndex:
+    # Zero-copy view over a read-only mapping; the mapping lives as long as the arrays
+    with open(path, "rb") as f:
+        identity = _identity(os.fstat(f.fileno()))
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mm) < _HEADER.size:
+        raise IndexFormatError(f"{path}: truncated header")
+    magic, version, n, a_nnz, g_nnz, a_vocab, g_vocab, a_bytes, g_bytes = _HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or version != VERSION:
+        raise IndexFormatError(f"{path}: not a version {VERSION} taste index")
+    layout = _layout(n, a_nnz, g_nnz, a_bytes, g_bytes)
+    offsets, end = _offsets(layout)
+    if len(mm) < end:
+        raise IndexFormatError(f"{path}: truncated ({len(mm)} < {end} bytes)")
+    arrays = {
+        name: np.frombuffer(mm, dtype=dtype, count=int(np.prod(shape)), offset=off).reshape(shape)
+        for (name, dtype, shape), off in zip(layout, offsets)
+    }
+    index = TasteIndex(
+        arrays["user_ids"],
+        CSRSets(arrays["artist_indptr"], arrays["artist_indices"]),
+        CSRSets(arrays["genre_indptr"], arrays["genre_indices"]),
+        arrays["audio"],
+        FileVocab(arrays["artist_names"], a_vocab),
+        FileVocab(arrays["genre_names"], g_vocab),
+    )
+    index.source = (path, identity)
+    return index
+
+
+_lock = threading.Lock()
+_mapped: dict = {"path": None, "identity": None, "index": None}
+
+
+def mapped_index(path: str) -> TasteIndex | None:
+    # Current generation of the file at `path`, remapped when the file is
+    # replaced; None when there is no (valid) file yet
+    try:
+        identity = _identity(os.stat(path))
+    except FileNotFoundError:
+        return None
+    if _mapped["path"] == path and _mapped["identity"] == identity:
+        return _mapped["index"]
+    with _lock:
+        if _mapped["path"] != path or _mapped["identity"] != identity:
+            try:
+                index = read_index(path)
+            except (FileNotFoundError, IndexFormatError):
+                return None
+            _mapped.update(path=path, identity=index.source[1], index=index)
+        return _mapped["index"]
+
+
+def build(path: str) -> TasteIndex:
+    from sqlmodel import Session
+    from app.db import engine, init_db
+    from app.services.taste_index import build_taste_index
+
+    init_db()
+    with Session(engine) as session:
+        index = build_taste_index(session)
+    write_index(index, path)
+    return index
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Offline build / inspection of the memory-mapped taste index")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="build from the database and atomically replace the file")
+    b.add_argument("--out", default=config.TASTE_INDEX_PATH or "taste.idx")
+    i = sub.add_parser("info", help="print header counts of an index file")
+    i.add_argument("path", nargs="?", default=config.TASTE_INDEX_PATH or "taste.idx")
+    args = p.parse_args(argv)
+
+    if args.cmd == "build":
+        t0 = time.perf_counter()
+        index = build(args.out)
+        size = os.path.getsize(args.out)
+        print(f"wrote {args.out}: users={len(index)} bytes={size} in {time.perf_counter() - t0:.2f}s")
+    else:
+        index = read_index(args.path)
+        print(
+            f"{args.path}: users={len(index)} artist_nnz={len(index.artists.indices)} "
+            f"genre_nnz={len(index.genres.indices)} artist_vocab={len(index.artist_vocab)} "
+            f"genre_vocab={len(index.genre_vocab)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+# app/services/ingest.py
+# Spotify ingest for one user. Runs inside queue workers (app/services/jobs.py),
+# so it raises instead of returning HTTP responses. The DB side is plain sync
+# code run through an AsyncSession (`run_sync`), so waiting on the database
+# never blocks the event loop other users' Spotify calls are running on.
+import asyncio
+from datetime import datetime, timedelta, UTC
+from sqlmodel import Session, select, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.db import engine
+from app.config import INGEST_CONCURRENCY, RECENT_MAX_PAGES, RECENT_RETENTION_DAYS
+from app.models.music import (
+    UserArtist, UserTrack, UserAudioProfile, UserAudioTermProfile, UserGenreSummary, UserGenre, RecentTrack,
+)
+from app.services.spotify import ensure_token, get_top, get_recently_played
+from app.services.audio_features import cached_audio_features
+from app.services.taste_index import update_taste_index
+from app.services.match_table import match_floor, refresh_user_matches
+from app.services.taste import AUDIO_DIMS
+from app.services.audio_profile import update_term_profile, raw_centroid
+from app.services.upsert import bulk_upsert, bulk_delete
+from app.services.versions import sync_state, bump_data_version
+from app.services.genres import genre_ids, sync_artist_genres, user_genre_rows, USER_GENRE_KEY
+
+TERMS = ["short", "medium", "long"]
+
+
+async def _fetch_all(token: str) -> tuple[dict, dict]:
+    # Issue every independent Spotify call at once (bounded per user). Audio
+    # features only wait for the top-track lists they depend on.
+    sem = asyncio.Semaphore(max(1, INGEST_CONCURRENCY))
+
+    async def bounded(fn, *args):
+        async with sem:
+            return await fn(*args)
+
+    async def track_features(track_tasks):
+        ids: dict[str, None] = {}
+        for task in track_tasks:
+            for t in (await task)[:50]:
+                if t.get("id"):
+                    ids[t["id"]] = None
+        return await bounded(cached_audio_features, token, list(ids))
+
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tops = {
+                (kind, term): tg.create_task(bounded(get_top, token, kind, term))
+                for term in TERMS for kind in ("artists", "tracks")
+            }
+            feats = tg.create_task(track_features([tops[("tracks", term)] for term in TERMS]))
+    except ExceptionGroup as eg:
+        # Surface the first failure as-is (HTTPException etc.); nothing was written
+        raise eg.exceptions[0]
+    return {key: t.result() for key, t in tops.items()}, feats.result()
+
+
+_ARTIST_KEY = ["user_id", "term", "artist_id"]
+_TRACK_KEY = ["user_id", "term", "track_id"]
+_GENRE_KEY = ["user_id", "term", "genre"]
+
+
+def _desired_rows(user_id: int, tops: dict) -> tuple[list[dict], list[dict], list[dict]]:
+    # Rows the user should have after this ingest, straight from the payload
+    artists, tracks, genres = [], [], []
+    for term in TERMS:
+        counts: dict[str, int] = {}
+        seen: set[str] = set()
+        for rank, a in enumerate(tops[("artists", term)], start=1):
+            if a["id"] in seen:
+                continue
+            seen.add(a["id"])
+            artists.append({
+                "user_id": user_id, "term": term,
+                "artist_id": a["id"], "artist_name": a["name"],
+                "genres": ",".join(a.get("genres", [])),
+                "popularity": a.get("popularity", 0), "rank": rank,
+            })
+            for g in a.get("genres", []):
+                if g:
+                    counts[g] = counts.get(g, 0) + 1
+        seen = set()
+        for rank, t in enumerate(tops[("tracks", term)], start=1):
+            if t["id"] in seen:
+                continue
+            seen.add(t["id"])
+            tracks.append({
+                "user_id": user_id, "term": term,
+                "track_id": t["id"], "track_name": t["name"],
+                "artist_ids": ",".join([ar["id"] for ar in t["artists"]]),
+                "popularity": t.get("popularity", 0), "rank": rank,
+            })
+        genres += [{"user_id": user_id, "term": term, "genre": g, "count": c} for g, c in counts.items()]
+    return artists, tracks, genres
+
+
+def _row_dict(obj, cols: list[str]) -> dict:
+    return {c: getattr(obj, c) for c in cols}
+
+
+def _diff(session: Session, model, key_cols: list[str], user_id: int, desired: list[dict]) -> bool:
+    # Upsert only new/changed rows and delete vanished ones; True if anything changed
+    cols = list(model.model_fields)
+    current = {
+        tuple(getattr(obj, k) for k in key_cols): _row_dict(obj, cols)
+        for obj in session.exec(select(model).where(model.user_id == user_id))
+    }
+    wanted = {tuple(r[k] for k in key_cols): r for r in desired}
+    changed = [r for key, r in wanted.items() if current.get(key) != r]
+    gone = [key for key in current if key not in wanted]
+    bulk_delete(session, model, key_cols, gone)
+    bulk_upsert(session, model, changed, key_cols)
+    return bool(changed or gone)
+
+
+def _sync_genre_ids(session: Session, user_id: int, artists: list[dict], genres: list[dict]) -> bool:
+    # Integer-keyed genre mappings (Genre / ArtistGenre / UserGenre) for the same payload
+    per_artist = {a["artist_id"]: [g for g in a["genres"].split(",") if g] for a in artists}
+    ids = genre_ids(session, {g for gs in per_artist.values() for g in gs})
+    sync_artist_genres(session, per_artist, ids)
+    counts: dict[str, dict[str, int]] = {}
+    for r in genres:
+        counts.setdefault(r["term"], {})[r["genre"]] = r["count"]
+    return _diff(session, UserGenre, USER_GENRE_KEY, user_id, user_genre_rows(user_id, counts, ids))
+
+
+def _track_ranks(rows) -> dict[str, dict[str, int]]:
+    # term -> {track_id: rank}
+    out: dict[str, dict[str, int]] = {term: {} for term in TERMS}
+    for r in rows:
+        out.setdefault(r["term"], {})[r["track_id"]] = r["rank"]
+    return out
+
+
+async def _with_left_features(token: str, old: dict, new: dict, feats: dict) -> dict:
+    # Features for tracks that left come from the shared cache, not the API
+    left = {tid for term in TERMS for tid in old.get(term, {}) if tid not in new[term] and tid not in feats}
+    if left:
+        feats = {**feats, **await cached_audio_features(token, sorted(left))}
+    return feats
+
+
+def _update_audio_profiles(session: Session, user_id: int, old: dict, new: dict, feats: dict) -> bool:
+    # Apply only the entered/left/re-ranked tracks to each term's running sums
+    profiles = {
+        p.term: p for p in session.exec(select(UserAudioTermProfile).where(UserAudioTermProfile.user_id == user_id))
+    }
+    medium = None
+    for term in TERMS:
+        if term not in profiles and not new[term]:
+            continue
+        prof = update_term_profile(profiles.get(term), user_id, term, old.get(term, {}), new[term], feats)
+        session.add(prof)
+        if term == "medium":
+            medium = prof
+
+    # Raw medium-term centroid stays the user's headline profile
+    centroid = raw_centroid(medium) if medium else None
+    if centroid is None:
+        return False
+    profile = {"user_id": user_id, **dict(zip(AUDIO_DIMS, centroid))}
+    current = session.get(UserAudioProfile, user_id)
+    if current and all(abs(getattr(current, d) - profile[d]) < 1e-9 for d in AUDIO_DIMS):
+        return False
+    bulk_upsert(session, UserAudioProfile, [profile], ["user_id"])
+    return True
+
+
+def _stored_track_ranks(session: Session, user_id: int) -> dict[str, dict[str, int]]:
+    return _track_ranks(
+        {"term": t, "track_id": tid, "rank": r}
+        for t, tid, r in session.exec(
+            select(UserTrack.term, UserTrack.track_id, UserTrack.rank).where(UserTrack.user_id == user_id)
+        )
+    )
+
+
+def _apply_top(session: Session, user_id: int, rows: tuple, old_ranks: dict, new_ranks: dict, feats: dict) -> bool:
+    # All data is in: diff against stored rows and apply the delta in one transaction
+    artists, tracks, genres = rows
+    changed = _diff(session, UserArtist, _ARTIST_KEY, user_id, artists)
+    changed |= _diff(session, UserTrack, _TRACK_KEY, user_id, tracks)
+    changed |= _diff(session, UserGenreSummary, _GENRE_KEY, user_id, genres)
+    changed |= _sync_genre_ids(session, user_id, artists, genres)
+
+    # per-term audio centroids, updated by delta (medium term as baseline)
+    changed |= _update_audio_profiles(session, user_id, old_ranks, new_ranks, feats)
+    state = sync_state(session, user_id)
+    state.last_ingested_at = datetime.now(UTC)
+    if changed:
+        bump_data_version(state)
+    session.add(state)
+    session.commit()
+    return changed
+
+
+def _refresh_matches(user_id: int) -> None:
+    # Rescoring is CPU-bound numpy work: keep it off the event loop, on its own
+    # session. Only this user's index row is reloaded, not the whole index.
+    with Session(engine) as session:
+        update_taste_index(session, [user_id])
+        refresh_user_matches(session, user_id)
+
+
+async def ingest_top(session: AsyncSession, user_id: int) -> dict:
+    token = await ensure_token(user_id, session)
+    tops, feats = await _fetch_all(token)
+
+    rows = _desired_rows(user_id, tops)
+    old_ranks = await session.run_sync(_stored_track_ranks, user_id)
+    new_ranks = _track_ranks(rows[1])
+    feats = await _with_left_features(token, old_ranks, new_ranks, feats)
+    changed = await session.run_sync(_apply_top, user_id, rows, old_ranks, new_ranks, feats)
+    # Downstream caches only care about users whose data actually moved; a
+    # first ingest always scores, even with nothing to store, so the user
+    # shows up in other users' precomputed lists
+    if changed or await session.run_sync(match_floor, user_id) is None:
+        await asyncio.to_thread(_refresh_matches, user_id)
+    return {"ok": True, "changed": changed}
+
+
+def _played_at_ms(played_at: str) -> int | None:
+    try:
+        return int(datetime.fromisoformat(played_at.replace("Z", "+00:00")).timestamp() * 1000)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _store_recent(session: Session, user_id: int, rows: list[dict], after: int | None) -> None:
+    bulk_upsert(session, RecentTrack, rows, ["user_id", "track_id", "played_at"], update=False)
+    cutoff = (datetime.now(UTC) - timedelta(days=RECENT_RETENTION_DAYS)).strftime("%Y-%m-%dT%H:%M:%S")
+    session.exec(delete(RecentTrack).where(RecentTrack.user_id == user_id, RecentTrack.played_at < cutoff))
+    state = sync_state(session, user_id)
+    if after != state.recent_after_ms:
+        # New plays can change explain's recent-activity section
+        bump_data_version(state)
+    state.recent_after_ms = after
+    session.add(state)
+    session.commit()
+
+
+async def ingest_recent(session: AsyncSession, user_id: int) -> dict:
+    # Incremental sync: page forward from the stored high-water mark with the
+    # `after` cursor and append only plays we have not seen.
+    token = await ensure_token(user_id, session)
+    after = (await session.run_sync(sync_state, user_id)).recent_after_ms
+    rows: dict[tuple, dict] = {}
+    fetched = pages = 0
+    while pages < RECENT_MAX_PAGES:
+        items = await get_recently_played(token, limit=50, after=after)
+        pages += 1
+        fetched += len(items)
+        newest = after
+        for it in items:
+            t = it.get("track") or {}
+            played_at = it.get("played_at") or ""
+            ms = _played_at_ms(played_at)
+            if ms is not None and (newest is None or ms > newest):
+                newest = ms
+            if not t or not t.get("id"):
+                continue
+            rows[(t["id"], played_at)] = {
+                "user_id": user_id,
+                "track_id": t["id"],
+                "track_name": t.get("name"),
+                "artist_ids": ",".join([a.get("id") for a in (t.get("artists") or []) if a.get("id")]),
+                "played_at": played_at,
+            }
+        # First sync (no cursor) only has the latest page; otherwise stop once caught up
+        if after is None or newest == after or len(items) < 50:
+            after = newest
+            break
+        after = newest
+
+    await session.run_sync(_store_recent, user_id, list(rows.values()), after)
+    return {"ok": True, "count": fetched, "pages": pages}
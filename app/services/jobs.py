@@ -0,0 +1,137 @@
+# app/services/jobs.py
+# In-process asyncio job queue for ingest. Requests enqueue and return a job id;
+# a fixed pool of workers does the Spotify + DB work. The enqueue/get/start/drain
+# surface is all callers use, so a durable (e.g. SQLite-backed) queue can replace it.
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, UTC
+from typing import Any, Awaitable, Callable
+
+from fastapi import HTTPException
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs kept around for status lookups
+_MAX_FINISHED = 10_000
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    user_id: int
+    fn: Callable[[], Awaitable[Any]] = field(repr=False)
+    status: str = "queued"  # queued|running|done|failed|cancelled
+    result: Any = None
+    error: str | None = None
+    created_at: datetime = field(default_factory=lambda: datetime.now(UTC))
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    def as_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "user_id": self.user_id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    def __init__(self, workers: int):
+        self.workers = max(1, workers)
+        self.jobs: OrderedDict[str, Job] = OrderedDict()
+        self._inflight: dict[tuple[str, int], Job] = {}
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._accepting = False
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._accepting = True
+
+    def enqueue(self, kind: str, user_id: int, fn: Callable[[], Awaitable[Any]]) -> Job:
+        # One in-flight job per (kind, user): repeat requests get the existing job
+        existing = self._inflight.get((kind, user_id))
+        if existing:
+            return existing
+        if not self._accepting or self._queue is None:
+            raise HTTPException(503, "Ingest queue is not accepting jobs")
+        job = Job(id=uuid.uuid4().hex, kind=kind, user_id=user_id, fn=fn)
+        self.jobs[job.id] = job
+        self._inflight[(kind, user_id)] = job
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        job.status = "running"
+        job.started_at = datetime.now(UTC)
+        try:
+            job.result = await job.fn()
+            job.status = "done"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except HTTPException as e:
+            job.status, job.error = "failed", str(e.detail)
+        except Exception as e:
+            logger.exception("Job %s (%s user=%s) failed", job.id, job.kind, job.user_id)
+            job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+        finally:
+            job.finished_at = datetime.now(UTC)
+            self._inflight.pop((job.kind, job.user_id), None)
+            self._prune()
+
+    def _prune(self) -> None:
+        while len(self.jobs) > _MAX_FINISHED:
+            oldest = next(iter(self.jobs.values()))
+            if oldest.finished_at is None:
+                break
+            self.jobs.popitem(last=False)
+
+    async def drain(self, timeout: float) -> None:
+        # Graceful shutdown: stop accepting, let queued work finish, then cancel
+        self._accepting = False
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Ingest queue drain timed out with %d jobs pending", self.pending())
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Anything still queued never ran
+        while self._queue is not None and not self._queue.empty():
+            job = self._queue.get_nowait()
+            job.status = "cancelled"
+            self._inflight.pop((job.kind, job.user_id), None)
+        self._queue = None
+
+
+queue = JobQueue(config.INGEST_WORKERS)
@@ -0,0 +1,51 @@
+# app/services/lru.py
+# Small thread-safe LRU with hit/miss/eviction counters and an optional TTL,
+# shared by the in-process caches.
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRU:
+    def __init__(self, capacity: int, ttl: float | None = None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data), "capacity": self.capacity, "hits": self.hits,
+            "misses": self.misses, "evictions": self.evictions, "expired": self.expired,
+        }
@@ -0,0 +1,101 @@
+# app/services/match_pages.py
+# Keyset pagination for /matches. Results are ordered by (score desc, user_id
+# asc); an opaque cursor carries the (score, user_id) of the last item served.
+# Live-scored rankings are kept in short-lived per-user snapshots so follow-up
+# pages are a bisect into an already ranked list instead of a rescore.
+import base64
+import binascii
+import json
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from fastapi import HTTPException
+
+from app import config
+
+
+def encode_cursor(score: float, user_id: int) -> str:
+    raw = json.dumps([score, user_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None) -> tuple[int, tuple[float, int] | None]:
+    # -> (offset, after). Plain integers are the legacy offset cursor.
+    if not cursor:
+        return 0, None
+    if cursor.isdigit():
+        return int(cursor), None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        score, user_id = json.loads(raw)
+        return 0, (float(score), int(user_id))
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+
+
+def sort_key(score: float, user_id: int) -> tuple[float, int]:
+    # Ascending order of this key is the response order
+    return (-score, user_id)
+
+
+@dataclass
+class Snapshot:
+    # Ranked entries strictly after `start` (None = from the top). `complete`
+    # means nothing ranks below the last entry.
+    start: tuple[float, int] | None
+    keys: list[tuple[float, int]]
+    items: list[dict]
+    complete: bool
+    created: float = field(default_factory=time.monotonic)
+
+    def page_after(self, after: tuple[float, int] | None, limit: int) -> list[dict] | None:
+        # Entries after `after`, or None when this snapshot cannot answer
+        if self.start is not None and (after is None or sort_key(*after) < sort_key(*self.start)):
+            return None
+        i = 0 if after is None else bisect_right(self.keys, sort_key(*after))
+        page = self.items[i:i + limit]
+        if len(page) < limit and not self.complete:
+            return None
+        return page
+
+
+class SnapshotCache:
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: OrderedDict[tuple, Snapshot] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Snapshot | None:
+        with self._lock:
+            snap = self._data.get(key)
+            if snap is None:
+                return None
+            if time.monotonic() - snap.created > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return snap
+
+    def put(self, key: tuple, snap: Snapshot) -> None:
+        with self._lock:
+            self._data[key] = snap
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def drop_users(self, *user_ids: int) -> None:
+        # Keys start with the viewing user's id
+        with self._lock:
+            for key in [k for k in self._data if k[0] in user_ids]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+snapshots = SnapshotCache(config.MATCH_SNAPSHOT_TTL, config.MATCH_SNAPSHOT_MAX)
@@ -0,0 +1,235 @@
+# app/services/match_table.py
+# Incrementally maintained UserMatch table: each user's best MATCH_TABLE_SIZE
+# matches, so /matches can be a range read. When a user's taste data changes
+# only the rows involving that user are rescored.
+#
+# Backfill for databases that predate the table:
+#   python -m app.services.match_table
+import argparse
+import time
+from datetime import datetime, UTC
+
+import numpy as np
+from sqlalchemy import and_, exists, func, insert, or_
+from sqlmodel import Session, select, delete
+
+from app import config
+from app.models.match import UserMatch, UserMatchState
+from app.models.music import Genre, UserArtist, UserGenre
+from app.models.user import User, UserSettings
+from app.services.taste_index import get_taste_index
+from app.services.blocks import not_blocked_between
+
+_INSERT_BATCH = 1000
+
+
+def _ranked(res) -> np.ndarray:
+    # Scores as /matches ranks them (TasteIndex.top_k), so stored rows, their
+    # floors and the live fallback all order matches the same way
+    return np.round(res.score, 4)
+
+
+def _terms(res, i: int) -> dict:
+    return {
+        "score": float(np.round(res.score[i], 4)),
+        "shared_artists_count": int(res.shared_artists[i]),
+        "genre_overlap": float(res.genre_overlap[i]),
+        "audio_affinity": float(res.audio_affinity[i]),
+    }
+
+
+def _best(scores: np.ndarray, m: int) -> tuple[np.ndarray, float]:
+    # Positions of the matches worth storing and the floor they all beat: the
+    # (m+1)-th best score (ties with it are left out too), or -1 when all fit
+    if len(scores) <= m:
+        return np.arange(len(scores)), -1.0
+    floor = float(np.partition(scores, len(scores) - m - 1)[len(scores) - m - 1])
+    return np.flatnonzero(scores > floor), floor
+
+
+def _own_rows(index, res, user_id: int) -> tuple[list[dict], float]:
+    others = np.flatnonzero(index.user_ids != user_id)
+    keep, floor = _best(_ranked(res)[others], config.MATCH_TABLE_SIZE)
+    ids = index.user_ids
+    return [{"user_id": user_id, "other_id": int(ids[i]), **_terms(res, i)} for i in others[keep].tolist()], floor
+
+
+def _insert(session: Session, rows: list[dict]) -> None:
+    for i in range(0, len(rows), _INSERT_BATCH):
+        session.execute(insert(UserMatch), rows[i:i + _INSERT_BATCH])
+
+
+def refresh_user_matches(session: Session, user_id: int) -> int:
+    # Scored against live data: a mapped index file only changes on its next
+    # build, and get_taste_index reloads rows re-ingested by other processes
+    # first. score() is symmetric, so the same pass also decides which other
+    # users' stored lists this user now belongs in.
+    index = get_taste_index(session, [user_id], mapped=False)
+    me = index.row(user_id)
+    res = index.score_rows(me)
+    rows, floor = _own_rows(index, res, user_id)
+
+    # Every other list stays exactly "all matches above its floor": this user
+    # is (re)inserted where the new score beats that floor and dropped elsewhere
+    scores = _ranked(res)
+    best = float(np.delete(scores, me).max()) if len(index) > 1 else -1.0
+    states = session.exec(
+        select(UserMatchState.user_id, UserMatchState.score_floor)
+        .where(UserMatchState.score_floor < best, UserMatchState.user_id != user_id)
+    ).all()
+    if states:
+        owner_ids = np.asarray([uid for uid, _ in states], dtype=np.int64)
+        floors = np.asarray([f for _, f in states], dtype=np.float64)
+        pos = index.rows_for(owner_ids)
+        hit = (pos >= 0) & (scores[np.maximum(pos, 0)] > floors)
+        rows += [
+            {"user_id": int(owner), "other_id": user_id, **_terms(res, p)}
+            for owner, p in zip(owner_ids[hit].tolist(), pos[hit].tolist())
+        ]
+
+    session.exec(delete(UserMatch).where(or_(UserMatch.user_id == user_id, UserMatch.other_id == user_id)))
+    _insert(session, rows)
+    session.merge(UserMatchState(user_id=user_id, refreshed_at=datetime.now(UTC), score_floor=floor))
+    session.commit()
+    return len(rows)
+
+
+def rebuild_all_matches(session: Session, on_progress=None) -> int:
+    # Offline backfill: one index for everyone, then each user's own best rows
+    ids = list(session.exec(select(User.id).order_by(User.id)))
+    index = get_taste_index(session, ids, mapped=False)
+    session.exec(delete(UserMatch))
+    for n, uid in enumerate(ids, start=1):
+        rows, floor = _own_rows(index, index.score_rows(index.row(uid)), uid)
+        _insert(session, rows)
+        session.merge(UserMatchState(user_id=uid, refreshed_at=datetime.now(UTC), score_floor=floor))
+        session.commit()
+        if on_progress:
+            on_progress(n, len(ids))
+    return len(ids)
+
+
+def match_floor(session: Session, user_id: int) -> float | None:
+    # None until the user's rows have been computed; see UserMatchState
+    state = session.get(UserMatchState, user_id)
+    return state.score_floor if state is not None else None
+
+
+# SQL predicates shared by the precomputed range read and the live candidate
+# query, so both paths filter identically and only qualifying rows leave the DB.
+
+def _visible_to(user_id: int, other_col):
+    # other is public (no settings row means defaults) and no block either way
+    return and_(
+        or_(UserSettings.user_id == None, UserSettings.is_public == True),  # noqa: E711,E712
+        not_blocked_between(user_id, other_col),
+    )
+
+
+def _in_country(country: str):
+    # Matches the expression index ix_user_country_upper
+    return func.upper(User.country) == country.upper()
+
+
+def _has_any_genre(other_col, names: set[str]):
+    # Resolve names against the small Genre dictionary once; the per-row
+    # check is then a primary-key probe on UserGenre
+    wanted = select(Genre.id).where(func.lower(Genre.name).in_(names))
+    return exists().where(and_(
+        UserGenre.user_id == other_col,
+        UserGenre.term == "medium",
+        UserGenre.genre_id.in_(wanted),
+    ))
+
+
+def _sharing_artists(user_id: int, n: int):
+    # Users with at least n medium-term artists in common with user_id
+    mine = select(UserArtist.artist_id).where(UserArtist.user_id == user_id, UserArtist.term == "medium")
+    return (
+        select(UserArtist.user_id)
+        .where(UserArtist.term == "medium", UserArtist.artist_id.in_(mine))
+        .group_by(UserArtist.user_id)
+        .having(func.count() >= n)
+    )
+
+
+def eligible_candidates(
+    session: Session,
+    user_id: int,
+    country: str | None = None,
+    min_shared_artists: int = 0,
+    required_genres: set[str] | None = None,
+) -> list[int]:
+    # Ids of every user the /matches filters let through, ordered by id; only
+    # the ranked winners are loaded as User rows
+    q = (
+        select(User.id)
+        .outerjoin(UserSettings, UserSettings.user_id == User.id)
+        .where(User.id != user_id)
+        .where(_visible_to(user_id, User.id))
+    )
+    if country:
+        q = q.where(_in_country(country))
+    if min_shared_artists:
+        q = q.where(User.id.in_(_sharing_artists(user_id, min_shared_artists)))
+    if required_genres:
+        q = q.where(_has_any_genre(User.id, required_genres))
+    return list(session.exec(q.order_by(User.id)))
+
+
+def read_matches(
+    session: Session,
+    user_id: int,
+    offset: int,
+    limit: int,
+    country: str | None = None,
+    min_score: float | None = None,
+    min_shared_artists: int = 0,
+    required_genres: set[str] | None = None,
+    after: tuple[float, int] | None = None,
+):
+    # Indexed range read over (user_id, score) with the /matches filters as
+    # predicates. `after` seeks past a (score, other_id) keyset cursor.
+    q = (
+        select(UserMatch, User)
+        .join(User, User.id == UserMatch.other_id)
+        .outerjoin(UserSettings, UserSettings.user_id == UserMatch.other_id)
+        .where(UserMatch.user_id == user_id)
+        .where(_visible_to(user_id, UserMatch.other_id))
+    )
+    if country:
+        q = q.where(_in_country(country))
+    if min_score is not None:
+        q = q.where(UserMatch.score >= float(min_score))
+    if min_shared_artists:
+        q = q.where(UserMatch.shared_artists_count >= min_shared_artists)
+    if required_genres:
+        q = q.where(_has_any_genre(UserMatch.other_id, required_genres))
+    if after is not None:
+        q = q.where(or_(
+            UserMatch.score < after[0],
+            and_(UserMatch.score == after[0], UserMatch.other_id > after[1]),
+        ))
+    q = q.order_by(UserMatch.score.desc(), UserMatch.other_id).offset(offset).limit(limit)
+    return session.exec(q).all()
+
+
+def main(argv: list[str] | None = None) -> None:
+    from app.db import engine
+
+    p = argparse.ArgumentParser(description="Rebuild the precomputed UserMatch table for every user")
+    p.add_argument("--every", type=int, default=1000, help="print progress every N users")
+    args = p.parse_args(argv)
+
+    def progress(done: int, total: int) -> None:
+        if done % args.every == 0 or done == total:
+            print(f"  {done}/{total} users")
+
+    t0 = time.perf_counter()
+    with Session(engine) as session:
+        n = rebuild_all_matches(session, on_progress=progress)
+    print(f"rebuilt matches for {n} users in {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+# app/services/parallel_scoring.py
+# Optional multi-core scoring for /matches. The taste index arrays are copied
+# once into shared memory (or, for an index loaded from a TASTE_INDEX_PATH
+# file, workers map the same file); worker processes attach by name, so a
+# request only ships the query row, its candidate shard and k. Each worker
+# runs TasteIndex.top_k on its shard and the parent merges the shard winners.
+#
+# Scaling benchmark (synthetic index):
+#   python -m app.services.parallel_scoring --users 200000 --workers 1,2,4,8
+import argparse
+import heapq
+import itertools
+import multiprocessing as mp
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from app import config
+from app.services.index_file import StaleIndexFile, read_index
+from app.services.taste_index import CSRSets, TasteIndex, VocabSize
+
+# Arrays of a TasteIndex that are exported to shared memory
+_FIELDS = {
+    "user_ids": lambda ix: ix.user_ids,
+    "artist_indptr": lambda ix: ix.artists.indptr,
+    "artist_indices": lambda ix: ix.artists.indices,
+    "genre_indptr": lambda ix: ix.genres.indptr,
+    "genre_indices": lambda ix: ix.genres.indices,
+    "audio": lambda ix: ix.audio,
+}
+
+_generations = itertools.count(1)
+
+
+class SharedIndex:
+    # One shared-memory block per array; `spec` is all a worker needs to attach
+    def __init__(self, index: TasteIndex):
+        self.generation = next(_generations)
+        self.blocks: list[shared_memory.SharedMemory] = []
+        arrays = {}
+        for name, get in _FIELDS.items():
+            src = np.ascontiguousarray(get(index))
+            shm = shared_memory.SharedMemory(create=True, size=max(src.nbytes, 1))
+            np.ndarray(src.shape, dtype=src.dtype, buffer=shm.buf)[...] = src
+            self.blocks.append(shm)
+            arrays[name] = (shm.name, src.shape, src.dtype.str)
+        self.spec = {
+            "generation": self.generation,
+            "arrays": arrays,
+            "artist_vocab": len(index.artist_vocab),
+            "genre_vocab": len(index.genre_vocab),
+        }
+
+    def close(self) -> None:
+        for shm in self.blocks:
+            shm.close()
+            shm.unlink()
+        self.blocks = []
+
+
+class MappedFile:
+    # A file-backed index needs no copy: workers mmap the same file and check
+    # it is still the generation the parent loaded
+    def __init__(self, index: TasteIndex):
+        path, identity = index.source
+        self.generation = next(_generations)
+        self.spec = {"generation": self.generation, "file": path, "identity": identity}
+
+    def close(self) -> None:
+        pass
+
+
+# Worker-side: the attached index for the current generation
+_attached: dict = {"generation": None, "index": None, "blocks": []}
+
+
+def _open_block(name: str) -> shared_memory.SharedMemory:
+    # The parent owns (and unlinks) every block. Spawned workers share the
+    # parent's resource tracker, so attaching never schedules a second unlink.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def _attach(spec: dict) -> TasteIndex:
+    if _attached["generation"] == spec["generation"]:
+        return _attached["index"]
+    for shm in _attached["blocks"]:
+        shm.close()
+    # Forget the old generation first: attaching the new one may fail
+    _attached.update(generation=None, index=None, blocks=[])
+    if "file" in spec:
+        index = read_index(spec["file"])
+        if index.source[1] != spec["identity"]:
+            raise StaleIndexFile(spec["file"])
+        _attached.update(generation=spec["generation"], index=index, blocks=[])
+        return index
+    blocks, arrays = [], {}
+    for name, (shm_name, shape, dtype) in spec["arrays"].items():
+        blocks.append(_open_block(shm_name))
+        shm = blocks[-1]
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    index = TasteIndex(
+        arrays["user_ids"],
+        CSRSets(arrays["artist_indptr"], arrays["artist_indices"]),
+        CSRSets(arrays["genre_indptr"], arrays["genre_indices"]),
+        arrays["audio"],
+        VocabSize(spec["artist_vocab"]),
+        VocabSize(spec["genre_vocab"]),
+    )
+    _attached.update(generation=spec["generation"], index=index, blocks=blocks)
+    return index
+
+
+def _shard_top_k(spec: dict, me_row: int, rows: np.ndarray, offset: int, k: int, min_score, after) -> list[tuple]:
+    top = _attach(spec).top_k(me_row, rows, k, min_score, after)
+    # Positions back into the caller's full candidate array
+    return [(s, neg_uid, pos + offset, terms) for s, neg_uid, pos, terms in top]
+
+
+class ShardedScorer:
+    def __init__(self, index: TasteIndex, workers: int):
+        self.index = index
+        self.workers = workers
+        self.shared = MappedFile(index) if index.source else SharedIndex(index)
+        self.pool = _pool(workers)
+        self.published_at = time.monotonic()
+        self._served = index
+        # Requests still scoring on the shared blocks; a retired scorer frees
+        # them when the last one finishes
+        self._in_flight = 0
+        self._retired = False
+        self._state = threading.Lock()
+
+    def top_k(
+        self,
+        me_row: int,
+        rows: np.ndarray,
+        k: int,
+        min_score: float | None = None,
+        after: tuple[float, int] | None = None,
+    ) -> list[tuple]:
+        # Same contract as TasteIndex.top_k, computed shard by shard
+        with self._state:
+            if self._retired:
+                # Replaced while this request waited; its blocks may be gone
+                return self.index.top_k(me_row, rows, k, min_score, after)
+            self._in_flight += 1
+        try:
+            bounds = np.linspace(0, len(rows), self.workers + 1).astype(np.int64)
+            futures = [
+                self.pool.submit(_shard_top_k, self.shared.spec, me_row, rows[lo:hi], int(lo), k, min_score, after)
+                for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo
+            ]
+            try:
+                shards = [f.result() for f in futures]
+            except (StaleIndexFile, FileNotFoundError):
+                # The file was swapped or the blocks freed under us; this
+                # request finishes on the caller's copy of the index and the
+                # next one picks up the new generation
+                return self.index.top_k(me_row, rows, k, min_score, after)
+        finally:
+            self._release()
+        merged = heapq.merge(*shards, reverse=True)
+        return list(itertools.islice(merged, k))
+
+    def serves(self, index: TasteIndex) -> bool:
+        # This index, or a newer in-memory one with the same rows while this
+        # generation is younger than SCORING_REPUBLISH_INTERVAL: every ingest
+        # replaces the index object, and re-exporting all arrays (and having
+        # every worker re-attach) each time would cost more than scoring on
+        # rows that are a few seconds stale. Row positions still line up.
+        if index is self._served:
+            return True
+        if index.source or self.index.source:
+            return False
+        if time.monotonic() - self.published_at >= config.SCORING_REPUBLISH_INTERVAL:
+            return False
+        if not np.array_equal(index.user_ids, self.index.user_ids):
+            return False
+        self._served = index
+        return True
+
+    def _release(self) -> None:
+        with self._state:
+            self._in_flight -= 1
+            if self._retired and not self._in_flight:
+                self.shared.close()
+
+    def retire(self) -> None:
+        # Free the shared blocks once no request is scoring on them
+        with self._state:
+            if not self._retired:
+                self._retired = True
+                if not self._in_flight:
+                    self.shared.close()
+
+    def close(self) -> None:
+        self.retire()
+
+
+_lock = threading.Lock()
+_pool_state: dict = {"pool": None, "workers": 0}
+_scorer: ShardedScorer | None = None
+
+
+def _pool(workers: int) -> ProcessPoolExecutor:
+    # One long-lived pool; spawn so workers never inherit the server's threads
+    if _pool_state["pool"] is None or _pool_state["workers"] != workers:
+        if _pool_state["pool"] is not None:
+            _pool_state["pool"].shutdown(cancel_futures=True)
+        _pool_state.update(pool=ProcessPoolExecutor(workers, mp_context=mp.get_context("spawn")), workers=workers)
+    return _pool_state["pool"]
+
+
+def scorer_for(index: TasteIndex, n_candidates: int) -> ShardedScorer | None:
+    # The sharded scorer for this index, or None when the request should stay
+    # in-process (disabled, or too few candidates to pay for the fan-out)
+    global _scorer
+    if config.SCORING_WORKERS < 2 or n_candidates < config.SCORING_PARALLEL_MIN:
+        return None
+    scorer = _scorer
+    if scorer is None or not scorer.serves(index):
+        with _lock:
+            scorer = _scorer
+            if scorer is None or not scorer.serves(index):
+                if scorer is not None:
+                    scorer.retire()
+                scorer = _scorer = ShardedScorer(index, config.SCORING_WORKERS)
+    return scorer
+
+
+def shutdown() -> None:
+    global _scorer
+    with _lock:
+        if _scorer is not None:
+            _scorer.close()
+            _scorer = None
+        if _pool_state["pool"] is not None:
+            _pool_state["pool"].shutdown(cancel_futures=True)
+            _pool_state.update(pool=None, workers=0)
+
+
+def synthetic_index(users: int, artists: int = 50000, genres: int = 3000, seed: int = 0) -> TasteIndex:
+    rng = np.random.default_rng(seed)
+    # Zipf-ish popularity so some artists are shared widely
+    a_pop = rng.zipf(1.3, size=users * 30) % artists
+    g_pop = rng.zipf(1.5, size=users * 15) % genres
+    a_rows = np.array_split(a_pop, users)
+    g_rows = np.array_split(g_pop, users)
+    return TasteIndex(
+        np.arange(1, users + 1, dtype=np.int64),
+        CSRSets.from_rows([r.tolist() for r in a_rows]),
+        CSRSets.from_rows([r.tolist() for r in g_rows]),
+        rng.random((users, 6), dtype=np.float32),
+        VocabSize(artists),
+        VocabSize(genres),
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Scaling of sharded top-k scoring across processes")
+    p.add_argument("--users", type=int, default=200000)
+    p.add_argument("--workers", default="1,2,4", help="comma separated worker counts")
+    p.add_argument("--k", type=int, default=20)
+    p.add_argument("--queries", type=int, default=20)
+    args = p.parse_args(argv)
+
+    index = synthetic_index(args.users)
+    rows = np.arange(len(index), dtype=np.int64)
+    queries = np.random.default_rng(1).choice(len(index), size=args.queries, replace=False)
+    # min_score=1.01 disables bound pruning so every run scores every candidate
+    t0 = time.perf_counter()
+    for q in queries.tolist():
+        index.top_k(q, rows, args.k, min_score=1.01)
+    base = (time.perf_counter() - t0) / len(queries)
+    print(f"users={len(index)} cpus={mp.cpu_count()} in-process={base * 1000:.1f}ms/query")
+    for workers in (int(x) for x in args.workers.split(",")):
+        scorer = ShardedScorer(index, workers)
+        try:
+            scorer.top_k(int(queries[0]), rows, args.k, 1.01)  # warm up: attach in every worker
+            t0 = time.perf_counter()
+            for q in queries.tolist():
+                scorer.top_k(q, rows, args.k, min_score=1.01)
+            per = (time.perf_counter() - t0) / len(queries)
+            print(f"workers={workers:3d} {per * 1000:.1f}ms/query speedup={base / per:.2f}x")
+        finally:
+            scorer.close()
+    shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# app/services/ratelimit.py
+# Client-side throttling for Spotify: a global token bucket that queues callers
+# instead of failing them, per-endpoint pauses driven by 429 Retry-After, and
+# jittered exponential backoff for 5xx / transport errors.
+import asyncio
+import random
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = max(rate, 1e-6)
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        # Take a token now and return how long the caller must wait for it.
+        # A negative balance is the virtual FIFO queue of waiting callers.
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1.0
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RateLimiter:
+    def __init__(self, rate: float, burst: float, max_retries: int, backoff_base: float, backoff_max: float):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._paused_until: dict[str, float] = {}
+        self.metrics = {
+            "requests": 0,
+            "throttled_429": 0,
+            "server_errors": 0,
+            "retries": 0,
+            "queued": 0,
+            "wait_seconds": 0.0,
+            "waiting_now": 0,
+        }
+
+    async def _wait(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        self.metrics["queued"] += 1
+        self.metrics["waiting_now"] += 1
+        self.metrics["wait_seconds"] += seconds
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.metrics["waiting_now"] -= 1
+
+    async def acquire(self, endpoint: str) -> None:
+        # Honor any Retry-After pause on this endpoint, then take a global token
+        pause = self._paused_until.get(endpoint, 0.0) - time.monotonic()
+        await self._wait(pause)
+        await self._wait(self.bucket.reserve())
+        self.metrics["requests"] += 1
+
+    def pause(self, endpoint: str, seconds: float) -> None:
+        until = time.monotonic() + seconds
+        self._paused_until[endpoint] = max(self._paused_until.get(endpoint, 0.0), until)
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter: uniform in [0, min(max, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def snapshot(self) -> dict:
+        return {**self.metrics, "wait_seconds": round(self.metrics["wait_seconds"], 3)}
+
+
+def retry_after_seconds(value: str | None, default: float) -> float:
+    # Spotify sends delta-seconds; fall back to our own backoff otherwise
+    try:
+        return max(0.0, float(value)) if value is not None else default
+    except ValueError:
+        return default
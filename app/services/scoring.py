@@ -1,12 +1,24 @@
 from math import sqrt
 from typing import Iterable, List
 
+# Weights of the artist / genre / audio terms in the overall score
+ARTIST_WEIGHT = 0.4
+GENRE_WEIGHT = 0.2
+AUDIO_WEIGHT = 0.4
+
 
 def _clamp(x: float, lo: float = 0.0, hi: float = 1.0) -> float:
     return max(lo, min(hi, x))
 
 
-def jaccard(a: Iterable[str] | set[str], b: Iterable[str] | set[str]) -> float:
+def jaccard(a: Iterable[str] | frozenset, b: Iterable[str] | frozenset) -> float:
+    if isinstance(a, frozenset) and isinstance(b, frozenset):
+        # Fingerprints from app.services.intern (or other prebuilt sets): one
+        # intersection, no sets built per call
+        if not a and not b:
+            return 0.0
+        inter = len(a & b)
+        return inter / (len(a) + len(b) - inter)
     sa = set(a)
     sb = set(b)
     if not sa and not sb:
@@ -39,17 +51,23 @@ def normalize_audio(vec: List[float]) -> List[float]:
     ]
 
 
-def audio_affinity(a: List[float], b: List[float]) -> float:
-    an = normalize_audio(a)
-    bn = normalize_audio(b)
+def normalized_affinity(an: List[float], bn: List[float]) -> float:
+    # audio_affinity() for vectors that are already normalized
     d = sqrt(sum((ai - bi) ** 2 for ai, bi in zip(an, bn)))
     # Max distance in this 6-D normalized space is sqrt(6)
     aff = 1.0 - d / sqrt(len(an))
     return _clamp(aff)
 
 
+def audio_affinity(a: List[float], b: List[float]) -> float:
+    return normalized_affinity(normalize_audio(a), normalize_audio(b))
+
+
 def score(userA, userB) -> float:
     sA = jaccard(userA["artists"], userB["artists"])  # artist overlap
     sG = jaccard(userA["genres"], userB["genres"])    # genre overlap
-    sF = audio_affinity(userA["audio"], userB["audio"])  # audio profile affinity
-    return 0.4 * sA + 0.2 * sG + 0.4 * sF
+    # audio profile affinity; packs may carry the stored pre-normalized centroid
+    an = userA.get("audio_norm") or normalize_audio(userA["audio"])
+    bn = userB.get("audio_norm") or normalize_audio(userB["audio"])
+    sF = normalized_affinity(an, bn)
+    return ARTIST_WEIGHT * sA + GENRE_WEIGHT * sG + AUDIO_WEIGHT * sF
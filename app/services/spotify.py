@@ -1,61 +1,213 @@
 # app/services/spotify.py
+import asyncio
 import httpx, os
 from sqlmodel import Session, select
-from datetime import datetime, timedelta
+from sqlmodel.ext.asyncio.session import AsyncSession
+from datetime import datetime, timedelta, UTC
+from app.db import async_session
 from app.models.user import SpotifyToken
 from fastapi import HTTPException
+from app import config
+from app.services.ratelimit import RateLimiter, retry_after_seconds
 
-AUTH_URL = "https://accounts.spotify.com/api/token"
-BASE = "https://api.spotify.com/v1"
+# Overridable so ingest can be exercised against a local mock Spotify server
+AUTH_URL = os.getenv("SPOTIFY_AUTH_URL", "https://accounts.spotify.com/api/token")
+BASE = os.getenv("SPOTIFY_API_BASE", "https://api.spotify.com/v1")
 
-async def ensure_token(user_id: int, session: Session) -> str:
-    tok = session.exec(select(SpotifyToken).where(SpotifyToken.user_id == user_id)).first()
+# One application-scoped client: pooled keep-alive (HTTP/2) connections instead of
+# a fresh TCP/TLS handshake per call. Opened/closed by the app lifespan.
+_client: httpx.AsyncClient | None = None
+
+
+def init_client(transport: httpx.AsyncBaseTransport | None = None) -> httpx.AsyncClient:
+    global _client
+    _client = httpx.AsyncClient(
+        http2=config.SPOTIFY_HTTP2,
+        limits=httpx.Limits(
+            max_connections=config.SPOTIFY_MAX_CONNECTIONS,
+            max_keepalive_connections=config.SPOTIFY_MAX_KEEPALIVE,
+            keepalive_expiry=config.SPOTIFY_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(config.SPOTIFY_TIMEOUT),
+        transport=transport,
+    )
+    return _client
+
+
+def get_client() -> httpx.AsyncClient:
+    # Lazily created for scripts/tests that run outside the app lifespan
+    if _client is None or _client.is_closed:
+        return init_client()
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+limiter = RateLimiter(
+    rate=config.SPOTIFY_RATE,
+    burst=config.SPOTIFY_BURST,
+    max_retries=config.SPOTIFY_MAX_RETRIES,
+    backoff_base=config.SPOTIFY_BACKOFF_BASE,
+    backoff_max=config.SPOTIFY_BACKOFF_MAX,
+)
+
+
+async def _request(method: str, url: str, endpoint: str, **kwargs) -> httpx.Response:
+    # Every Spotify call goes through the limiter. 429s pause the endpoint for
+    # Retry-After and retry; 5xx and transport errors retry with jittered backoff.
+    # The last response (or error) is returned to the caller once retries run out.
+    attempt = 0
+    while True:
+        await limiter.acquire(endpoint)
+        try:
+            r = await get_client().request(method, url, **kwargs)
+        except httpx.TransportError:
+            if attempt >= limiter.max_retries:
+                raise
+            limiter.metrics["retries"] += 1
+            await asyncio.sleep(limiter.backoff(attempt))
+            attempt += 1
+            continue
+        if r.status_code == 429:
+            limiter.metrics["throttled_429"] += 1
+            if attempt >= limiter.max_retries:
+                return r
+            limiter.pause(endpoint, retry_after_seconds(r.headers.get("Retry-After"), limiter.backoff(attempt)))
+        elif r.status_code >= 500:
+            limiter.metrics["server_errors"] += 1
+            if attempt >= limiter.max_retries:
+                return r
+            await asyncio.sleep(limiter.backoff(attempt))
+        else:
+            return r
+        limiter.metrics["retries"] += 1
+        attempt += 1
+
+# In-process access-token cache (user_id -> (token, expires_at)) and the refreshes
+# currently in flight, so concurrent callers share a single refresh POST.
+_token_cache: dict[int, tuple[str, datetime]] = {}
+_refreshing: dict[int, asyncio.Task] = {}
+_background: set[asyncio.Task] = set()
+
+
+def _utc(dt: datetime) -> datetime:
+    # Some drivers hand back naive datetimes; tokens are always stored in UTC
+    return dt if dt.tzinfo else dt.replace(tzinfo=UTC)
+
+
+def cache_token(user_id: int, access_token: str, expires_at: datetime) -> None:
+    _token_cache[user_id] = (access_token, _utc(expires_at))
+
+
+def clear_token_cache() -> None:
+    _token_cache.clear()
+
+
+def _maybe_refresh_early(user_id: int, expires_at: datetime, now: datetime) -> None:
+    # Proactive refresh: callers keep using the still-valid token meanwhile
+    if expires_at - now > timedelta(seconds=config.TOKEN_REFRESH_MARGIN) or user_id in _refreshing:
+        return
+    task = asyncio.create_task(_refresh(user_id))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    # Errors resurface on the next foreground refresh; don't log "never retrieved"
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+async def ensure_token(user_id: int, session: Session | AsyncSession) -> str:
+    now = datetime.now(UTC)
+    cached = _token_cache.get(user_id)
+    if cached and cached[1] > now:
+        _maybe_refresh_early(user_id, cached[1], now)
+        return cached[0]
+    q = select(SpotifyToken).where(SpotifyToken.user_id == user_id)
+    if isinstance(session, AsyncSession):
+        tok = (await session.exec(q)).first()
+    else:
+        tok = session.exec(q).first()
     if not tok:
         raise HTTPException(status_code=401, detail="No Spotify token for this user. Please login via /auth/login.")
-    if tok.expires_at > datetime.utcnow():
+    if _utc(tok.expires_at) > now:
+        cache_token(user_id, tok.access_token, tok.expires_at)
+        _maybe_refresh_early(user_id, _utc(tok.expires_at), now)
         return tok.access_token
-    # refresh
-    if not tok.refresh_token:
-        raise HTTPException(status_code=401, detail="Refresh token missing. Please re-authenticate with Spotify.")
-    async with httpx.AsyncClient() as client:
+    return await _refresh(user_id)
+
+
+async def _refresh(user_id: int) -> str:
+    # Single-flight: the first caller starts the refresh, the rest await its result
+    task = _refreshing.get(user_id)
+    if task is None:
+        task = asyncio.create_task(_do_refresh(user_id))
+        _refreshing[user_id] = task
+        task.add_done_callback(lambda _: _refreshing.pop(user_id, None))
+    return await asyncio.shield(task)
+
+
+async def _do_refresh(user_id: int) -> str:
+    # Own session: the refresh may outlive (or not belong to) any single request
+    async with async_session() as session:
+        tok = (await session.exec(select(SpotifyToken).where(SpotifyToken.user_id == user_id))).first()
+        if not tok:
+            _token_cache.pop(user_id, None)
+            raise HTTPException(status_code=401, detail="No Spotify token for this user. Please login via /auth/login.")
+        if not tok.refresh_token:
+            raise HTTPException(status_code=401, detail="Refresh token missing. Please re-authenticate with Spotify.")
         data = {
             "grant_type": "refresh_token",
             "refresh_token": tok.refresh_token,
             "client_id": os.getenv("SPOTIFY_CLIENT_ID"),
             "client_secret": os.getenv("SPOTIFY_CLIENT_SECRET"),
         }
-        r = await client.post(AUTH_URL, data=data, timeout=30)
+        r = await _request("POST", AUTH_URL, "token", data=data)
         try:
             r.raise_for_status()
         except httpx.HTTPStatusError as e:
+            _token_cache.pop(user_id, None)
             raise HTTPException(status_code=401, detail=f"Failed to refresh token: {e.response.text}")
         payload = r.json()
         tok.access_token = payload["access_token"]
-        tok.expires_at = datetime.utcnow() + timedelta(seconds=payload.get("expires_in", 3600) - 60)
+        tok.expires_at = datetime.now(UTC) + timedelta(seconds=payload.get("expires_in", 3600) - 60)
+        # Spotify may rotate the refresh token
+        if payload.get("refresh_token"):
+            tok.refresh_token = payload["refresh_token"]
         session.add(tok)
-        session.commit()
+        await session.commit()
+        cache_token(user_id, tok.access_token, tok.expires_at)
         return tok.access_token
 
 async def get_top(token: str, kind: str, term: str):
     url = f"{BASE}/me/top/{kind}"
     params = {"time_range": f"{term}_term", "limit": 50}
-    async with httpx.AsyncClient() as client:
-        r = await client.get(url, headers={"Authorization": f"Bearer {token}"}, params=params, timeout=30)
-        r.raise_for_status()
-        return r.json()["items"]
+    r = await _request("GET", url, "top", headers={"Authorization": f"Bearer {token}"}, params=params)
+    r.raise_for_status()
+    return r.json()["items"]
+
+# Spotify accepts at most this many ids per /audio-features call
+AUDIO_FEATURES_BATCH = 100
+
 
 async def get_audio_features(token: str, track_ids: list[str]):
-    if not track_ids: return []
-    async with httpx.AsyncClient() as client:
-        r = await client.get(f"{BASE}/audio-features", headers={"Authorization": f"Bearer {token}"}, params={"ids": ",".join(track_ids[:100])}, timeout=30)
+    out = []
+    for i in range(0, len(track_ids), AUDIO_FEATURES_BATCH):
+        chunk = track_ids[i:i + AUDIO_FEATURES_BATCH]
+        r = await _request("GET", f"{BASE}/audio-features", "audio-features", headers={"Authorization": f"Bearer {token}"}, params={"ids": ",".join(chunk)})
         r.raise_for_status()
-        return r.json()["audio_features"]
+        out += r.json()["audio_features"]
+    return out
 
 
-async def get_recently_played(token: str, limit: int = 50):
+async def get_recently_played(token: str, limit: int = 50, after: int | None = None):
+    # `after` is a unix-ms cursor: only plays newer than it are returned
     url = f"{BASE}/me/player/recently-played"
     params = {"limit": limit}
-    async with httpx.AsyncClient() as client:
-        r = await client.get(url, headers={"Authorization": f"Bearer {token}"}, params=params, timeout=30)
-        r.raise_for_status()
-        return r.json().get("items", [])
+    if after is not None:
+        params["after"] = after
+    r = await _request("GET", url, "recently-played", headers={"Authorization": f"Bearer {token}"}, params=params)
+    r.raise_for_status()
+    return r.json().get("items", [])
@@ -0,0 +1,74 @@
+# app/services/taste.py
+from typing import Iterable
+from sqlmodel import Session, select
+from app.models.music import UserArtist, UserAudioProfile, UserAudioTermProfile, UserGenre, Genre
+
+AUDIO_DIMS = ["tempo", "energy", "valence", "danceability", "acousticness", "loudness"]
+
+# Stay well below SQLite's bound-parameter limit when filtering by id
+_IN_CHUNK = 500
+
+
+def empty_pack() -> dict:
+    return {"artists": [], "genres": [], "audio": [0.0] * 6}
+
+
+def _id_chunks(user_ids: list[int]):
+    for i in range(0, len(user_ids), _IN_CHUNK):
+        yield user_ids[i:i + _IN_CHUNK]
+
+
+def _select_for(stmt, column, user_ids: list[int] | None):
+    # None means "every user": one unfiltered query instead of giant IN lists
+    if user_ids is None:
+        yield stmt
+        return
+    for chunk in _id_chunks(user_ids):
+        yield stmt.where(column.in_(chunk))
+
+
+def load_packs(session: Session, user_ids: Iterable[int] | None = None) -> dict[int, dict]:
+    # Scoring packs ({artists, genres, audio}) for many users in a fixed number of
+    # queries. Requested users without taste data get an empty pack.
+    ids = sorted(set(user_ids)) if user_ids is not None else None
+    packs: dict[int, dict] = {uid: empty_pack() for uid in ids} if ids is not None else {}
+
+    stmt = (
+        select(UserArtist.user_id, UserArtist.artist_id)
+        .where(UserArtist.term == "medium")
+        .order_by(UserArtist.user_id, UserArtist.rank)
+    )
+    for q in _select_for(stmt, UserArtist.user_id, ids):
+        for uid, artist_id in session.exec(q):
+            p = packs.get(uid)
+            if p is None:
+                p = packs[uid] = empty_pack()
+            p["artists"].append(artist_id)
+
+    stmt = (
+        select(UserGenre.user_id, Genre.name)
+        .join(Genre, Genre.id == UserGenre.genre_id)
+        .where(UserGenre.term == "medium")
+    )
+    for q in _select_for(stmt, UserGenre.user_id, ids):
+        for uid, name in session.exec(q):
+            p = packs.get(uid)
+            if p is None:
+                p = packs[uid] = empty_pack()
+            p["genres"].append(name)
+
+    for q in _select_for(select(UserAudioProfile), UserAudioProfile.user_id, ids):
+        for prof in session.exec(q):
+            p = packs.get(prof.user_id)
+            if p is None:
+                p = packs[prof.user_id] = empty_pack()
+            p["audio"] = [getattr(prof, d) for d in AUDIO_DIMS]
+
+    # Pre-normalized medium-term centroid, when ingest has maintained one
+    stmt = select(UserAudioTermProfile).where(UserAudioTermProfile.term == "medium", UserAudioTermProfile.track_count > 0)
+    for q in _select_for(stmt, UserAudioTermProfile.user_id, ids):
+        for prof in session.exec(q):
+            p = packs.get(prof.user_id)
+            if p is not None:
+                p["audio_norm"] = [getattr(prof, f"norm_{d}") for d in AUDIO_DIMS]
+    return packs
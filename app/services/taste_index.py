@@ -0,0 +1,387 @@
+# app/services/taste_index.py
+# Process-resident taste index: every user's medium-term artist and genre sets as
+# CSR-style integer matrices plus normalized audio vectors, so one user can be
+# scored against everyone else in a single batched computation.
+import asyncio
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta, UTC
+from math import sqrt
+from typing import Iterable
+
+import numpy as np
+from sqlmodel import Session, select
+
+from app import config
+from app.models.user import User
+from app.services import intern
+from app.services.intern import Interner
+from app.services.scoring import ARTIST_WEIGHT, GENRE_WEIGHT, AUDIO_WEIGHT, normalize_audio
+from app.services.taste import _id_chunks, load_packs
+from app.services.versions import data_versions, ingested_since
+
+
+class VocabSize:
+    # Stands in for the interners when an index is loaded from outside this
+    # process (shared memory, mapped file): scoring only needs len()
+    def __init__(self, n: int):
+        self.n = n
+
+    def __len__(self) -> int:
+        return self.n
+
+
+class CSRSets:
+    # Row i holds the sorted, de-duplicated ids of user i's set:
+    # indices[indptr[i]:indptr[i + 1]]
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray):
+        self.indptr = indptr
+        self.indices = indices
+        self.sizes = np.diff(indptr).astype(np.int32)
+
+    @classmethod
+    def from_rows(cls, rows: list[list[int]]) -> "CSRSets":
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        flat: list[int] = []
+        for i, r in enumerate(rows):
+            u = sorted(set(r))
+            flat.extend(u)
+            indptr[i + 1] = indptr[i] + len(u)
+        return cls(indptr, np.asarray(flat, dtype=np.int32))
+
+    def row(self, i: int) -> np.ndarray:
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def merged(self, old_pos: np.ndarray, new_rows: dict[int, list[int]]) -> "CSRSets":
+        # Row j is this set's row old_pos[j], or new_rows[j] where old_pos[j] is
+        # -1. Kept rows are copied with one vectorized gather, not rebuilt.
+        sets = {j: np.unique(np.asarray(r, dtype=np.int32)) for j, r in new_rows.items()}
+        sizes = np.zeros(len(old_pos), dtype=np.int64)
+        kept = np.flatnonzero(old_pos >= 0)
+        sizes[kept] = self.sizes[old_pos[kept]]
+        for j, r in sets.items():
+            sizes[j] = len(r)
+        indptr = np.zeros(len(old_pos) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=indptr[1:])
+        indices = np.empty(indptr[-1], dtype=np.int32)
+
+        lens = sizes[kept]
+        offs = np.zeros(len(kept) + 1, dtype=np.int64)
+        np.cumsum(lens, out=offs[1:])
+        step = np.arange(offs[-1])
+        src = np.repeat(self.indptr[old_pos[kept]] - offs[:-1], lens) + step
+        dst = np.repeat(indptr[kept] - offs[:-1], lens) + step
+        indices[dst] = self.indices[src]
+        for j, r in sets.items():
+            indices[indptr[j]:indptr[j + 1]] = r
+        return CSRSets(indptr, indices)
+
+    def intersect_counts(self, query: np.ndarray, vocab_size: int, rows: np.ndarray | None = None) -> np.ndarray:
+        # |row_i & query| for every row (or just `rows`): gather a membership mask,
+        # then bin the (sparse) hits back to their owning rows
+        mark = np.zeros(vocab_size + 1, dtype=np.uint8)
+        mark[query] = 1
+        if rows is None:
+            hits = np.flatnonzero(mark[self.indices])
+            owners = np.searchsorted(self.indptr, hits, side="right") - 1
+            return np.bincount(owners, minlength=len(self.sizes)).astype(np.int32)
+        lens = self.sizes[rows].astype(np.int64)
+        offs = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lens, out=offs[1:])
+        pos = np.repeat(self.indptr[rows] - offs[:-1], lens) + np.arange(offs[-1])
+        hits = np.flatnonzero(mark[self.indices[pos]])
+        owners = np.searchsorted(offs, hits, side="right") - 1
+        return np.bincount(owners, minlength=len(rows)).astype(np.int32)
+
+
+def _jaccard(inter: np.ndarray, size_a: int, sizes_b: np.ndarray) -> np.ndarray:
+    union = sizes_b.astype(np.int64) + size_a - inter
+    out = np.zeros(len(inter), dtype=np.float64)
+    nz = union > 0
+    out[nz] = inter[nz] / union[nz]
+    return out
+
+
+@dataclass
+class TasteScores:
+    # Arrays aligned with the index rows that were scored
+    score: np.ndarray
+    shared_artists: np.ndarray
+    genre_overlap: np.ndarray
+    audio_affinity: np.ndarray
+
+    def take(self, idx: np.ndarray) -> "TasteScores":
+        return TasteScores(self.score[idx], self.shared_artists[idx], self.genre_overlap[idx], self.audio_affinity[idx])
+
+
+class TasteIndex:
+    # (path, file identity) when the arrays are views over a mapped index file
+    source: tuple[str, tuple] | None = None
+
+    def __init__(
+        self,
+        user_ids: np.ndarray,
+        artists: CSRSets,
+        genres: CSRSets,
+        audio: np.ndarray,
+        artist_vocab: Interner,
+        genre_vocab: Interner,
+    ):
+        # user_ids is sorted ascending so lookups can use searchsorted
+        self.user_ids = user_ids
+        self.artists = artists
+        self.genres = genres
+        self.audio = audio  # (N, 6) float32, already normalized
+        self.artist_vocab = artist_vocab
+        self.genre_vocab = genre_vocab
+
+    @classmethod
+    def from_packs(cls, packs: dict[int, dict]) -> "TasteIndex":
+        user_ids = np.asarray(sorted(packs), dtype=np.int64)
+        # Column ids come from the process-wide interners, shared with fingerprints
+        artist_rows, genre_rows = [], []
+        audio = np.zeros((len(user_ids), 6), dtype=np.float32)
+        for i, uid in enumerate(user_ids.tolist()):
+            p = packs[uid]
+            artist_rows.append(intern.artists.intern_many(p["artists"]))
+            genre_rows.append(intern.genres.intern_many(p["genres"]))
+            audio[i] = p.get("audio_norm") or normalize_audio(p["audio"])
+        return cls(
+            user_ids,
+            CSRSets.from_rows(artist_rows),
+            CSRSets.from_rows(genre_rows),
+            audio,
+            intern.artists,
+            intern.genres,
+        )
+
+    def with_packs(self, packs: dict[int, dict]) -> "TasteIndex":
+        # Copy with these users' rows replaced (or inserted, in id order); every
+        # other row is carried over as is, so one ingest costs O(nnz) copying
+        # instead of a rebuild from SQL
+        user_ids = np.union1d(self.user_ids, np.asarray(sorted(packs), dtype=np.int64))
+        old_pos = self.rows_for(user_ids)
+        fresh = np.flatnonzero(np.isin(user_ids, list(packs)))
+        old_pos[fresh] = -1
+        artist_rows, genre_rows = {}, {}
+        audio = np.zeros((len(user_ids), 6), dtype=np.float32)
+        kept = np.flatnonzero(old_pos >= 0)
+        audio[kept] = self.audio[old_pos[kept]]
+        for j in fresh.tolist():
+            p = packs[int(user_ids[j])]
+            artist_rows[j] = self.artist_vocab.intern_many(p["artists"])
+            genre_rows[j] = self.genre_vocab.intern_many(p["genres"])
+            audio[j] = p.get("audio_norm") or normalize_audio(p["audio"])
+        return TasteIndex(
+            user_ids,
+            self.artists.merged(old_pos, artist_rows),
+            self.genres.merged(old_pos, genre_rows),
+            audio,
+            self.artist_vocab,
+            self.genre_vocab,
+        )
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def rows_for(self, user_ids: Iterable[int]) -> np.ndarray:
+        # Index rows for user ids; -1 where a user is not in the index
+        ids = np.asarray(list(user_ids), dtype=np.int64)
+        if not len(self.user_ids):
+            return np.full(len(ids), -1, dtype=np.int64)
+        pos = np.searchsorted(self.user_ids, ids)
+        pos = np.minimum(pos, len(self.user_ids) - 1)
+        return np.where(self.user_ids[pos] == ids, pos, -1)
+
+    def row(self, user_id: int) -> int:
+        return int(self.rows_for([user_id])[0])
+
+    def covers(self, user_ids: Iterable[int]) -> bool:
+        return bool((self.rows_for(user_ids) >= 0).all())
+
+    def score_rows(self, me_row: int, rows: np.ndarray | None = None) -> TasteScores:
+        # score() of user `me_row` against `rows` (all rows when None)
+        my_artists = self.artists.row(me_row)
+        my_genres = self.genres.row(me_row)
+        a_inter = self.artists.intersect_counts(my_artists, len(self.artist_vocab), rows)
+        g_inter = self.genres.intersect_counts(my_genres, len(self.genre_vocab), rows)
+        a_sizes, g_sizes, audio = self.artists.sizes, self.genres.sizes, self.audio
+        if rows is not None:
+            a_sizes, g_sizes, audio = a_sizes[rows], g_sizes[rows], audio[rows]
+        s_a = _jaccard(a_inter, len(my_artists), a_sizes)
+        s_g = _jaccard(g_inter, len(my_genres), g_sizes)
+        diff = audio.astype(np.float64) - self.audio[me_row].astype(np.float64)
+        dist = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+        s_f = np.clip(1.0 - dist / sqrt(audio.shape[1]), 0.0, 1.0)
+        total = ARTIST_WEIGHT * s_a + GENRE_WEIGHT * s_g + AUDIO_WEIGHT * s_f
+        return TasteScores(total, a_inter, s_g, s_f)
+
+    def top_k(
+        self,
+        me_row: int,
+        rows: np.ndarray,
+        k: int,
+        min_score: float | None = None,
+        after: tuple[float, int] | None = None,
+    ) -> list[tuple]:
+        # Best k of `rows` as (rounded score, -user_id, position in rows, terms),
+        # best first; ties go to the lower user id. `after` keeps only entries
+        # ranked strictly below that (score, user_id) keyset cursor.
+        # One vectorized pass scores every candidate and argpartition picks the
+        # winners; Python only touches the k entries returned.
+        if not len(rows) or k <= 0:
+            return []
+        if 2 * len(rows) >= len(self):
+            # Most of the index: the ungathered full pass is cheaper
+            res = self.score_rows(me_row).take(rows)
+        else:
+            res = self.score_rows(me_row, rows)
+        rounded = np.round(res.score, 4)
+        ids = self.user_ids[rows]
+        keep = np.ones(len(rows), dtype=bool)
+        if min_score is not None:
+            keep &= res.score >= float(min_score)
+        if after is not None:
+            keep &= (rounded < after[0]) | ((rounded == after[0]) & (ids > after[1]))
+        cand = np.flatnonzero(keep)
+        if len(cand) > k:
+            kth = np.partition(rounded[cand], len(cand) - k)[len(cand) - k]
+            cand = cand[rounded[cand] >= kth]
+        best = cand[np.lexsort((ids[cand], -rounded[cand]))][:k]
+        return [
+            (
+                float(rounded[j]), -int(ids[j]), j,
+                (float(res.score[j]), int(res.shared_artists[j]), float(res.genre_overlap[j]), float(res.audio_affinity[j])),
+            )
+            for j in best.tolist()
+        ]
+
+
+def build_taste_index(session: Session) -> TasteIndex:
+    packs = load_packs(session)
+    # Users without any taste data still get a (zero) row
+    for uid in session.exec(select(User.id)):
+        packs.setdefault(uid, {"artists": [], "genres": [], "audio": [0.0] * 6})
+    return TasteIndex.from_packs(packs)
+
+
+def _load_rows(session: Session, user_ids: list[int]) -> dict[int, dict]:
+    # build_taste_index's packs for just these users; unknown ids get no row
+    packs = load_packs(session, user_ids)
+    known = set()
+    for chunk in _id_chunks(sorted(packs)):
+        known.update(session.exec(select(User.id).where(User.id.in_(chunk))))
+    return {uid: p for uid, p in packs.items() if uid in known}
+
+
+# Moved rows are looked up from a little before the previous check: an ingest
+# stamps last_ingested_at before its transaction commits
+_SYNC_SLACK = timedelta(seconds=60)
+
+
+class _Tracked:
+    # An index plus the data_version each tracked row was loaded at, so rows
+    # re-ingested by other processes (API workers, python -m app.ingest) are
+    # reloaded the way explain and taste_snapshot re-key on versions
+    def __init__(self, index: TasteIndex, versions: dict[int, int], checked_at: datetime):
+        self.index = index
+        self.versions = versions
+        self.checked_at = checked_at
+
+    def load(self, session: Session, user_ids: list[int]) -> None:
+        # (Re)load these users' rows; versions are read first, so a change
+        # racing the load shows up as moved on the next sync
+        versions = data_versions(session, user_ids)
+        packs = _load_rows(session, user_ids)
+        if packs:
+            self.index = self.index.with_packs(packs)
+            self.versions.update((uid, versions[uid]) for uid in packs)
+
+    def sync(self, session: Session) -> None:
+        now = datetime.now(UTC)
+        if self.versions:
+            moved = ingested_since(session, self.checked_at - _SYNC_SLACK)
+            stale = [uid for uid, v in moved.items() if self.versions.get(uid, v) != v]
+            if stale:
+                self.load(session, stale)
+        self.checked_at = now
+
+    def add_missing(self, session: Session, user_ids: list[int]) -> None:
+        missing = [uid for uid, row in zip(user_ids, self.index.rows_for(user_ids).tolist()) if row < 0]
+        if missing:
+            self.load(session, missing)
+
+
+def _build(session: Session) -> _Tracked:
+    checked_at = datetime.now(UTC)
+    versions = data_versions(session, None)
+    index = build_taste_index(session)
+    return _Tracked(index, {uid: versions.get(uid, 0) for uid in index.user_ids.tolist()}, checked_at)
+
+
+_lock = threading.Lock()
+_live: _Tracked | None = None
+# (mapped file generation, that generation plus rows for users created since;
+# only those extra rows are tracked, the file's own rows stay as built)
+_overlay: tuple[TasteIndex, _Tracked] | None = None
+
+
+def get_taste_index(session: Session, user_ids: Iterable[int] = (), mapped: bool = True) -> TasteIndex:
+    # Prefer the memory-mapped offline build when one is configured (unless the
+    # caller needs live data, mapped=False); otherwise build lazily after
+    # invalidation. Rows whose data_version moved are reloaded and users the
+    # index has not seen are added, both without a rebuild.
+    global _live, _overlay
+    ids = list(user_ids)
+    if mapped and config.TASTE_INDEX_PATH:
+        from app.services.index_file import mapped_index
+        base = mapped_index(config.TASTE_INDEX_PATH)
+        if base is not None:
+            with _lock:
+                if _overlay is None or _overlay[0] is not base:
+                    _overlay = (base, _Tracked(base, {}, datetime.now(UTC)))
+                tracked = _overlay[1]
+                tracked.sync(session)
+                tracked.add_missing(session, ids)
+                return tracked.index
+    with _lock:
+        if _live is None:
+            _live = _build(session)
+        else:
+            _live.sync(session)
+        _live.add_missing(session, ids)
+        return _live.index
+
+
+async def get_taste_index_async(user_ids: Iterable[int] = ()) -> TasteIndex:
+    # For async routes: a cache hit costs a thread hop, a rebuild runs its SQL
+    # and numpy work off the event loop on a sync session of its own
+    from app.db import engine
+    ids = list(user_ids)
+
+    def get():
+        with Session(engine) as session:
+            return get_taste_index(session, ids)
+    return await asyncio.to_thread(get)
+
+
+def update_taste_index(session: Session, user_ids: Iterable[int]) -> None:
+    # Reload just these users after their data changed: in the in-memory index
+    # (with none built yet the next reader builds a fresh one) and, for users
+    # the mapped file predates, in its overlay. Rows the file itself holds stay
+    # as built until the next offline build.
+    ids = list(user_ids)
+    with _lock:
+        if _live is not None:
+            _live.load(session, ids)
+        if _overlay is not None:
+            base, tracked = _overlay
+            extra = [uid for uid in ids if base.row(uid) < 0]
+            if extra:
+                tracked.load(session, extra)
+
+
+def invalidate_taste_index() -> None:
+    global _live, _overlay
+    _live = None
+    _overlay = None
@@ -0,0 +1,74 @@
+# app/services/taste_snapshot.py
+# Immutable per-user taste snapshots (artists, genres, audio, plus interned
+# fingerprints) in a bounded LRU with a TTL. Entries are keyed by user and
+# stamped with the user's data_version, so a bump from ingest is a miss even
+# before the TTL runs out; between ingests hot users are never reloaded.
+from typing import Iterable
+
+from sqlmodel import Session
+
+from app.config import TASTE_SNAPSHOT_CACHE_SIZE, TASTE_SNAPSHOT_TTL
+from app.services.intern import fingerprint_pack
+from app.services.lru import LRU
+from app.services.scoring import normalize_audio
+from app.services.taste import load_packs
+from app.services.versions import data_versions
+
+
+class TasteSnapshot:
+    __slots__ = ("user_id", "data_version", "artists", "genres", "audio", "audio_norm", "artist_fp", "genre_fp")
+
+    def __init__(self, user_id: int, data_version: int, pack: dict):
+        fp = fingerprint_pack(pack)
+        init = object.__setattr__
+        init(self, "user_id", user_id)
+        init(self, "data_version", data_version)
+        init(self, "artists", tuple(pack["artists"]))  # rank order
+        init(self, "genres", frozenset(pack["genres"]))
+        init(self, "audio", tuple(pack["audio"]))
+        init(self, "audio_norm", tuple(pack.get("audio_norm") or normalize_audio(pack["audio"])))
+        init(self, "artist_fp", fp["artists"])
+        init(self, "genre_fp", fp["genres"])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TasteSnapshot is immutable")
+
+    def pack(self) -> dict:
+        # Scoring pack for score(): fingerprints and the pre-normalized audio
+        return {"artists": self.artist_fp, "genres": self.genre_fp, "audio": self.audio, "audio_norm": self.audio_norm}
+
+
+cache = LRU(TASTE_SNAPSHOT_CACHE_SIZE, ttl=TASTE_SNAPSHOT_TTL)
+
+
+def get_snapshots(
+    session: Session,
+    user_ids: Iterable[int],
+    versions: dict[int, int] | None = None,
+    packs: dict[int, dict] | None = None,
+) -> dict[int, TasteSnapshot]:
+    # Cached snapshots at the users' current data_version; misses load in bulk,
+    # or are built from `packs` when the caller has already loaded them
+    ids = sorted(set(user_ids))
+    if versions is None or not set(ids) <= set(versions):
+        versions = data_versions(session, ids)
+    out: dict[int, TasteSnapshot] = {}
+    missing = []
+    for uid in ids:
+        snap = cache.get(uid)
+        if snap is not None and snap.data_version == versions[uid]:
+            out[uid] = snap
+        else:
+            missing.append(uid)
+    if missing:
+        if packs is None or not set(missing) <= set(packs):
+            packs = load_packs(session, missing)
+        for uid in missing:
+            pack = packs[uid]
+            snap = out[uid] = TasteSnapshot(uid, versions[uid], pack)
+            cache.put(uid, snap)
+    return out
+
+
+def snapshot() -> dict:
+    return cache.stats()
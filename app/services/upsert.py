@@ -0,0 +1,37 @@
+# app/services/upsert.py
+# Dialect-aware bulk INSERT ... ON CONFLICT for SQLite and Postgres.
+from sqlalchemy import tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, delete
+
+_BATCH = 500
+
+
+def bulk_upsert(session: Session, model, rows: list[dict], key_cols: list[str], update: bool = True) -> None:
+    if not rows:
+        return
+    dialect = session.get_bind().dialect.name
+    if dialect not in ("sqlite", "postgresql"):
+        # Portable (slow) path for other backends
+        for r in rows:
+            session.merge(model(**r))
+        return
+    insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+    table = model.__table__
+    for i in range(0, len(rows), _BATCH):
+        stmt = insert(table).values(rows[i:i + _BATCH])
+        value_cols = [c for c in rows[0] if c not in key_cols]
+        if update and value_cols:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=key_cols,
+                set_={c: stmt.excluded[c] for c in value_cols},
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=key_cols)
+        session.execute(stmt)
+
+
+def bulk_delete(session: Session, model, key_cols: list[str], keys: list[tuple]) -> None:
+    cols = [getattr(model, c) for c in key_cols]
+    for i in range(0, len(keys), _BATCH):
+        session.exec(delete(model).where(tuple_(*cols).in_(keys[i:i + _BATCH])))
@@ -0,0 +1,35 @@
+# app/services/versions.py
+# Per-user data versions: ingest bumps them when stored taste data changes,
+# and caches of derived results key on them instead of tracking invalidation.
+from datetime import datetime
+from typing import Iterable
+
+from sqlmodel import Session, select
+
+from app.models.ingest import UserSyncState
+from app.services.taste import _select_for
+
+
+def sync_state(session: Session, user_id: int) -> UserSyncState:
+    return session.get(UserSyncState, user_id) or UserSyncState(user_id=user_id)
+
+
+def bump_data_version(state: UserSyncState) -> None:
+    state.data_version = (state.data_version or 0) + 1
+
+
+def data_versions(session: Session, user_ids: Iterable[int] | None) -> dict[int, int]:
+    # Users that were never ingested are at version 0; None means every user
+    # with a sync state
+    ids = sorted(set(user_ids)) if user_ids is not None else None
+    out = {uid: 0 for uid in ids} if ids is not None else {}
+    stmt = select(UserSyncState.user_id, UserSyncState.data_version)
+    for q in _select_for(stmt, UserSyncState.user_id, ids):
+        out.update(session.exec(q).all())
+    return out
+
+
+def ingested_since(session: Session, since: datetime) -> dict[int, int]:
+    # data_version of every user ingested at or after `since` (indexed read)
+    q = select(UserSyncState.user_id, UserSyncState.data_version).where(UserSyncState.last_ingested_at >= since)
+    return dict(session.exec(q).all())
@@ -24,3 +24,20 @@ def client(test_env):
     from app.main import app
     with TestClient(app) as c:
         yield c
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    # Process-resident caches must not leak state between tests that seed the DB directly
+    from app.services.taste_index import invalidate_taste_index
+    from app.services.ann import invalidate_ann_index
+    from app.services.audio_features import lru
+    from app.services.match_pages import snapshots
+    from app.services import explain, taste_snapshot
+    invalidate_taste_index()
+    invalidate_ann_index()
+    lru.clear()
+    snapshots.clear()
+    explain.cache.clear()
+    taste_snapshot.cache.clear()
+    yield
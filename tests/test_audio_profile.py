@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+
+def _feats(ids, seed=0):
+    rng = random.Random(seed)
+    return {
+        i: {"tempo": rng.uniform(60, 200), "energy": rng.random(), "valence": rng.random(),
+            "danceability": rng.random(), "acousticness": rng.random(), "loudness": rng.uniform(-30, 0)}
+        for i in ids
+    }
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_incremental_centroid_matches_full_recompute(monkeypatch, weighted):
+    from app import config
+    from app.services.audio_profile import update_term_profile, raw_centroid, normalized_vector
+    from app.services.scoring import normalize_audio
+
+    monkeypatch.setattr(config, "AUDIO_RANK_WEIGHTED", weighted)
+    feats = _feats([f"t{i}" for i in range(60)])
+    old = {f"t{i}": i + 1 for i in range(50)}
+    prof = update_term_profile(None, 1, "medium", {}, old, feats)
+
+    # Two tracks leave, two enter, one moves up
+    new = dict(old)
+    del new["t3"], new["t40"]
+    new["t55"], new["t56"] = 3, 40
+    new["t10"] = 2
+    prof = update_term_profile(prof, 1, "medium", old, new, feats)
+    full = update_term_profile(None, 1, "medium", {}, new, feats)
+
+    assert prof.track_count == full.track_count == 50
+    assert raw_centroid(prof) == pytest.approx(raw_centroid(full))
+    assert normalized_vector(prof) == pytest.approx(normalize_audio(raw_centroid(full)))
+
+
+def test_switching_rank_weighting_rebuilds_the_sums(monkeypatch):
+    from app import config
+    from app.services.audio_profile import update_term_profile, raw_centroid
+
+    feats = _feats([f"t{i}" for i in range(60)], seed=2)
+    old = {f"t{i}": i + 1 for i in range(50)}
+    monkeypatch.setattr(config, "AUDIO_RANK_WEIGHTED", False)
+    prof = update_term_profile(None, 1, "medium", {}, old, feats)
+
+    # One track swapped, but under the other weighting mode
+    new = dict(old)
+    del new["t7"]
+    new["t57"] = 8
+    monkeypatch.setattr(config, "AUDIO_RANK_WEIGHTED", True)
+    prof = update_term_profile(prof, 1, "medium", old, new, feats)
+    full = update_term_profile(None, 1, "medium", {}, new, feats)
+
+    assert prof.rank_weighted is True
+    assert prof.weight_sum == pytest.approx(full.weight_sum)
+    assert raw_centroid(prof) == pytest.approx(raw_centroid(full))
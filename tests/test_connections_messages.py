@@ -38,3 +38,26 @@ def test_connections_flow_and_messaging(client):
     th = client.get(f"/messages/{a_id}?other_id={b_id}").json()
     assert any(m["content"] == "hello" for m in th)
 
+
+
+def test_conversations_list_last_message_per_counterpart(client):
+    from app.db import engine
+    from app.models.user import User, ConnectionRequest
+
+    with Session(engine) as s:
+        a, b, c = (User(spotify_id=f"cv{i}", display_name=f"Conv {i}") for i in range(3))
+        s.add(a); s.add(b); s.add(c); s.commit()
+        a_id, b_id, c_id = a.id, b.id, c.id
+        s.add(ConnectionRequest(from_user_id=a_id, to_user_id=b_id, status="accepted"))
+        s.add(ConnectionRequest(from_user_id=c_id, to_user_id=a_id, status="accepted"))
+        s.commit()
+
+    for frm, to, text in ((a_id, b_id, "first"), (b_id, a_id, "second"), (c_id, a_id, "hey")):
+        assert client.post(f"/messages?from_user_id={frm}&to_user_id={to}&content={text}").status_code == 200
+    assert client.post(f"/messages?from_user_id={b_id}&to_user_id={c_id}&content=x").status_code == 403
+
+    convs = client.get(f"/messages/conversations?user_id={a_id}").json()
+    assert {c["user_id"]: (c["display_name"], c["last_message"]) for c in convs} == {
+        b_id: ("Conv 1", "second"),
+        c_id: ("Conv 2", "hey"),
+    }
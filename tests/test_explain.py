@@ -45,3 +45,68 @@ def test_explain_endpoint_returns_breakdown(client):
     assert data["summary"]["shared_artists_count"] == 1
     assert any(itm["id"] == "t1" for itm in data["icebreaker_tracks"])  # a2 track shows up
     assert data["summary"]["score"] > 0
+
+
+def test_explain_is_cached_until_a_data_version_bump(client):
+    from app.db import engine
+    from app.models.user import User
+    from app.models.music import UserArtist
+    from app.services import explain
+    from app.services.versions import sync_state, bump_data_version
+    from app.services.genres import backfill_user_genres
+
+    with Session(engine) as s:
+        u1 = User(spotify_id="ec1", display_name="Cache One")
+        u2 = User(spotify_id="ec2", display_name="Cache Two")
+        s.add(u1); s.add(u2); s.commit()
+        u1_id, u2_id = u1.id, u2.id
+        s.add(UserArtist(user_id=u1_id, term="medium", artist_id="ec_a", artist_name="A", genres="dub", popularity=1, rank=1))
+        s.add(UserArtist(user_id=u2_id, term="medium", artist_id="ec_a", artist_name="A", genres="dub", popularity=1, rank=1))
+        s.commit()
+        backfill_user_genres(s)
+
+    url = f"/matches/explain?user_id={u1_id}&other_id={u2_id}"
+    first = client.get(url).json()
+    assert first["shared_genres"] == [{"genre": "dub", "me_count": 1, "other_count": 1}]
+    misses = explain.cache.misses
+    assert client.get(url).json() == first
+    assert explain.cache.misses == misses
+
+    with Session(engine) as s:
+        state = sync_state(s, u2_id)
+        bump_data_version(state)
+        s.add(state); s.commit()
+    client.get(url)
+    assert explain.cache.misses == misses + 1
+
+
+def test_explain_scores_from_the_rows_it_loaded(client, monkeypatch):
+    from app.db import engine
+    from app.models.user import User
+    from app.models.music import UserArtist, UserAudioProfile
+    from app.services import taste_snapshot
+    from app.services.genres import backfill_user_genres
+    from app.services.scoring import score
+
+    with Session(engine) as s:
+        u1 = User(spotify_id="es1", display_name="Single One")
+        u2 = User(spotify_id="es2", display_name="Single Two")
+        s.add(u1); s.add(u2); s.commit()
+        u1_id, u2_id = u1.id, u2.id
+        s.add(UserArtist(user_id=u1_id, term="medium", artist_id="es_a", artist_name="A", genres="dub,ska", popularity=1, rank=1))
+        s.add(UserArtist(user_id=u1_id, term="medium", artist_id="es_b", artist_name="B", genres="ska", popularity=1, rank=2))
+        s.add(UserArtist(user_id=u2_id, term="medium", artist_id="es_a", artist_name="A", genres="dub,ska", popularity=1, rank=1))
+        s.add(UserAudioProfile(user_id=u1_id, tempo=100, energy=0.5, valence=0.4, danceability=0.6, acousticness=0.2, loudness=-8))
+        s.commit()
+        backfill_user_genres(s)
+        expected = taste_snapshot.load_packs(s, [u1_id, u2_id])
+
+    # A snapshot miss is filled from explain's own rows, not a second load
+    def no_reload(*args, **kwargs):
+        raise AssertionError("taste packs loaded twice")
+
+    monkeypatch.setattr(taste_snapshot, "load_packs", no_reload)
+    summary = client.get(f"/matches/explain?user_id={u1_id}&other_id={u2_id}").json()["summary"]
+    assert summary["score"] == round(score(expected[u1_id], expected[u2_id]), 4)
+    assert summary["shared_artists_count"] == 1
+    assert taste_snapshot.cache.get(u1_id).genres == frozenset(expected[u1_id]["genres"])
@@ -0,0 +1,250 @@
+import asyncio
+from datetime import timedelta
+
+from sqlmodel import Session, select
+
+
+def _fake_spotify(monkeypatch, fail_kind=None, delay=0.05):
+    import app.services.ingest as ingest
+
+    calls = {"active": 0, "peak": 0}
+
+    async def fake_token(user_id, session):
+        return "tok"
+
+    async def fake_top(token, kind, term):
+        calls["active"] += 1
+        calls["peak"] = max(calls["peak"], calls["active"])
+        await asyncio.sleep(delay)
+        calls["active"] -= 1
+        if kind == fail_kind:
+            raise RuntimeError("spotify down")
+        if kind == "artists":
+            return [{"id": f"{term}_ar1", "name": "Ar1", "genres": ["dub", "techno"], "popularity": 5}]
+        return [{"id": f"{term}_tr1", "name": "Tr1", "artists": [{"id": f"{term}_ar1"}], "popularity": 5}]
+
+    async def fake_features(token, ids):
+        calls.setdefault("feature_ids", []).extend(ids)
+        return [{"id": i, "tempo": 120, "energy": 0.5, "valence": 0.5, "danceability": 0.5, "acousticness": 0.5, "loudness": -8} for i in ids]
+
+    import app.services.audio_features as audio_features
+    monkeypatch.setattr(ingest, "ensure_token", fake_token)
+    monkeypatch.setattr(ingest, "get_top", fake_top)
+    monkeypatch.setattr(audio_features, "get_audio_features", fake_features)
+    return calls
+
+
+def _wait_for_job(client, job_id):
+    import time
+
+    for _ in range(200):
+        job = client.get(f"/ingest/jobs/{job_id}").json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def _seed_user(spotify_id):
+    from app.db import engine
+    from app.models.user import User
+
+    with Session(engine) as s:
+        u = User(spotify_id=spotify_id, display_name=spotify_id)
+        s.add(u); s.commit()
+        return u.id
+
+
+def test_ingest_fetches_concurrently_and_writes(client, monkeypatch):
+    from app.db import engine
+    from app.models.music import UserArtist, UserGenreSummary, UserAudioProfile
+
+    calls = _fake_spotify(monkeypatch)
+    uid = _seed_user("ing1")
+    r = client.get(f"/ingest/spotify?user_id={uid}")
+    assert r.status_code == 200
+    assert _wait_for_job(client, r.json()["job_id"])["status"] == "done"
+    assert calls["peak"] > 1
+
+    with Session(engine) as s:
+        artists = s.exec(select(UserArtist).where(UserArtist.user_id == uid)).all()
+        assert {a.term for a in artists} == {"short", "medium", "long"}
+        genres = s.exec(select(UserGenreSummary).where(UserGenreSummary.user_id == uid, UserGenreSummary.term == "medium")).all()
+        assert sorted(g.genre for g in genres) == ["dub", "techno"]
+        assert s.get(UserAudioProfile, uid).tempo == 120
+
+
+
+def test_first_ingest_without_data_still_scores_the_user(client, monkeypatch):
+    from app.db import engine
+    from app.models.match import UserMatchState
+    import app.services.ingest as ingest
+
+    _fake_spotify(monkeypatch)
+
+    async def no_tops(token, kind, term):
+        return []
+    monkeypatch.setattr(ingest, "get_top", no_tops)
+    uid = _seed_user("ing_empty")
+    job = _wait_for_job(client, client.get(f"/ingest/spotify?user_id={uid}").json()["job_id"])
+    assert job["result"]["changed"] is False
+    with Session(engine) as s:
+        assert s.get(UserMatchState, uid) is not None
+
+def test_ingest_partial_failure_keeps_existing_data(client, monkeypatch):
+    from app.db import engine
+    from app.models.music import UserArtist
+
+    _fake_spotify(monkeypatch)
+    uid = _seed_user("ing2")
+    job = _wait_for_job(client, client.get(f"/ingest/spotify?user_id={uid}").json()["job_id"])
+    assert job["status"] == "done"
+
+    _fake_spotify(monkeypatch, fail_kind="tracks")
+    job = _wait_for_job(client, client.get(f"/ingest/spotify?user_id={uid}").json()["job_id"])
+    assert job["status"] == "failed"
+    assert "spotify down" in job["error"]
+
+    with Session(engine) as s:
+        assert len(s.exec(select(UserArtist).where(UserArtist.user_id == uid)).all()) == 3
+
+
+def test_ingest_dedups_in_flight_jobs_per_user(client, monkeypatch):
+    _fake_spotify(monkeypatch, delay=0.2)
+    uid = _seed_user("ing3")
+    first = client.get(f"/ingest/spotify?user_id={uid}").json()
+    second = client.get(f"/ingest/spotify?user_id={uid}").json()
+    assert first["job_id"] == second["job_id"]
+    assert _wait_for_job(client, first["job_id"])["status"] == "done"
+    assert client.get("/ingest/jobs/nope").status_code == 404
+
+
+def test_reingest_applies_only_the_diff(client, monkeypatch):
+    from app.db import engine
+    from app.models.music import UserArtist
+
+    _fake_spotify(monkeypatch)
+    uid = _seed_user("ing4")
+    first = _wait_for_job(client, client.get(f"/ingest/spotify?user_id={uid}").json()["job_id"])
+    assert first["result"] == {"ok": True, "changed": True}
+    again = _wait_for_job(client, client.get(f"/ingest/spotify?user_id={uid}").json()["job_id"])
+    assert again["result"] == {"ok": True, "changed": False}
+
+    import app.services.ingest as ingest
+    original = ingest.get_top
+
+    async def renamed_artist(token, kind, term):
+        items = await original(token, kind, term)
+        if kind == "artists" and term == "short":
+            return [{"id": "short_ar2", "name": "Ar2", "genres": [], "popularity": 1}]
+        return items
+
+    monkeypatch.setattr(ingest, "get_top", renamed_artist)
+    third = _wait_for_job(client, client.get(f"/ingest/spotify?user_id={uid}").json()["job_id"])
+    assert third["result"]["changed"] is True
+    with Session(engine) as s:
+        short = s.exec(select(UserArtist).where(UserArtist.user_id == uid, UserArtist.term == "short")).all()
+        assert [a.artist_id for a in short] == ["short_ar2"]
+
+
+def test_batch_ingest_runs_and_resumes(client, monkeypatch):
+    from app.db import engine
+    from app.models.ingest import IngestRunItem
+    from app.services import batch_ingest
+
+    _fake_spotify(monkeypatch, delay=0)
+    ids = [_seed_user(f"batch{i}") for i in range(3)]
+    r = client.post("/ingest/batch", json={"user_ids": ids, "workers": 2})
+    assert r.status_code == 200
+    job = _wait_for_job(client, r.json()["job_id"])
+    assert job["status"] == "done"
+    assert job["result"]["processed"] == 3
+    assert client.get(f"/ingest/batch/{r.json()['run_id']}").json()["done"] == 3
+
+    # Freshly ingested users are not stale
+    with Session(engine) as s:
+        stale = batch_ingest.select_stale_users(s, timedelta(hours=1))
+    assert not set(ids) & set(stale)
+
+    # A resumed run only touches items still pending
+    with Session(engine) as s:
+        run = batch_ingest.create_run(s, ids)
+        run_id = run.id
+        item = s.get(IngestRunItem, (run_id, ids[0]))
+        item.status = "done"
+        s.add(item); s.commit()
+    r = client.post(f"/ingest/batch/{run_id}/resume")
+    job = _wait_for_job(client, r.json()["job_id"])
+    assert job["result"]["processed"] == 2
+    assert client.get(f"/ingest/batch/{run_id}").json()["status"] == "done"
+
+
+
+def test_batch_ingest_dedupes_and_rejects_unknown_users(client, monkeypatch):
+    _fake_spotify(monkeypatch, delay=0)
+    uid = _seed_user("batchdup")
+    r = client.post("/ingest/batch", json={"user_ids": [uid, uid, uid]})
+    assert r.status_code == 200
+    assert r.json()["total"] == 1
+    _wait_for_job(client, r.json()["job_id"])
+
+    # Ids are checked in chunks (SQLite caps bound variables per statement)
+    monkeypatch.setattr("app.services.taste._IN_CHUNK", 1)
+    r = client.post("/ingest/batch", json={"user_ids": [uid, 999999]})
+    assert r.status_code == 404
+    assert r.json()["detail"] == "Unknown user ids: 999999"
+
+def test_recent_sync_is_incremental_and_deduplicated(client, monkeypatch):
+    from datetime import datetime, UTC
+    from app.db import engine
+    from app.models.music import RecentTrack
+    import app.services.ingest as ingest
+
+    _fake_spotify(monkeypatch)
+    now = datetime.now(UTC)
+    history = [  # newest first, like Spotify
+        {"track": {"id": f"rt{i}", "name": f"RT{i}", "artists": [{"id": "ra"}]},
+         "played_at": now.replace(microsecond=0, second=i).strftime("%Y-%m-%dT%H:%M:%S.000Z")}
+        for i in (3, 2, 1)
+    ]
+    seen_after = []
+
+    async def fake_recent(token, limit=50, after=None):
+        seen_after.append(after)
+        if after is None:
+            return history[1:]
+        return [h for h in history if ingest._played_at_ms(h["played_at"]) > after]
+
+    monkeypatch.setattr(ingest, "get_recently_played", fake_recent)
+    uid = _seed_user("recent1")
+    first = _wait_for_job(client, client.get(f"/ingest/spotify/recent?user_id={uid}").json()["job_id"])
+    assert first["result"]["count"] == 2
+    second = _wait_for_job(client, client.get(f"/ingest/spotify/recent?user_id={uid}").json()["job_id"])
+    assert second["result"]["count"] == 1
+    assert seen_after[0] is None and seen_after[1] == ingest._played_at_ms(history[1]["played_at"])
+
+    with Session(engine) as s:
+        rows = s.exec(select(RecentTrack).where(RecentTrack.user_id == uid)).all()
+    assert sorted(r.track_id for r in rows) == ["rt1", "rt2", "rt3"]
+
+
+async def test_audio_features_cache_fetches_only_missing_ids(test_env, monkeypatch):
+    from app.db import init_db
+    import app.services.audio_features as audio_features
+
+    init_db()
+    asked = []
+
+    async def fake_features(token, ids):
+        asked.append(list(ids))
+        return [{"id": i, "tempo": 100, "energy": 0.1, "valence": 0.2, "danceability": 0.3, "acousticness": 0.4, "loudness": -5} for i in ids]
+
+    monkeypatch.setattr(audio_features, "get_audio_features", fake_features)
+    first = await audio_features.cached_audio_features("tok", ["af1", "af2"])
+    assert set(first) == {"af1", "af2"}
+    audio_features.lru.clear()  # force the DB layer
+    second = await audio_features.cached_audio_features("tok", ["af2", "af3"])
+    assert set(second) == {"af2", "af3"}
+    assert asked == [["af1", "af2"], ["af3"]]
+    await audio_features.cached_audio_features("tok", ["af1", "af3"])
+    assert len(asked) == 2
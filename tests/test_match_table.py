@@ -0,0 +1,192 @@
+from sqlmodel import Session
+
+
+def test_precomputed_matches_agree_with_live_scoring(client):
+    from app.db import engine
+    from app.models.user import User
+    from app.models.music import UserArtist, UserAudioProfile, UserGenreSummary
+    from app.services.match_table import refresh_user_matches
+    from app.services.genres import backfill_user_genres
+
+    with Session(engine) as s:
+        me = User(spotify_id="mt_me", display_name="MT Me", country="MT")
+        u1 = User(spotify_id="mt1", display_name="MT One", country="MT")
+        u2 = User(spotify_id="mt2", display_name="MT Two", country="MT")
+        s.add(me); s.add(u1); s.add(u2); s.commit()
+        me_id, u1_id, u2_id = me.id, u1.id, u2.id
+        s.add(UserArtist(user_id=me_id, term="medium", artist_id="m1", artist_name="M1", genres="dub", popularity=1, rank=1))
+        s.add(UserArtist(user_id=u1_id, term="medium", artist_id="m1", artist_name="M1", genres="dub", popularity=1, rank=1))
+        s.add(UserArtist(user_id=u2_id, term="medium", artist_id="m2", artist_name="M2", genres="folk", popularity=1, rank=1))
+        s.add(UserGenreSummary(user_id=u1_id, term="medium", genre="dub", count=1))
+        s.add(UserGenreSummary(user_id=u2_id, term="medium", genre="folk", count=1))
+        s.add(UserAudioProfile(user_id=me_id, tempo=120, energy=0.5, valence=0.5, danceability=0.5, acousticness=0.5, loudness=-10))
+        s.add(UserAudioProfile(user_id=u2_id, tempo=90, energy=0.2, valence=0.4, danceability=0.3, acousticness=0.8, loudness=-20))
+        s.commit()
+        backfill_user_genres(s)
+
+    live = client.get(f"/matches?user_id={me_id}&country=MT").json()
+    with Session(engine) as s:
+        refresh_user_matches(s, me_id)
+    precomputed = client.get(f"/matches?user_id={me_id}&country=MT").json()
+    assert precomputed == live
+    assert [m["user_id"] for m in precomputed] == [u1_id, u2_id]
+
+    # Filters are applied on top of the range read
+    r = client.get(f"/matches?user_id={me_id}&country=MT&has_genres=folk").json()
+    assert [m["user_id"] for m in r] == [u2_id]
+    r = client.get(f"/matches?user_id={me_id}&country=MT&min_shared_artists=1").json()
+    assert [m["user_id"] for m in r] == [u1_id]
+
+    # Blocks in either direction hide the row
+    client.post(f"/users/{me_id}/block?user_id={u1_id}")
+    r = client.get(f"/matches?user_id={me_id}&country=MT").json()
+    assert [m["user_id"] for m in r] == [u2_id]
+
+
+def test_live_rescoring_and_new_users_with_a_mapped_index_file(client, tmp_path, monkeypatch):
+    from sqlmodel import select
+    from app import config
+    from app.db import engine
+    from app.models.match import UserMatch
+    from app.models.user import User
+    from app.models.music import UserArtist
+    from app.services import taste_index
+    from app.services.genres import backfill_user_genres
+    from app.services.index_file import write_index
+    from app.services.match_table import refresh_user_matches
+
+    with Session(engine) as s:
+        me = User(spotify_id="mf_me", display_name="MF Me", country="MF")
+        u1 = User(spotify_id="mf1", display_name="MF One", country="MF")
+        s.add(me); s.add(u1); s.commit()
+        me_id, u1_id = me.id, u1.id
+        s.add(UserArtist(user_id=me_id, term="medium", artist_id="f1", artist_name="F1", genres="dub", popularity=1, rank=1))
+        s.commit()
+        backfill_user_genres(s)
+        path = str(tmp_path / "taste.idx")
+        write_index(taste_index.build_taste_index(s), path)
+    monkeypatch.setattr(config, "TASTE_INDEX_PATH", path)
+
+    # u1 picks up a shared artist after the file was built: rescoring sees it
+    with Session(engine) as s:
+        s.add(UserArtist(user_id=u1_id, term="medium", artist_id="f1", artist_name="F1", genres="dub", popularity=1, rank=1))
+        s.commit()
+        backfill_user_genres(s)
+        taste_index.update_taste_index(s, [u1_id])
+        refresh_user_matches(s, me_id)
+        row = s.exec(select(UserMatch).where(UserMatch.user_id == me_id, UserMatch.other_id == u1_id)).one()
+    assert row.shared_artists_count == 1
+
+    # A user the file predates is added on top of the mapped rows, no rebuild
+    def no_rebuild(session):
+        raise AssertionError("full rebuild")
+    monkeypatch.setattr(taste_index, "build_taste_index", no_rebuild)
+    with Session(engine) as s:
+        u2 = User(spotify_id="mf2", display_name="MF Two", country="MF")
+        s.add(u2); s.commit()
+        u2_id = u2.id
+        s.add(UserArtist(user_id=u2_id, term="medium", artist_id="f1", artist_name="F1", genres="dub", popularity=1, rank=1))
+        s.commit()
+        backfill_user_genres(s)
+        index = taste_index.get_taste_index(s, [me_id, u2_id])
+    assert index.covers([me_id, u1_id, u2_id])
+    res = index.score_rows(index.row(me_id))
+    assert res.shared_artists[index.row(u2_id)] == 1
+    assert res.shared_artists[index.row(u1_id)] == 0  # the file's row, as built
+
+
+def test_rescoring_uses_rows_ingested_by_other_processes(client):
+    from datetime import datetime, UTC
+    from sqlmodel import select
+    from app.db import engine
+    from app.models.match import UserMatch
+    from app.models.user import User
+    from app.models.music import UserArtist
+    from app.services.genres import backfill_user_genres
+    from app.services.match_table import refresh_user_matches
+    from app.services.versions import sync_state, bump_data_version
+
+    with Session(engine) as s:
+        x = User(spotify_id="xp_x", display_name="XP X")
+        b = User(spotify_id="xp_b", display_name="XP B")
+        s.add(x); s.add(b); s.commit()
+        x_id, b_id = x.id, b.id
+        s.add(UserArtist(user_id=x_id, term="medium", artist_id="xp1", artist_name="XP1", genres="dub", popularity=1, rank=1))
+        s.commit()
+        backfill_user_genres(s)
+        refresh_user_matches(s, x_id)  # this process now holds b's (empty) row
+
+        # b is re-ingested and rescored by another process...
+        s.add(UserArtist(user_id=b_id, term="medium", artist_id="xp1", artist_name="XP1", genres="dub", popularity=1, rank=1))
+        state = sync_state(s, b_id)
+        state.last_ingested_at = datetime.now(UTC)
+        bump_data_version(state)
+        s.add(state); s.commit()
+        backfill_user_genres(s)
+
+        # ...so rescoring x here must not write b's old data back
+        refresh_user_matches(s, x_id)
+        pair = s.exec(select(UserMatch).where(UserMatch.user_id == x_id, UserMatch.other_id == b_id)).one()
+    assert pair.shared_artists_count == 1
+
+
+def test_match_table_keeps_each_users_best_and_pages_past_them_live(client, monkeypatch):
+    import random
+    import numpy as np
+    from sqlmodel import select
+    from app import config
+    from app.db import engine
+    from app.models.match import UserMatch, UserMatchState
+    from app.models.user import User
+    from app.models.music import UserArtist
+    from app.services import taste_index
+    from app.services.genres import backfill_user_genres
+    from app.services.match_table import refresh_user_matches
+
+    rng = random.Random(9)
+    with Session(engine) as s:
+        users = [User(spotify_id=f"tm{i}", display_name=f"TM {i}", country="TM") for i in range(25)]
+        s.add_all(users); s.commit()
+        ids = [u.id for u in users]
+        for uid in ids:
+            for rank, aid in enumerate(rng.sample(range(8), rng.randint(0, 5)), start=1):
+                s.add(UserArtist(user_id=uid, term="medium", artist_id=f"tm{aid}", artist_name="TM", genres="", popularity=1, rank=rank))
+        s.commit()
+        backfill_user_genres(s)
+
+    me = ids[0]
+    monkeypatch.setattr(config, "MATCH_TABLE_SIZE", 6)
+
+    def check_lists(s):
+        # Every stored list is exactly the owner's matches above its floor
+        index = taste_index.get_taste_index(s, ids, mapped=False)
+        for owner in ids:
+            floor = s.get(UserMatchState, owner).score_floor
+            stored = {m.other_id for m in s.exec(select(UserMatch).where(UserMatch.user_id == owner))}
+            res = index.score_rows(index.row(owner))
+            want = {o for o in ids if o != owner and np.round(res.score[index.row(o)], 4) > floor}
+            assert stored == want and len(stored) <= 6
+
+    with Session(engine) as s:
+        for uid in ids:
+            refresh_user_matches(s, uid)
+        check_lists(s)
+        # A re-ingest moves one user in and out of everyone else's lists
+        s.add(UserArtist(user_id=ids[3], term="medium", artist_id="tm_new", artist_name="TM", genres="", popularity=1, rank=9))
+        s.commit()
+        taste_index.update_taste_index(s, [ids[3]])
+        refresh_user_matches(s, ids[3])
+        check_lists(s)
+        assert s.get(UserMatchState, me).score_floor >= 0
+
+    # Pages start on the stored rows and continue live past them
+    full = client.get(f"/matches?user_id={me}&country=TM&limit=100").json()
+    assert len(full) == 24
+    got, cursor = [], None
+    while True:
+        r = client.get(f"/matches?user_id={me}&country=TM&limit=4" + (f"&cursor={cursor}" if cursor else ""))
+        got += r.json()
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert got == full
@@ -32,3 +32,24 @@ def test_matches_endpoint_scores_other_users(client):
     assert data[0]["user_id"] != me_id
     assert data[0]["score"] > 0
 
+
+
+def test_matches_approx_mode(client):
+    from app.db import engine
+    from app.models.user import User
+    from app.models.music import UserArtist
+
+    with Session(engine) as s:
+        u1 = User(spotify_id="ann1", display_name="Ann One")
+        u2 = User(spotify_id="ann2", display_name="Ann Two")
+        s.add(u1); s.add(u2); s.commit()
+        s.add(UserArtist(user_id=u1.id, term="medium", artist_id="ann_a", artist_name="AA", genres="ambient", popularity=1, rank=1))
+        s.add(UserArtist(user_id=u2.id, term="medium", artist_id="ann_a", artist_name="AA", genres="ambient", popularity=1, rank=1))
+        s.commit()
+        me_id, other_id = u1.id, u2.id
+
+    exact = client.get(f"/matches?user_id={me_id}&mode=exact").json()
+    approx = client.get(f"/matches?user_id={me_id}&mode=approx").json()
+    assert approx and approx[0] == exact[0]
+    assert approx[0]["user_id"] == other_id
+    assert client.get(f"/matches?user_id={me_id}&mode=fuzzy").status_code == 422
@@ -5,6 +5,7 @@ def test_matches_filters_and_pagination(client):
     from app.db import engine
     from app.models.user import User
     from app.models.music import UserArtist, UserAudioProfile
+    from app.services.genres import backfill_user_genres
 
     with Session(engine) as s:
         me = User(spotify_id="f_me", display_name="Filter Me", country="US")
@@ -21,6 +22,7 @@ def test_matches_filters_and_pagination(client):
         s.add(UserAudioProfile(user_id=u1_id, tempo=121, energy=0.5, valence=0.5, danceability=0.5, acousticness=0.5, loudness=-10))
         s.add(UserAudioProfile(user_id=u2_id, tempo=180, energy=0.1, valence=0.2, danceability=0.2, acousticness=0.9, loudness=-30))
         s.commit()
+        backfill_user_genres(s)
 
     # Filter by country
     r = client.get(f"/matches?user_id={me_id}&country=US")
@@ -46,3 +48,28 @@ def test_matches_filters_and_pagination(client):
     if r0 and r1:
         assert r0[0]["user_id"] != r1[0]["user_id"]
 
+
+
+def test_candidate_query_applies_filters_in_sql(client):
+    from app.db import engine
+    from app.models.user import User, UserSettings
+    from app.models.music import UserArtist
+    from app.services.match_table import eligible_candidates
+    from app.services.genres import backfill_user_genres
+
+    with Session(engine) as s:
+        me = User(spotify_id="sql_me", display_name="SQL Me", country="SE")
+        both = User(spotify_id="sql1", display_name="Two shared", country="se")
+        one = User(spotify_id="sql2", display_name="One shared", country="SE")
+        private = User(spotify_id="sql3", display_name="Private", country="SE")
+        s.add(me); s.add(both); s.add(one); s.add(private); s.commit()
+        s.add(UserSettings(user_id=private.id, is_public=False))
+        for u, artists in ((me, ["q1", "q2"]), (both, ["q1", "q2"]), (one, ["q1"]), (private, ["q1", "q2"])):
+            for rank, a in enumerate(artists, start=1):
+                s.add(UserArtist(user_id=u.id, term="medium", artist_id=a, artist_name=a, genres="polka" if u is one else "", popularity=1, rank=rank))
+        s.commit()
+        backfill_user_genres(s)
+
+        assert eligible_candidates(s, me.id, country="SE") == [both.id, one.id]
+        assert eligible_candidates(s, me.id, country="SE", min_shared_artists=2) == [both.id]
+        assert eligible_candidates(s, me.id, country="SE", required_genres={"polka"}) == [one.id]
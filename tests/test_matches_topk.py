@@ -0,0 +1,84 @@
+import random
+
+from sqlmodel import Session
+
+
+def test_topk_pages_match_full_ranking(client):
+    from app.db import engine
+    from app.models.user import User
+    from app.models.music import UserArtist, UserAudioProfile
+    from app.services.scoring import score
+    from app.services.taste import load_packs
+
+    rng = random.Random(3)
+    with Session(engine) as s:
+        users = [User(spotify_id=f"topk{i}", display_name=f"TopK {i}", country="ZZ") for i in range(40)]
+        for u in users:
+            s.add(u)
+        s.commit()
+        ids = [u.id for u in users]
+        for uid in ids:
+            for rank, aid in enumerate(rng.sample(range(15), rng.randint(0, 6)), start=1):
+                genres = ",".join(rng.sample(["techno", "house", "jazz", "dub"], rng.randint(0, 2)))
+                s.add(UserArtist(user_id=uid, term="medium", artist_id=f"tk{aid}", artist_name=f"TK{aid}", genres=genres, popularity=1, rank=rank))
+            if rng.random() > 0.2:
+                s.add(UserAudioProfile(user_id=uid, tempo=rng.uniform(80, 160), energy=rng.random(), valence=rng.random(),
+                                       danceability=rng.random(), acousticness=rng.random(), loudness=rng.uniform(-30, 0)))
+        s.commit()
+        packs = load_packs(s, ids)
+
+    me = ids[0]
+    expected = sorted(
+        ({"user_id": uid, "score": round(score(packs[me], packs[uid]), 4)} for uid in ids[1:]),
+        key=lambda x: x["score"], reverse=True,
+    )
+
+    got = []
+    for cursor in range(0, 39, 7):
+        page = client.get(f"/matches?user_id={me}&country=ZZ&limit=7&cursor={cursor}").json()
+        got += [{"user_id": m["user_id"], "score": m["score"]} for m in page]
+    assert got == expected
+
+    top = client.get(f"/matches?user_id={me}&country=ZZ&limit=5&min_score=0.3").json()
+    assert [m["user_id"] for m in top] == [m["user_id"] for m in expected if m["score"] >= 0.3][:5]
+
+
+def test_keyset_cursor_pages_are_stable_and_complete(client, monkeypatch):
+    from app.db import engine
+    from app.models.user import User
+    from app.models.music import UserArtist
+    from app.services import match_pages
+
+    rng = random.Random(5)
+    with Session(engine) as s:
+        users = [User(spotify_id=f"ks{i}", display_name=f"KS {i}", country="KS") for i in range(30)]
+        for u in users:
+            s.add(u)
+        s.commit()
+        ids = [u.id for u in users]
+        for uid in ids:
+            for rank, aid in enumerate(rng.sample(range(8), rng.randint(0, 4)), start=1):
+                s.add(UserArtist(user_id=uid, term="medium", artist_id=f"ks{aid}", artist_name="KS", genres="", popularity=1, rank=rank))
+        s.commit()
+
+    me = ids[0]
+    full = client.get(f"/matches?user_id={me}&country=KS&limit=100").json()
+    assert len(full) == 29
+
+    # Small snapshots force re-ranking past the end of each one
+    monkeypatch.setattr("app.routes.matches.MATCH_SNAPSHOT_SIZE", 8)
+    match_pages.snapshots.clear()
+    got, cursor = [], None
+    while True:
+        r = client.get(f"/matches?user_id={me}&country=KS&limit=5" + (f"&cursor={cursor}" if cursor else ""))
+        got += r.json()
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert [m["user_id"] for m in got] == [m["user_id"] for m in full]
+    assert client.get(f"/matches?user_id={me}&cursor=not-a-cursor").status_code == 400
+
+
+def test_next_cursor_header_is_exposed_to_cors_frontends(client):
+    r = client.get("/matches?user_id=1", headers={"Origin": "http://localhost:3000"})
+    assert "x-next-cursor" in r.headers["access-control-expose-headers"].lower()
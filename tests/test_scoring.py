@@ -15,3 +15,13 @@ def test_score_basic_overlap():
 
     s = score(u1, u2)
     assert 0 < s <= 1
+
+
+def test_fingerprint_packs_score_like_string_packs():
+    from app.services.intern import fingerprint_pack
+
+    u1 = {"artists": ["a1", "a2", "a3", "a3"], "genres": ["techno", "house"], "audio": [120.0, 0.8, 0.6, 0.7, 0.1, -6.0]}
+    u2 = {"artists": ["a2", "a3", "a4"], "genres": ["house", "trance"], "audio": [122.0, 0.78, 0.62, 0.69, 0.12, -6.5]}
+    empty = {"artists": [], "genres": [], "audio": [0.0] * 6}
+    for a, b in ((u1, u2), (u1, empty), (empty, empty)):
+        assert score(fingerprint_pack(a), fingerprint_pack(b)) == score(a, b)
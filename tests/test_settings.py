@@ -4,7 +4,7 @@ from sqlmodel import Session
 def test_settings_and_blocklist_affect_matches(client):
     from app.db import engine
     from app.models.user import User
-    from app.routes.settings import _parse_blocked
+    from app.services.blocks import parse_blocked_csv as _parse_blocked
 
     # Seed two users
     with Session(engine) as s:
@@ -38,3 +38,52 @@ def test_settings_and_blocklist_affect_matches(client):
     r = client.get(f"/matches?user_id={me_id}")
     assert all(m["user_id"] != other_id for m in r.json())
 
+
+
+def test_legacy_csv_blocks_are_migrated(client):
+    from app.db import engine
+    from app.models.user import User, UserSettings, UserBlock
+    from app.migrations import run_migrations
+
+    with Session(engine) as s:
+        a = User(spotify_id="csv_a", display_name="CSV A")
+        b = User(spotify_id="csv_b", display_name="CSV B")
+        s.add(a); s.add(b); s.commit()
+        a_id, b_id = a.id, b.id
+        s.add(UserSettings(user_id=a_id, blocked_user_ids=f"{b_id}, junk, {b_id + 1000}"))
+        s.commit()
+
+    run_migrations(engine)
+
+    with Session(engine) as s:
+        assert s.get(UserBlock, (a_id, b_id)) is not None
+        assert s.get(UserBlock, (a_id, b_id + 1000)) is None  # no such user
+        assert s.get(UserSettings, a_id).blocked_user_ids is None
+    assert client.get(f"/users/blocked?user_id={a_id}").json() == [b_id]
+    assert client.get(f"/settings?user_id={a_id}").json()["blocked_user_ids"] == str(b_id)
+    r = client.post(f"/connections/request?from_user_id={b_id}&to_user_id={a_id}")
+    assert r.status_code == 403
+
+
+def test_cached_match_pages_follow_blocks_and_privacy(client):
+    from app.db import engine
+    from app.models.user import User
+
+    with Session(engine) as s:
+        a = User(spotify_id="snap_a", display_name="Snap A", country="SB")
+        b = User(spotify_id="snap_b", display_name="Snap B", country="SB")
+        s.add(a); s.add(b); s.commit()
+        a_id, b_id = a.id, b.id
+
+    def seen(uid):
+        return [m["user_id"] for m in client.get(f"/matches?user_id={uid}&country=SB").json()]
+
+    assert seen(a_id) == [b_id] and seen(b_id) == [a_id]
+    client.post(f"/users/{b_id}/block?user_id={a_id}")
+    assert seen(a_id) == [] and seen(b_id) == []
+    client.delete(f"/users/{b_id}/block?user_id={a_id}")
+    assert seen(a_id) == [b_id]
+    client.put(f"/settings?user_id={b_id}", json={"is_public": False})
+    assert seen(a_id) == []
+    client.put(f"/settings?user_id={b_id}", json={"is_public": True})
+    assert seen(a_id) == [b_id]
@@ -0,0 +1,124 @@
+import httpx
+
+
+def _mock_spotify(seen):
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.path)
+        if request.url.path.endswith("/audio-features"):
+            ids = request.url.params["ids"].split(",")
+            return httpx.Response(200, json={"audio_features": [{"id": i} for i in ids]})
+        return httpx.Response(200, json={"items": [{"id": "x"}]})
+    return httpx.MockTransport(handler)
+
+
+async def test_calls_share_one_pooled_client():
+    from app.services import spotify
+
+    seen = []
+    client = spotify.init_client(transport=_mock_spotify(seen))
+    try:
+        assert spotify.get_client() is client
+        assert await spotify.get_top("tok", "artists", "short") == [{"id": "x"}]
+        assert len(await spotify.get_audio_features("tok", ["a", "b"])) == 2
+        assert await spotify.get_recently_played("tok") == [{"id": "x"}]
+        assert spotify.get_client() is client
+        assert seen == ["/v1/me/top/artists", "/v1/audio-features", "/v1/me/player/recently-played"]
+    finally:
+        await spotify.close_client()
+    assert client.is_closed
+
+
+def test_lifespan_opens_and_closes_client(test_env):
+    from starlette.testclient import TestClient
+    from app.main import app
+    from app.services import spotify
+
+    with TestClient(app):
+        shared = spotify.get_client()
+        assert not shared.is_closed
+    assert shared.is_closed
+
+
+async def test_expired_token_refreshes_once_for_concurrent_callers(test_env):
+    import asyncio
+    from datetime import datetime, timedelta, UTC
+    from sqlmodel import Session
+    from app.db import engine, init_db
+    from app.models.user import User, SpotifyToken
+    from app.services import spotify
+
+    init_db()
+    with Session(engine) as s:
+        u = User(spotify_id="tok1")
+        s.add(u); s.commit()
+        uid = u.id
+        s.add(SpotifyToken(user_id=uid, access_token="old", refresh_token="r", expires_at=datetime.now(UTC) - timedelta(seconds=1)))
+        s.commit()
+
+    posts = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        posts.append(request.url)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"access_token": "fresh", "expires_in": 3600})
+
+    spotify.init_client(transport=httpx.MockTransport(handler))
+    spotify.clear_token_cache()
+    try:
+        with Session(engine) as s:
+            tokens = await asyncio.gather(*[spotify.ensure_token(uid, s) for _ in range(5)])
+        assert tokens == ["fresh"] * 5
+        assert len(posts) == 1
+        # Served from the in-process cache afterwards
+        assert await spotify.ensure_token(uid, None) == "fresh"
+        assert len(posts) == 1
+    finally:
+        await spotify.close_client()
+        spotify.clear_token_cache()
+
+
+async def test_429_and_5xx_are_retried_and_counted(monkeypatch):
+    from app.services import spotify
+
+    monkeypatch.setattr(spotify.limiter, "backoff_base", 0.001)
+    replies = [
+        httpx.Response(429, headers={"Retry-After": "0"}),
+        httpx.Response(503),
+        httpx.Response(200, json={"items": [{"id": "ok"}]}),
+    ]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return replies.pop(0)
+
+    before = spotify.limiter.snapshot()
+    spotify.init_client(transport=httpx.MockTransport(handler))
+    try:
+        assert await spotify.get_top("tok", "artists", "short") == [{"id": "ok"}]
+    finally:
+        await spotify.close_client()
+    after = spotify.limiter.snapshot()
+    assert after["throttled_429"] - before["throttled_429"] == 1
+    assert after["server_errors"] - before["server_errors"] == 1
+    assert after["retries"] - before["retries"] == 2
+
+
+def test_token_bucket_queues_instead_of_failing():
+    from app.services.ratelimit import TokenBucket
+
+    bucket = TokenBucket(rate=10, capacity=2)
+    waits = [bucket.reserve() for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert 0.05 < waits[2] < waits[3] <= 0.2
+
+
+async def test_audio_features_are_chunked_at_api_limit():
+    from app.services import spotify
+
+    seen = []
+    spotify.init_client(transport=_mock_spotify(seen))
+    try:
+        feats = await spotify.get_audio_features("tok", [f"t{i}" for i in range(250)])
+    finally:
+        await spotify.close_client()
+    assert len(feats) == 250
+    assert seen == ["/v1/audio-features"] * 3
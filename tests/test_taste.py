@@ -0,0 +1,128 @@
+from sqlmodel import Session, select
+
+
+def test_load_packs_bulk_matches_per_user_shape(client):
+    from app.db import engine
+    from app.models.user import User
+    from app.models.music import UserArtist, UserAudioProfile
+    from app.services.taste import load_packs
+    from app.services.genres import backfill_user_genres
+
+    with Session(engine) as s:
+        u1 = User(spotify_id="bulk1", display_name="Bulk One")
+        u2 = User(spotify_id="bulk2", display_name="Bulk Two")
+        s.add(u1); s.add(u2); s.commit()
+        u1_id, u2_id = u1.id, u2.id
+        s.add(UserArtist(user_id=u1_id, term="medium", artist_id="x2", artist_name="X2", genres="house", popularity=1, rank=2))
+        s.add(UserArtist(user_id=u1_id, term="medium", artist_id="x1", artist_name="X1", genres="techno,house", popularity=1, rank=1))
+        s.add(UserArtist(user_id=u1_id, term="short", artist_id="x9", artist_name="X9", genres="pop", popularity=1, rank=1))
+        s.add(UserAudioProfile(user_id=u1_id, tempo=120, energy=0.8, valence=0.6, danceability=0.7, acousticness=0.1, loudness=-6))
+        s.commit()
+        backfill_user_genres(s)  # direct inserts bypass ingest's genre tables
+
+        packs = load_packs(s, [u1_id, u2_id])
+
+    assert packs[u1_id]["artists"] == ["x1", "x2"]  # ordered by rank, medium term only
+    assert sorted(packs[u1_id]["genres"]) == ["house", "techno"]
+    assert packs[u1_id]["audio"] == [120, 0.8, 0.6, 0.7, 0.1, -6]
+    assert packs[u2_id] == {"artists": [], "genres": [], "audio": [0.0] * 6}
+
+
+def test_genre_backfill_builds_integer_mappings(client):
+    from app.db import engine
+    from app.models.user import User
+    from app.models.music import UserArtist, UserGenre, ArtistGenre, Genre
+    from app.migrations import run_migrations
+    from app.services.genres import backfill_user_genres
+
+    with Session(engine) as s:
+        u = User(spotify_id="gen1", display_name="Genre One")
+        s.add(u); s.commit()
+        uid = u.id
+        s.add(UserArtist(user_id=uid, term="medium", artist_id="g_a1", artist_name="A1", genres="dub,techno", popularity=1, rank=1))
+        s.add(UserArtist(user_id=uid, term="medium", artist_id="g_a2", artist_name="A2", genres="dub", popularity=1, rank=2))
+        s.commit()
+
+    run_migrations(engine)
+    run_migrations(engine)  # idempotent
+
+    with Session(engine) as s:
+        names = dict(s.exec(select(Genre.id, Genre.name)).all())
+        counts = {names[g.genre_id]: g.count for g in s.exec(select(UserGenre).where(UserGenre.user_id == uid))}
+        assert counts == {"dub": 2, "techno": 1}
+        a1 = {names[r.genre_id] for r in s.exec(select(ArtistGenre).where(ArtistGenre.artist_id == "g_a1"))}
+        assert a1 == {"dub", "techno"}
+
+        # Artists without genres leave nothing to derive and are not picked up again
+        bare = User(spotify_id="gen2", display_name="Genre Two")
+        s.add(bare); s.commit()
+        s.add(UserArtist(user_id=bare.id, term="medium", artist_id="g_a3", artist_name="A3", genres="", popularity=1, rank=1))
+        s.commit()
+        assert [backfill_user_genres(s, [bare.id]) for _ in range(3)] == [0, 0, 0]
+
+
+def test_taste_snapshots_are_cached_per_data_version(client):
+    import pytest
+    from app.db import engine
+    from app.models.user import User
+    from app.models.music import UserArtist
+    from app.services import taste_snapshot
+    from app.services.versions import sync_state, bump_data_version
+    from app.services.genres import backfill_user_genres
+
+    with Session(engine) as s:
+        u = User(spotify_id="snap1", display_name="Snap One")
+        s.add(u); s.commit()
+        uid = u.id
+        s.add(UserArtist(user_id=uid, term="medium", artist_id="sn1", artist_name="SN1", genres="dub", popularity=1, rank=1))
+        s.commit()
+        backfill_user_genres(s)
+
+        hits = taste_snapshot.cache.hits
+        snap = taste_snapshot.get_snapshots(s, [uid])[uid]
+        assert snap.artists == ("sn1",) and snap.genres == frozenset({"dub"})
+        with pytest.raises(AttributeError):
+            snap.artists = ()
+        assert taste_snapshot.get_snapshots(s, [uid])[uid] is snap
+        assert taste_snapshot.cache.hits == hits + 1
+
+        state = sync_state(s, uid)
+        bump_data_version(state)
+        s.add(state); s.commit()
+        fresh = taste_snapshot.get_snapshots(s, [uid])[uid]
+        assert fresh is not snap and fresh.data_version == snap.data_version + 1
+
+
+def test_taste_index_reloads_rows_ingested_elsewhere(client, monkeypatch):
+    from datetime import datetime, UTC
+    from app.db import engine
+    from app.models.user import User
+    from app.models.music import UserArtist
+    from app.services import taste_index
+    from app.services.versions import sync_state, bump_data_version
+    from app.services.genres import backfill_user_genres
+
+    with Session(engine) as s:
+        a = User(spotify_id="tv_a", display_name="TV A")
+        b = User(spotify_id="tv_b", display_name="TV B")
+        s.add(a); s.add(b); s.commit()
+        a_id, b_id = a.id, b.id
+        s.add(UserArtist(user_id=a_id, term="medium", artist_id="tv1", artist_name="TV1", genres="dub", popularity=1, rank=1))
+        s.commit()
+        backfill_user_genres(s)
+        index = taste_index.get_taste_index(s, [a_id, b_id])
+        assert index.score_rows(index.row(a_id)).shared_artists[index.row(b_id)] == 0
+
+    # Another process (API worker, python -m app.ingest) re-ingests b
+    def no_rebuild(session):
+        raise AssertionError("full rebuild")
+    monkeypatch.setattr(taste_index, "build_taste_index", no_rebuild)
+    with Session(engine) as s:
+        s.add(UserArtist(user_id=b_id, term="medium", artist_id="tv1", artist_name="TV1", genres="dub", popularity=1, rank=1))
+        state = sync_state(s, b_id)
+        state.last_ingested_at = datetime.now(UTC)
+        bump_data_version(state)
+        s.add(state); s.commit()
+        backfill_user_genres(s)
+        index = taste_index.get_taste_index(s, [a_id])
+        assert index.score_rows(index.row(a_id)).shared_artists[index.row(b_id)] == 1
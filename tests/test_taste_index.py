@@ -0,0 +1,229 @@
+import random
+
+from app.services.scoring import score, jaccard, audio_affinity
+from app.services.taste_index import TasteIndex
+
+
+def _random_pack(rng):
+    return {
+        "artists": rng.sample([f"a{i}" for i in range(40)], rng.randint(0, 12)),
+        "genres": rng.sample(["techno", "house", "jazz", "pop", "trance", "indie", "rock"], rng.randint(0, 4)),
+        "audio": [
+            rng.uniform(40, 220), rng.random(), rng.random(), rng.random(), rng.random(), rng.uniform(-70, 5),
+        ] if rng.random() > 0.1 else [0.0] * 6,
+    }
+
+
+def test_batched_scores_match_score_function():
+    rng = random.Random(7)
+    packs = {uid: _random_pack(rng) for uid in range(1, 301)}
+    index = TasteIndex.from_packs(packs)
+
+    for me in (1, 42, 300):
+        res = index.score_rows(index.row(me))
+        for i, uid in enumerate(index.user_ids.tolist()):
+            a, b = packs[me], packs[uid]
+            assert abs(res.score[i] - score(a, b)) < 1e-6
+            assert res.shared_artists[i] == len(set(a["artists"]) & set(b["artists"]))
+            assert abs(res.genre_overlap[i] - jaccard(a["genres"], b["genres"])) < 1e-6
+            assert abs(res.audio_affinity[i] - audio_affinity(a["audio"], b["audio"])) < 1e-6
+
+
+
+def test_top_k_matches_a_full_sort():
+    import numpy as np
+
+    rng = random.Random(3)
+    index = TasteIndex.from_packs({uid: _random_pack(rng) for uid in range(1, 400)})
+    for rows in (np.arange(1, len(index)), np.arange(1, len(index), 3)):
+        res = index.score_rows(0, rows)
+        # (rounded score desc, user id asc), the /matches order
+        full = sorted(
+            ((float(np.round(sc, 4)), int(index.user_ids[r]), p) for p, (sc, r) in enumerate(zip(res.score, rows))),
+            key=lambda e: (-e[0], e[1]),
+        )
+        cases = (
+            (10, None, None, full),
+            (40, 0.3, None, [e for e in full if res.score[e[2]] >= 0.3]),
+            (10, None, full[20][:2], full[21:]),
+        )
+        for k, min_score, after, want in cases:
+            got = index.top_k(0, rows, k, min_score, after)
+            assert [(sc, -neg_uid, p) for sc, neg_uid, p, _ in got] == want[:k]
+
+
+def test_rows_for_unknown_users():
+    index = TasteIndex.from_packs({5: {"artists": [], "genres": [], "audio": [0.0] * 6}})
+    assert index.rows_for([5, 6]).tolist() == [0, -1]
+    assert not index.covers([6])
+
+
+
+def test_with_packs_matches_a_fresh_build():
+    rng = random.Random(11)
+    packs = {uid: _random_pack(rng) for uid in range(2, 200, 2)}
+    index = TasteIndex.from_packs(packs)
+    # Replace some users, insert new ones between and after the existing ids
+    changed = {uid: _random_pack(rng) for uid in (2, 50, 51, 198, 201)}
+    updated = index.with_packs(changed)
+    fresh = TasteIndex.from_packs({**packs, **changed})
+
+    assert updated.user_ids.tolist() == fresh.user_ids.tolist()
+    for a, b in ((updated.artists, fresh.artists), (updated.genres, fresh.genres)):
+        assert a.indptr.tolist() == b.indptr.tolist()
+        assert a.indices.tolist() == b.indices.tolist()
+    assert (updated.audio == fresh.audio).all()
+    # The original index is left untouched for readers still holding it
+    assert len(index) == len(packs)
+    assert index.row(51) == -1
+
+
+def test_ann_candidates_recall_on_clustered_users():
+    import numpy as np
+    from app.services.ann import AnnIndex, recall_at_k
+
+    rng = random.Random(11)
+    packs = {}
+    for uid in range(600):
+        c = uid % 6
+        packs[uid] = {
+            "artists": rng.sample([f"c{c}a{i}" for i in range(30)], 10),
+            "genres": rng.sample([f"c{c}g{i}" for i in range(5)], 2),
+            "audio": [100 + 10 * c, rng.random(), 0.5, 0.5, 0.5, -8.0],
+        }
+    index = TasteIndex.from_packs(packs)
+    ann = AnnIndex(index)
+    cand = ann.candidates(index, 0, n=50)
+    assert 0 < len(cand) <= 50 and 0 not in cand.tolist()
+    assert recall_at_k(index, ann, 10, np.arange(0, 600, 50), n=100) > 0.8
+
+
+
+def test_ann_index_serves_newer_taste_indexes_until_rebuilt(monkeypatch):
+    import time
+    from app import config
+    from app.services import ann as ann_module
+
+    rng = random.Random(12)
+    packs = {uid: _random_pack(rng) for uid in range(0, 300, 2)}
+    index = TasteIndex.from_packs(packs)
+    monkeypatch.setattr(config, "ANN_REBUILD_INTERVAL", 3600)
+    first = ann_module.get_ann_index(index)
+
+    # An ingest replaces one user and adds another: no synchronous rebuild
+    newer = index.with_packs({10: packs[20], 301: packs[20]})
+    assert ann_module.get_ann_index(newer) is first
+    cand = first.candidates(newer, newer.row(10))
+    assert len(cand) and (cand >= 0).all() and newer.row(10) not in cand.tolist()
+    # The fresh query row finds user 20, whose sets it now copies
+    assert newer.row(20) in cand.tolist()
+    assert newer.row(301) not in cand.tolist()  # added after the build
+
+    # Past the interval the next generation is built in the background
+    monkeypatch.setattr(config, "ANN_REBUILD_INTERVAL", 0)
+    assert ann_module.get_ann_index(newer) is first
+    for _ in range(200):
+        if ann_module.get_ann_index(newer).index is newer:
+            break
+        time.sleep(0.01)
+    assert newer.row(301) in ann_module.get_ann_index(newer).candidates(newer, newer.row(10)).tolist()
+
+def test_sharded_scorer_matches_in_process_top_k():
+    import numpy as np
+    from app.services.parallel_scoring import ShardedScorer, synthetic_index, shutdown
+
+    index = synthetic_index(3000, artists=500, genres=50)
+    rows = np.arange(1, len(index), dtype=np.int64)
+    scorer = ShardedScorer(index, 2)
+    try:
+        for k, min_score, after in ((15, None, None), (10, 0.3, None), (10, None, (0.45, 100))):
+            assert scorer.top_k(0, rows, k, min_score, after) == index.top_k(0, rows, k, min_score, after)
+    finally:
+        scorer.close()
+        shutdown()
+
+
+def test_replaced_scorer_keeps_answering_in_flight_requests(monkeypatch):
+    import numpy as np
+    from app import config
+    from app.services.parallel_scoring import ShardedScorer, scorer_for, synthetic_index, shutdown
+
+    monkeypatch.setattr(config, "SCORING_WORKERS", 2)
+    monkeypatch.setattr(config, "SCORING_PARALLEL_MIN", 0)
+    monkeypatch.setattr(config, "SCORING_REPUBLISH_INTERVAL", 0)
+    old, new = synthetic_index(2000, artists=400, seed=1), synthetic_index(2000, artists=400, seed=2)
+    rows = np.arange(1, 2000, dtype=np.int64)
+    try:
+        first = scorer_for(old, len(rows))
+        assert scorer_for(new, len(rows)) is not first
+        # A request that picked up the old scorer before the swap still gets its answer
+        assert first.top_k(0, rows, 10) == old.top_k(0, rows, 10)
+
+        # Workers that cannot attach (blocks already freed) fall back in-process
+        scorer = ShardedScorer(old, 2)
+        scorer.shared.close()
+        assert scorer.top_k(0, rows, 10) == old.top_k(0, rows, 10)
+    finally:
+        shutdown()
+
+
+def test_scorer_is_republished_only_when_users_change_or_it_ages(monkeypatch):
+    from app import config
+    from app.services.parallel_scoring import scorer_for, shutdown
+
+    monkeypatch.setattr(config, "SCORING_WORKERS", 2)
+    monkeypatch.setattr(config, "SCORING_PARALLEL_MIN", 0)
+    monkeypatch.setattr(config, "SCORING_REPUBLISH_INTERVAL", 3600)
+    rng = random.Random(13)
+    packs = {uid: _random_pack(rng) for uid in range(0, 300, 2)}
+    index = TasteIndex.from_packs(packs)
+    try:
+        first = scorer_for(index, len(index))
+        # A re-ingest of an existing user keeps the published copy
+        replaced = index.with_packs({10: packs[20]})
+        assert scorer_for(replaced, len(replaced)) is first
+        # A new user shifts row positions, so a new copy is published
+        grown = replaced.with_packs({301: packs[20]})
+        second = scorer_for(grown, len(grown))
+        assert second is not first and second.index is grown
+        # So does an unchanged membership once the interval has passed
+        monkeypatch.setattr(config, "SCORING_REPUBLISH_INTERVAL", 0)
+        assert scorer_for(grown.with_packs({12: packs[20]}), len(grown)) is not second
+    finally:
+        shutdown()
+
+
+def test_index_file_round_trip_and_atomic_swap(tmp_path):
+    import numpy as np
+    from app.services.index_file import write_index, read_index, mapped_index
+    from app.services.parallel_scoring import ShardedScorer, shutdown
+
+    rng = random.Random(13)
+    packs = {uid: _random_pack(rng) for uid in range(1, 201)}
+    index = TasteIndex.from_packs(packs)
+    path = str(tmp_path / "taste.idx")
+    write_index(index, path)
+
+    loaded = read_index(path)
+    assert not loaded.audio.flags.writeable  # a view over the mapping, not a copy
+    rows = np.arange(1, len(index), dtype=np.int64)
+    assert loaded.top_k(0, rows, 20) == index.top_k(0, rows, 20)
+    res, want = loaded.score_rows(5), index.score_rows(5)
+    assert np.allclose(res.score, want.score)
+
+    # Workers map the same file instead of copying into shared memory
+    scorer = ShardedScorer(loaded, 2)
+    try:
+        assert "file" in scorer.shared.spec
+        assert scorer.top_k(0, rows, 10) == index.top_k(0, rows, 10)
+    finally:
+        scorer.close()
+        shutdown()
+
+    first = mapped_index(path)
+    assert mapped_index(path) is first
+    packs[201] = _random_pack(rng)
+    write_index(TasteIndex.from_packs(packs), path)
+    second = mapped_index(path)
+    assert second is not first and second.covers([201])
+    assert first.top_k(0, rows, 5) == index.top_k(0, rows, 5)  # old generation stays readable